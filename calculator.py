@@ -13,16 +13,34 @@
   絶対値        : abs(-5)
   階乗          : fact 5  /  fact(5)
   定数          : pi, e
+  変数          : a = sqrt 6  →  b = a ^ 2 + 1  (a を変えると b も計算し直す)
+  変数の一覧    : vars  /  削除: del a
   終了          : exit / quit
+
+一括評価 (calculator_batch.py):
+  python calculator.py --batch formulas.txt -o results.csv
+  python calculator.py --batch formulas.txt --timeout 1 --memory 256   : 1 式ごとの時間とメモリを制限
+
+評価サーバ (calculator_server.py):
+  python calculator_server.py serve --port 8765   : HTTP / JSON で式を受け付ける
+
+整数のべき乗・階乗は結果が MAX_DIGITS 桁を超えると計算する前にエラーにする (9 ^ 9 ^ 9 など)。
++ - * の結果も MAX_DIGITS 桁までなので、通った結果はかならず表示できる。
+
+配列での一括評価 (NumPy が必要):
+  evaluate_many("sin x ^ 2 + log10 y", x=xs, y=ys)  →  要素ごとの結果の配列
 """
 
+import functools
 import math
+import operator
 import re
 import sys
+from typing import NamedTuple
 
 
 # ──────────────────────────────────────
-#  安全に eval するための許可リスト
+#  使える関数と定数
 # ──────────────────────────────────────
 SAFE_NAMES: dict = {
     # math 関数
@@ -46,101 +64,736 @@ SAFE_NAMES: dict = {
     "e":     math.e,
 }
 
-# 危険なキーワードをブロック
-BLOCKED_KEYWORDS = [
-    "import", "exec", "eval", "open", "os", "sys",
-    "subprocess", "__", "getattr", "setattr", "delattr",
-    "globals", "locals", "compile", "breakpoint",
-]
-
-
-def preprocess(expr: str) -> str:
-    """ユーザー入力を Python で評価可能な式に変換する。"""
-
-    # ── root(x, n) → (x) ** (1 / (n)) ──
-    expr = re.sub(
-        r"root\(\s*(.+?)\s*,\s*(.+?)\s*\)",
-        r"(\1) ** (1 / (\2))",
-        expr,
-    )
-
-    # ── fact / fact(n) → factorial(n) ──
-    # fact(n) の形式
-    expr = re.sub(
-        r"fact\(\s*(.+?)\s*\)",
-        r"factorial(\1)",
-        expr,
-    )
-    # fact n の形式 (括弧なし — 単一の数値のみ)
-    expr = re.sub(
-        r"fact\s+(\d+)",
-        r"factorial(\1)",
-        expr,
-    )
-
-    # ── ^ → ** (べき乗) ──
-    expr = expr.replace("^", "**")
-
-    # ── 関数名の直後にスペース+数値がある場合に括弧を補完 ──
-    #    例: sqrt 6 → sqrt(6),  log 4 → log(4),  sin 0.5 → sin(0.5)
-    func_names = (
-        "sqrt", "log2", "log10", "log", "ln",
-        "sin", "cos", "tan", "asin", "acos", "atan",
-        "abs", "ceil", "floor",
-    )
-    for fn in func_names:
-        # 関数名 + スペース + 数値(負の値含む) で、既に括弧がない場合
-        pattern = rf"\b{fn}\s+(-?[\d.]+)"
-        expr = re.sub(pattern, rf"{fn}(\1)", expr)
-
-    return expr
+
+def root(x, n):
+    """x の n 乗根"""
+    return x ** (1 / n)
+
+
+# ──────────────────────────────────────
+#  計算量の見積もり
+# ──────────────────────────────────────
+# 整数のべき乗と階乗は結果の桁数だけ時間とメモリを使う (9 ^ 9 ^ 9 は 3 億桁)。
+# 計算する前に結果の桁数を見積もり、MAX_DIGITS を超えるものは CostError (OverflowError) にする。
+# + - * は計算してから桁数を確かめる (被演算子が MAX_DIGITS 桁以内なら結果も小さい)。
+# 浮動小数点数はどのみち 1e308 で OverflowError になるので見積もらない。
+MAX_DIGITS = 4300           # 整数の結果として許す桁数 (str() で表示できる既定の上限と同じ)
+MAX_DEPTH = 100             # 括弧・関数・符号の入れ子の深さ
+
+
+_INT_LIMIT = 10 ** MAX_DIGITS
+
+
+class CostError(OverflowError):
+    """見積もった結果の桁数が MAX_DIGITS を超える (計算する前に止めた)"""
+
+
+def _too_large(what: str, digits: float):
+    raise CostError(f"エラー: 計算量が大きすぎます ({what}: 約 {digits:.3g} 桁)")
+
+
+def _digits(log10_value: float) -> float:
+    """log10(|値|) → 10 進の桁数。浮動小数点の誤差で少なく数えないよう少しだけ多めに。"""
+    return math.floor(log10_value * (1 + 1e-12) + 1e-9) + 1
+
+
+def power_digits(base, exponent) -> float:
+    """base ^ exponent (整数どうし) の桁数。整数でなければ 0。"""
+    if (isinstance(base, int) and isinstance(exponent, int)
+            and exponent > 1 and abs(base) > 1):
+        return _digits(exponent * math.log10(abs(base)))
+    return 0.0
+
+
+def factorial_digits(n) -> float:
+    """n! の桁数。整数でなければ 0。"""
+    if isinstance(n, int) and n > 1:
+        return _digits(math.lgamma(n + 1) / math.log(10))
+    return 0.0
+
+
+def power(base, exponent):
+    """桁数を確かめてから計算するべき乗"""
+    digits = power_digits(base, exponent)
+    if digits > MAX_DIGITS:
+        _too_large("べき乗の結果", digits)
+    return base ** exponent
+
+
+def factorial(n):
+    """桁数を確かめてから計算する階乗"""
+    digits = factorial_digits(n)
+    if digits > MAX_DIGITS:
+        _too_large(f"{n}!", digits)
+    return math.factorial(n)
+
+
+def _bounded(op, symbol: str):
+    """整数の結果が MAX_DIGITS 桁を超えたらエラーにする二項演算 (+ - *)。
+    被演算子はどちらも MAX_DIGITS 桁以内なので、計算そのものは軽い。"""
+    def apply(a, b):
+        value = op(a, b)
+        if type(value) is int and not -_INT_LIMIT < value < _INT_LIMIT:
+            _too_large(f"{symbol} の結果", _digits(math.log10(abs(value))))
+        return value
+    return apply
+
+
+# 関数として呼べる名前 (SAFE_NAMES の関数 + 電卓独自の書き方)
+FUNCTIONS: dict = {name: f for name, f in SAFE_NAMES.items() if callable(f)}
+FUNCTIONS["factorial"] = factorial
+FUNCTIONS["fact"] = factorial
+FUNCTIONS["root"] = root
+CONSTANTS: dict = {name: v for name, v in SAFE_NAMES.items() if not callable(v)}
+
+# 二項演算子: 記号 → 関数 (^ と ** はどちらもべき乗)
+BINARY_OPS = {
+    "+": _bounded(operator.add, "+"),
+    "-": _bounded(operator.sub, "-"),
+    "*": _bounded(operator.mul, "*"),
+    "/": operator.truediv,
+    "//": operator.floordiv,
+    "%": operator.mod,
+    "^": power,
+}
+
+CACHE_SIZE = 4096       # 式ごとの結果・コンパイル結果を覚えておく数
+
+
+# ──────────────────────────────────────
+#  字句解析
+# ──────────────────────────────────────
+# 数値 | 演算子・括弧 | 名前 | それ以外 (エラー)。空白は読み飛ばす
+_TOKEN_RE = re.compile(r"""
+    \s*(?:
+        (?P<num>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+      | (?P<op>\*\*|//|[-+*/%^(),])
+      | (?P<name>[A-Za-z_][A-Za-z_0-9]*)
+      | (?P<bad>\S)
+    )""", re.VERBOSE)
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def normalize(expr: str) -> str:
+    """式をトークンに分け、1 つの空白で区切った正規形にする (** は ^ にそろえる)。
+    キャッシュのキーと構文解析の入力に使う。"""
+    tokens = []
+    for m in _TOKEN_RE.finditer(expr):
+        kind = m.lastgroup
+        if kind is None:
+            continue                    # 末尾の空白
+        text = m.group(kind)
+        if kind == "bad":
+            raise SyntaxError(f"構文エラー: 使えない文字 '{text}' があります → {expr}")
+        tokens.append("^" if text == "**" else text)
+    return " ".join(tokens)
+
+
+# ──────────────────────────────────────
+#  構文木
+# ──────────────────────────────────────
+class Num(NamedTuple):
+    value: int | float
+
+
+class Name(NamedTuple):
+    id: str                     # 定数 (pi, e) か変数
+
+
+class Unary(NamedTuple):
+    op: str                     # "+" / "-"
+    operand: "Node"
+
+
+class BinOp(NamedTuple):
+    op: str                     # BINARY_OPS のキー
+    left: "Node"
+    right: "Node"
+
+
+class Call(NamedTuple):
+    func: str                   # FUNCTIONS のキー
+    args: tuple["Node", ...]
+
+
+Node = Num | Name | Unary | BinOp | Call
+
+
+class _Parser:
+    """正規形のトークン列から構文木を作る再帰下降パーサ。
+
+    式     := 項 (("+" | "-") 項)*
+    項     := 単項 (("*" | "/" | "//" | "%") 単項)*
+    単項   := ("-" | "+") 単項 | べき
+    べき   := 適用 ("^" 単項)?            右結合、指数には符号を付けられる
+    適用   := 関数名 "(" 式 ("," 式)* ")" | 関数名 引数 | 基本
+    引数   := ("-" | "+") 引数 | 適用      sqrt 6 ^ 2 = (sqrt 6) ^ 2
+    基本   := 数値 | 名前 | "(" 式 ")"
+    """
+
+    def __init__(self, source: str):
+        self.source = source
+        self.tokens = source.split(" ") if source else []
+        self.pos = 0
+        self.depth = 0
+
+    def error(self, detail: str):
+        raise SyntaxError(f"構文エラー: {detail} → {self.source}")
+
+    def peek(self) -> str | None:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def take(self) -> str:
+        token = self.peek()
+        if token is None:
+            self.error("式が途中で終わっています")
+        self.pos += 1
+        return token
+
+    def expect(self, token: str):
+        if self.peek() != token:
+            self.error(f"'{token}' が必要です")
+        self.pos += 1
+
+    def parse(self) -> Node:
+        if not self.tokens:
+            self.error("式が空です")
+        node = self.expr()
+        if self.peek() is not None:
+            self.error(f"'{self.peek()}' の前に演算子が必要です")
+        return node
+
+    def expr(self) -> Node:
+        node = self.term()
+        while self.peek() in ("+", "-"):
+            op = self.take()
+            node = BinOp(op, node, self.term())
+        return node
+
+    def term(self) -> Node:
+        node = self.unary()
+        while self.peek() in ("*", "/", "//", "%"):
+            op = self.take()
+            node = BinOp(op, node, self.unary())
+        return node
+
+    def nested(self, parse) -> Node:
+        """入れ子の深さを数えながら parse を呼ぶ (深すぎる式で再帰が尽きないように)"""
+        if self.depth >= MAX_DEPTH:
+            self.error(f"入れ子が深すぎます (最大 {MAX_DEPTH})")
+        self.depth += 1
+        node = parse()
+        self.depth -= 1
+        return node
+
+    def unary(self) -> Node:
+        if self.peek() in ("-", "+"):
+            op = self.take()
+            return Unary(op, self.nested(self.unary))
+        return self.nested(self.power)
+
+    def power(self) -> Node:
+        node = self.apply()
+        if self.peek() == "^":
+            self.take()
+            node = BinOp("^", node, self.unary())
+        return node
+
+    def argument(self) -> Node:
+        if self.peek() in ("-", "+"):
+            op = self.take()
+            return Unary(op, self.nested(self.argument))
+        return self.nested(self.apply)
+
+    def apply(self) -> Node:
+        token = self.peek()
+        if token not in FUNCTIONS:
+            return self.primary()
+        self.take()
+        if self.peek() == "(":
+            self.take()
+            args = [self.expr()]
+            while self.peek() == ",":
+                self.take()
+                args.append(self.expr())
+            self.expect(")")
+            if token == "root" and len(args) != 2:
+                self.error("root は root(x, n) の形で書いてください")
+            return Call(token, tuple(args))
+        if self.peek() in (None, "*", "/", "//", "%", "^", ")", ","):
+            self.error(f"{token} の引数がありません")
+        return Call(token, (self.argument(),))
+
+    def primary(self) -> Node:
+        token = self.take()
+        if token == "(":
+            node = self.expr()
+            self.expect(")")
+            return node
+        first = token[0]
+        if first.isdigit() or first == ".":
+            return Num(float(token) if any(c in token for c in ".eE") else int(token))
+        if first.isalpha() or first == "_":
+            if self.peek() == "(":
+                self.error(f"{token} は関数ではありません")
+            return Name(token)
+        self.error(f"'{token}' の位置に値が必要です")
+
+
+def parse(expr: str) -> Node:
+    """式を構文木 (Num / Name / Unary / BinOp / Call) にする。
+    関数は FUNCTIONS、演算子は BINARY_OPS にあるものしか作られない。"""
+    return _Parser(normalize(expr)).parse()
+
+
+def free_names(node: Node) -> set[str]:
+    """構文木の中の、定数ではない名前 (変数)"""
+    if isinstance(node, Name):
+        return set() if node.id in CONSTANTS else {node.id}
+    if isinstance(node, Num):
+        return set()
+    if isinstance(node, Call):
+        return set().union(*map(free_names, node.args))
+    if isinstance(node, Unary):
+        return free_names(node.operand)
+    return free_names(node.left) | free_names(node.right)
+
+
+# ──────────────────────────────────────
+#  コンパイル
+# ──────────────────────────────────────
+def _compile_node(node: Node):
+    """構文木 → env (変数名 → 値) を受け取って値を返すクロージャ"""
+    if isinstance(node, Num):
+        value = node.value
+        return lambda env: value
+    if isinstance(node, Name):
+        name = node.id
+        if name in CONSTANTS:
+            value = CONSTANTS[name]
+            return lambda env: value
+        return lambda env: env[name]
+    if isinstance(node, Unary):
+        operand = _compile_node(node.operand)
+        if node.op == "-":
+            return lambda env: -operand(env)
+        return lambda env: +operand(env)
+    if isinstance(node, BinOp):
+        op = BINARY_OPS[node.op]
+        left = _compile_node(node.left)
+        right = _compile_node(node.right)
+        return lambda env: op(left(env), right(env))
+    func = FUNCTIONS[node.func]
+    if len(node.args) == 1:
+        arg = _compile_node(node.args[0])
+        return lambda env: func(arg(env))
+    args = [_compile_node(a) for a in node.args]
+    return lambda env: func(*[a(env) for a in args])
+
+
+class Expression:
+    """構文解析・検証済みでクロージャにコンパイルした式。何度でも評価できる。"""
+    __slots__ = ("source", "node", "names", "_fn", "_vectorized")
+
+    def __init__(self, source: str):
+        self.source = normalize(source)
+        self.node = _Parser(self.source).parse()
+        self.names = frozenset(free_names(self.node))
+        self._fn = _compile_node(self.node)
+        self._vectorized = None         # NumPy 版は evaluate_many で初めて使うときに作る
+
+    def __call__(self, env: dict | None = None, **variables) -> object:
+        """変数の値を env か キーワード引数で渡して評価する。"""
+        if variables:
+            env = {**env, **variables} if env else variables
+        if self.names:
+            missing = self.names.difference(env or ())
+            if missing:
+                raise NameError(f"未定義の名前です: {', '.join(sorted(missing))}")
+        try:
+            return self._fn(env)
+        except ZeroDivisionError:
+            raise ZeroDivisionError("エラー: ゼロ除算です") from None
+        except CostError:
+            raise
+        except OverflowError:           # 浮動小数点数の 1e308 超え
+            raise OverflowError("エラー: 数値が大きすぎます") from None
+
+    def vectorized(self):
+        """NumPy の ufunc で要素ごとに計算するクロージャ (env の値は配列)"""
+        if self._vectorized is None:
+            self._vectorized = _compile_numpy(self.node)
+        return self._vectorized
+
+    def __repr__(self) -> str:
+        return f"Expression({self.source!r})"
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def _compile_normalized(source: str) -> Expression:
+    return Expression(source)
+
+
+def compile_expr(expr: str) -> Expression:
+    """式をコンパイルする。同じ正規形の式は同じ Expression を返す。"""
+    return _compile_normalized(normalize(expr))
+
+
+def check_cost(node: Node) -> None:
+    """変数を含まない ^ と階乗の被演算子を求め、結果が MAX_DIGITS 桁を超えるなら
+    CostError にする。被演算子の計算も power / factorial で見積もり済み。"""
+    if isinstance(node, (Num, Name)):
+        return
+    children = (node.operand,) if isinstance(node, Unary) else (
+        node.args if isinstance(node, Call) else (node.left, node.right))
+    for child in children:
+        check_cost(child)
+    if isinstance(node, BinOp) and node.op == "^":
+        operands = (node.left, node.right)
+    elif isinstance(node, Call) and node.func in ("fact", "factorial"):
+        operands = node.args
+    else:
+        return
+    if any(free_names(operand) for operand in operands):
+        return
+    try:
+        values = [_compile_node(operand)(None) for operand in operands]
+    except CostError:
+        raise
+    except (ArithmeticError, ValueError, TypeError):
+        return          # ゼロ除算などは評価のときにそのまま報告する
+    if len(values) == 2:
+        digits, what = power_digits(*values), "べき乗の結果"
+    else:
+        digits, what = factorial_digits(values[0]), f"{values[0]}!"
+    if digits > MAX_DIGITS:
+        _too_large(what, digits)
 
 
 def validate(expr: str) -> None:
-    """危険な入力をブロックする。"""
-    lower = expr.lower()
-    for kw in BLOCKED_KEYWORDS:
-        # 単語境界でマッチ（cos が os にヒットしないようにする）
-        if re.search(rf"\b{kw}\b", lower):
-            raise ValueError(f"禁止キーワードが含まれています: {kw}")
+    """構文・名前・計算量を検査する。関数・演算子・定数以外を含む式や、
+    結果が大きくなりすぎるべき乗・階乗を含む式は例外になる。"""
+    expression = compile_expr(expr)
+    if expression.names:
+        raise NameError(f"未定義の名前です: {', '.join(sorted(expression.names))}")
+    check_cost(expression.node)
 
 
-def evaluate(expr: str) -> object:
-    """式を安全に評価して結果を返す。"""
-    processed = preprocess(expr)
-    validate(processed)
+# ──────────────────────────────────────
+#  配列での一括評価 (NumPy)
+# ──────────────────────────────────────
+@functools.cache
+def _numpy_tables() -> tuple[dict, dict]:
+    """(関数名 → ufunc 相当, 演算子 → ufunc)。NumPy はここで初めて読み込む。"""
+    import numpy as np
+
+    # 0! 〜 170! (float64 で表せる最大)。それより大きいと inf
+    factorials = np.concatenate(([1.0], np.cumprod(np.arange(1, 171, dtype=np.float64)), [np.inf]))
+
+    def factorial(x):
+        x = np.asarray(x, dtype=np.float64)
+        valid = (x >= 0) & (x == np.floor(x))     # 負の数・整数でない要素は nan
+        index = np.where(valid, np.minimum(np.where(valid, x, 0), 171), 0).astype(np.intp)
+        return np.where(valid, factorials[index], np.nan)
+
+    def log(x, base=None):
+        return np.log(x) if base is None else np.log(x) / np.log(base)
+
+    functions = {
+        "sin": np.sin, "cos": np.cos, "tan": np.tan,
+        "asin": np.arcsin, "acos": np.arccos, "atan": np.arctan,
+        "log": log, "ln": np.log, "log2": np.log2, "log10": np.log10,
+        "sqrt": np.sqrt, "abs": np.abs, "ceil": np.ceil, "floor": np.floor,
+        "factorial": factorial, "fact": factorial,
+        "root": lambda x, n: np.power(x, np.divide(1.0, n)),
+    }
+    ops = {
+        "+": np.add, "-": np.subtract, "*": np.multiply, "/": np.true_divide,
+        "//": np.floor_divide, "%": np.mod, "^": np.power,
+    }
+    return functions, ops
+
+
+def _compile_numpy(node: Node):
+    """_compile_node の NumPy 版。数値はすべて float64 で扱う。"""
+    import numpy as np
+    functions, ops = _numpy_tables()
+
+    def build(node: Node):
+        if isinstance(node, Num):
+            value = float(node.value)   # 整数のままだと 2 ^ -1 が整数のべき乗エラーになる
+            return lambda env: value
+        if isinstance(node, Name):
+            name = node.id
+            if name in CONSTANTS:
+                value = CONSTANTS[name]
+                return lambda env: value
+            return lambda env: env[name]
+        if isinstance(node, Unary):
+            operand = build(node.operand)
+            if node.op == "-":
+                return lambda env: np.negative(operand(env))
+            return operand
+        if isinstance(node, BinOp):
+            op = ops[node.op]
+            left = build(node.left)
+            right = build(node.right)
+            return lambda env: op(left(env), right(env))
+        func = functions[node.func]
+        args = [build(a) for a in node.args]
+        if len(args) == 1:
+            arg = args[0]
+            return lambda env: func(arg(env))
+        return lambda env: func(*[a(env) for a in args])
+
+    return build(node)
+
 
+def evaluate_many(expr: str, **arrays):
+    """式の変数に NumPy 配列 (またはスカラー) を渡し、要素ごとの結果を配列で一度に求める。
+
+    例: evaluate_many("sin x ^ 2 + log10 y", x=xs, y=ys)
+
+    配列は float64 にそろえてブロードキャストする。関数は対応する ufunc、
+    fact / factorial と root は要素ごとに計算する。NumPy の規則に従い、
+    ゼロ除算や定義域の外は例外ではなく inf / nan になる。"""
+    import numpy as np
+    expression = compile_expr(expr)
+    missing = expression.names.difference(arrays)
+    if missing:
+        raise NameError(f"未定義の名前です: {', '.join(sorted(missing))}")
+    env = {name: np.asarray(arrays[name], dtype=np.float64) for name in expression.names}
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        result = expression.vectorized()(env)
+    return np.asarray(result, dtype=np.float64)
+
+
+# ──────────────────────────────────────
+#  評価
+# ──────────────────────────────────────
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def _evaluate_normalized(source: str) -> tuple:
+    """正規形の式の (成功したか, 値 または (例外の型, 引数))。
+    失敗も覚えておき、同じ不正な式を何度も解析しない。"""
     try:
-        result = eval(processed, {"__builtins__": {}}, SAFE_NAMES)  # noqa: S307
-    except SyntaxError:
-        raise SyntaxError(f"構文エラー: 式を確認してください → {processed}")
-    except ZeroDivisionError:
-        raise ZeroDivisionError("エラー: ゼロ除算です")
+        return True, _compile_normalized(source)()
+    except (ArithmeticError, ValueError, TypeError, NameError, SyntaxError) as exc:
+        return False, (type(exc), exc.args)
+
 
-    return result
+def evaluate(expr: str) -> object:
+    """式を評価して結果を返す。空白などの違いだけの式は前回の結果をそのまま返す。"""
+    ok, value = _evaluate_normalized(normalize(expr))
+    if ok:
+        return value
+    exc_type, args = value
+    raise exc_type(*args)
 
 
 def format_result(value: object) -> str:
     """結果を見やすくフォーマットする。"""
     if isinstance(value, float):
-        # 整数と等しい場合は整数表示
-        if value == int(value) and abs(value) < 1e15:
+        # 整数と等しい場合は整数表示 (inf / nan はそのまま)
+        if math.isfinite(value) and value == int(value) and abs(value) < 1e15:
             return str(int(value))
         return f"{value:.10g}"
     return str(value)
 
 
+def error_message(exc: Exception) -> str:
+    """例外 → "エラー: ..." の 1 行 (電卓の例外は最初から "エラー: " 付き)"""
+    message = str(exc)
+    return message if message.startswith("エラー") else f"エラー: {message}"
+
+
+# ──────────────────────────────────────
+#  ワークシート (名前付きの式と依存関係)
+# ──────────────────────────────────────
+_ASSIGN_RE = re.compile(r"^\s*([A-Za-z_]\w*)\s*=(?!=)\s*(.*)$")
+
+
+def parse_assignment(line: str) -> tuple[str, str] | None:
+    """"a = sqrt 6" → ("a", "sqrt 6")。代入でなければ None。"""
+    match = _ASSIGN_RE.match(line)
+    return (match.group(1), match.group(2)) if match else None
+
+
+class Worksheet:
+    """名前 → 式 の表。式をコンパイル済みで持ち、依存関係のグラフをたどって
+    変わった名前より下流の式だけを計算し直す (表計算と同じ)。
+
+    計算し直した値が前と同じなら、そこから先へは伝えない。
+    まだ定義されていない名前を使う式も置いておけ、その名前が定義された時点で計算される。"""
+
+    def __init__(self):
+        self.formulas: dict[str, Expression] = {}
+        self.values: dict[str, object] = {}             # 名前 → 値
+        self.errors: dict[str, Exception] = {}          # 名前 → 計算できなかった理由
+        self.dependents: dict[str, set[str]] = {}       # 名前 → それを使っている名前
+        self.evaluations = 0                            # 式を計算した回数 (累計)
+
+    def assign(self, name: str, expr: str) -> list[str]:
+        """name に式を割り当てて計算する。値が変わった名前を計算した順に返す。"""
+        if name in FUNCTIONS or name in CONSTANTS:
+            raise NameError(f"{name} は関数・定数の名前なので使えません")
+        expression = compile_expr(expr)
+        cycle = self._cycle(expression.names, name)
+        if cycle is not None:
+            raise ValueError(f"循環参照です: {' → '.join([name, *cycle])}")
+        old = self.formulas.get(name)
+        if old is not None:
+            for dep in old.names:
+                self.dependents[dep].discard(name)
+        for dep in expression.names:
+            self.dependents.setdefault(dep, set()).add(name)
+        self.formulas[name] = expression
+        return self._recompute(name)
+
+    def remove(self, name: str) -> list[str]:
+        """name の式を消す。値が変わった (計算できなくなった) 名前を返す。"""
+        expression = self.formulas.pop(name)
+        for dep in expression.names:
+            self.dependents[dep].discard(name)
+        self.values.pop(name, None)
+        self.errors.pop(name, None)
+        return self._recompute(name, changed=True)
+
+    def evaluate(self, expr: str) -> object:
+        """ワークシートの名前を使って式を評価する (結果はどこにも保存しない)。"""
+        expression = compile_expr(expr)
+        return expression(self._env(expression))
+
+    def _env(self, expression: Expression) -> dict:
+        for dep in sorted(expression.names):
+            if dep in self.errors:
+                raise ValueError(f"{dep} が計算できていません ({self.errors[dep]})")
+        return self.values
+
+    def _cycle(self, names, name: str) -> list[str] | None:
+        """name の下流 (name を使っている式) に names のどれかがあれば、
+        name からそこまでの参照の道を返す (循環の検出)。
+        新しく足した名前には下流がないので、すぐに終わる。"""
+        if name in names:
+            return [name]
+        parents = {name: None}  # たどった名前 → どの名前の下流として見つけたか
+        stack = [name]
+        while stack:
+            node = stack.pop()
+            for child in sorted(self.dependents.get(node, ())):
+                if child in parents:
+                    continue
+                parents[child] = node
+                if child in names:
+                    path = []
+                    while child != name:
+                        path.append(child)
+                        child = parents[child]
+                    return path + [name]
+                stack.append(child)
+        return None
+
+    def _downstream(self, name: str) -> list[str]:
+        """name とその下流の名前を、依存されるものが先になる順 (トポロジカル順) で"""
+        order, seen = [], {name}
+        stack = [(name, iter(self.dependents.get(name, ())))]
+        while stack:                    # 深さ優先の帰りがけ順 (長い連鎖でも再帰しない)
+            node, children = stack[-1]
+            for child in children:
+                if child not in seen:
+                    seen.add(child)
+                    stack.append((child, iter(self.dependents.get(child, ()))))
+                    break
+            else:
+                stack.pop()
+                order.append(node)
+        order.reverse()
+        return order
+
+    def _recompute(self, name: str, changed: bool = False) -> list[str]:
+        dirty = {name}
+        updated = []
+        for node in self._downstream(name):
+            if node not in dirty:
+                continue
+            if node == name and changed:
+                dirty.update(self.dependents.get(node, ()))
+                updated.append(node)
+                continue
+            expression = self.formulas.get(node)
+            if expression is None:
+                continue
+            old = (self.values.get(node, _MISSING), self.errors.get(node))
+            self.evaluations += 1
+            try:
+                value = expression(self._env(expression))
+            except (ArithmeticError, ValueError, TypeError, NameError) as exc:
+                self.values.pop(node, None)
+                self.errors[node] = exc
+                new = (_MISSING, exc)
+            else:
+                self.values[node] = value
+                self.errors.pop(node, None)
+                new = (value, None)
+            if _same(old, new):
+                continue        # 値が変わらなければ下流は計算し直さない
+            dirty.update(self.dependents.get(node, ()))
+            updated.append(node)
+        return updated
+
+    def describe(self, name: str) -> str:
+        """"a = sqrt 6 = 2.449489743" の形の 1 行"""
+        source = self.formulas[name].source
+        if name in self.errors:
+            return f"{name} = {source}  ({error_message(self.errors[name])})"
+        return f"{name} = {source} = {format_result(self.values[name])}"
+
+
+_MISSING = object()
+
+
+def _same(old: tuple, new: tuple) -> bool:
+    (old_value, old_error), (new_value, new_error) = old, new
+    if old_error is not None or new_error is not None:
+        return (type(old_error), getattr(old_error, "args", None)) == \
+               (type(new_error), getattr(new_error, "args", None))
+    return type(old_value) is type(new_value) and old_value == new_value
+
+
 # ──────────────────────────────────────
 #  メインループ
 # ──────────────────────────────────────
 def main() -> None:
+    import argparse
+    parser = argparse.ArgumentParser(description="関数電卓")
+    parser.add_argument("--batch", nargs="?", const="-", default=None, metavar="FILE",
+                        help="1 行 1 式のファイル (省略時は標準入力) をまとめて評価する")
+    parser.add_argument("-o", "--output", default=None, help="バッチの結果の書き出し先 (省略時は標準出力)")
+    parser.add_argument("--format", choices=("csv", "jsonl"), default=None,
+                        help="バッチの出力形式 (省略時は出力の拡張子から決める。既定は csv)")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="バッチのワーカー数 (既定: CPU 数)")
+    parser.add_argument("--chunk-size", type=int, default=2000, help="ワーカーに 1 回で渡す行数")
+    parser.add_argument("--timeout", type=float, default=None,
+                        help="バッチで 1 式に使える秒数 (超えた式はワーカーごと止めてエラーにする)")
+    parser.add_argument("--memory", type=int, default=None, metavar="MB",
+                        help="バッチのワーカー 1 つが使えるメモリ (MB)")
+    args = parser.parse_args()
+
+    if args.batch is not None:
+        from calculator_batch import run_batch_files
+        ok, errors = run_batch_files(args.batch, args.output, args.format, args.jobs,
+                                     args.chunk_size, args.timeout, args.memory)
+        print(f"{ok + errors} 行 (エラー {errors} 行)", file=sys.stderr)
+        return
+
     print("=" * 44)
     print("  関数電卓  (exit / quit で終了)")
     print("=" * 44)
     print("  例: 4 - 4 + 9 | log 4 | sqrt 6")
     print("      root(8, 3) | sin 0.5 | fact 5")
+    print("      a = sqrt 6 | b = a ^ 2 + 1 | vars | del a")
     print("=" * 44)
 
+    sheet = Worksheet()
     while True:
         try:
             expr = input("\n>>> ").strip()
@@ -155,10 +808,31 @@ def main() -> None:
             break
 
         try:
-            result = evaluate(expr)
+            if expr == "vars":
+                for name in sheet.formulas:
+                    print(f"  {sheet.describe(name)}")
+                continue
+            if expr.startswith("del "):
+                name = expr[4:].strip()
+                if name not in sheet.formulas:
+                    print(f"  エラー: {name} は定義されていません")
+                    continue
+                for changed in sheet.remove(name)[1:]:
+                    print(f"  (更新) {sheet.describe(changed)}")
+                continue
+            assignment = parse_assignment(expr)
+            if assignment is not None:
+                name, source = assignment
+                changed = sheet.assign(name, source)
+                print(f"  {sheet.describe(name)}")
+                for other in changed:
+                    if other != name:
+                        print(f"  (更新) {sheet.describe(other)}")
+                continue
+            result = evaluate(expr) if not compile_expr(expr).names else sheet.evaluate(expr)
             print(f"  = {format_result(result)}")
         except Exception as exc:
-            print(f"  エラー: {exc}")
+            print(f"  {error_message(exc)}")
 
 
 if __name__ == "__main__":
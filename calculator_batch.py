@@ -0,0 +1,231 @@
+"""
+関数電卓 — 一括評価 (バッチ)
+============================
+標準入力またはファイルから 1 行 1 式で読み、チャンクに分けてプロセスプールで評価し、
+入力と同じ順に CSV / JSONL で書き出す。評価できない行はその行にエラーを書いて続ける。
+
+入力は読みながら流し、プールに渡すチャンクの数も上限 (jobs × INFLIGHT_PER_JOB) で
+抑えるので、何百万行のファイルでもメモリと 1 行あたりの速度は変わらない。
+空行と # で始まる行は読み飛ばす (行番号は入力ファイルの行番号のまま)。
+
+--timeout / --memory を付けると、各ワーカーが calculator_sandbox.BoundedEvaluator の
+子プロセスで評価し、制限を超えた式だけをエラーにして残りを続ける。
+
+使い方:
+  python calculator.py --batch formulas.txt -o results.csv
+  cat formulas.txt | python calculator.py --batch --format jsonl -j 8 > results.jsonl
+  python calculator.py --batch formulas.txt --timeout 1 --memory 256
+
+出力:
+  csv   : line,expression,result,error
+  jsonl : {"line": 1, "expression": "sqrt 6", "result": "2.449489743"}
+          {"line": 2, "expression": "1 / 0", "error": "エラー: ゼロ除算です"}
+"""
+
+import csv
+import json
+import os
+import sys
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import Pool
+from typing import Iterable, Iterator, NamedTuple, TextIO
+
+from calculator import evaluate, format_result
+
+CHUNK_SIZE = 2000           # 1 回ワーカーに渡す行数
+INFLIGHT_PER_JOB = 4        # ワーカー 1 つあたり、同時に投げておくチャンクの数
+
+
+class Row(NamedTuple):
+    line: int               # 入力での行番号 (1 始まり)
+    expression: str
+    result: str | None      # 整形済みの結果 (format_result)
+    error: str | None
+    transient: bool = False # 時間切れ・メモリ不足など、同じ式でも次は成功しうるエラー
+
+
+# 式そのもので決まるエラー (同じ式なら何度評価しても同じ結果になる)
+DETERMINISTIC_ERRORS = (SyntaxError, ValueError, ArithmeticError)
+
+
+def error_row(line: int, expr: str, exc: BaseException) -> Row:
+    return Row(line, expr, None, str(exc), not isinstance(exc, DETERMINISTIC_ERRORS))
+
+
+# ──────────────────────────────────────
+#  評価 (ワーカープロセスで実行)
+# ──────────────────────────────────────
+def evaluate_chunk(chunk: list[tuple[int, str]]) -> list[Row]:
+    """(行番号, 式) の並びを評価する。例外はその行のエラーにする。"""
+    rows = []
+    for line, expr in chunk:
+        try:
+            rows.append(Row(line, expr, format_result(evaluate(expr)), None))
+        except Exception as exc:
+            rows.append(error_row(line, expr, exc))
+    return rows
+
+
+class BoundedChunks:
+    """制限付きの評価: スレッドごとに BoundedEvaluator (子プロセス) を 1 つ持たせる。
+    スレッドは子プロセスの結果を待つだけなので GIL の取り合いにならない。"""
+
+    def __init__(self, timeout: float | None, memory_mb: int | None):
+        self.timeout = timeout
+        self.memory_mb = memory_mb
+        self._local = threading.local()
+        self._evaluators = []
+        self._lock = threading.Lock()
+
+    def __call__(self, chunk: list[tuple[int, str]]) -> list[Row]:
+        from calculator_sandbox import BoundedEvaluator
+        evaluator = getattr(self._local, "evaluator", None)
+        if evaluator is None:
+            evaluator = self._local.evaluator = BoundedEvaluator(self.timeout, self.memory_mb)
+            with self._lock:
+                self._evaluators.append(evaluator)
+        results = evaluator.evaluate_chunk([expr for _, expr in chunk])
+        rows = []
+        for (line, expr), (ok, value) in zip(chunk, results):
+            if ok:
+                try:
+                    rows.append(Row(line, expr, format_result(value), None))
+                    continue
+                except Exception as exc:
+                    value = exc
+            rows.append(error_row(line, expr, value))
+        return rows
+
+    @property
+    def restarts(self) -> int:
+        """時間切れ・異常終了でワーカーを作り直した回数 (全スレッドの合計)"""
+        return sum(evaluator.restarts for evaluator in self._evaluators)
+
+    def close(self):
+        for evaluator in self._evaluators:
+            evaluator.close()
+
+
+# ──────────────────────────────────────
+#  入力の分割と順序を保った並列評価
+# ──────────────────────────────────────
+def read_chunks(stream: TextIO, size: int = CHUNK_SIZE) -> Iterator[list[tuple[int, str]]]:
+    """入力を (行番号, 式) のチャンクにして順に返す。"""
+    chunk = []
+    for line, text in enumerate(stream, 1):
+        expr = text.strip()
+        if not expr or expr.startswith("#"):
+            continue
+        chunk.append((line, expr))
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def evaluate_stream(chunks: Iterable[list[tuple[int, str]]], jobs: int,
+                    timeout: float | None = None,
+                    memory_mb: int | None = None) -> Iterator[list[Row]]:
+    """チャンクごとの結果を入力順に返す。
+
+    Pool.imap は入力を先に全部読んでしまうので、apply_async で投げたチャンクを
+    deque に並べ、先頭の結果を待って書き出しながら次のチャンクを読む。
+    timeout か memory_mb があれば BoundedChunks のスレッドで同じように回す。"""
+    if timeout or memory_mb:
+        bounded = BoundedChunks(timeout, memory_mb)
+        try:
+            with ThreadPoolExecutor(max(jobs, 1)) as pool:
+                yield from _in_order(chunks, lambda chunk: pool.submit(bounded, chunk).result,
+                                     max(jobs, 1) * INFLIGHT_PER_JOB)
+        finally:
+            bounded.close()
+        return
+    if jobs <= 1:
+        for chunk in chunks:
+            yield evaluate_chunk(chunk)
+        return
+    with Pool(jobs) as pool:
+        yield from _in_order(chunks, lambda chunk: pool.apply_async(evaluate_chunk, (chunk,)).get,
+                             jobs * INFLIGHT_PER_JOB)
+
+
+def _in_order(chunks, submit, limit: int) -> Iterator[list[Row]]:
+    """submit(chunk) で投げて結果を待つ関数を受け取り、投げたまま待っている数を
+    limit までに抑えながら、入力順に結果を返す。"""
+    pending = deque()
+    for chunk in chunks:
+        pending.append(submit(chunk))
+        if len(pending) >= limit:
+            yield pending.popleft()()
+    while pending:
+        yield pending.popleft()()
+
+
+# ──────────────────────────────────────
+#  書き出し
+# ──────────────────────────────────────
+class CsvWriter:
+    def __init__(self, out: TextIO):
+        self.writer = csv.writer(out, lineterminator="\n")
+        self.writer.writerow(Row._fields[:4])
+
+    def write(self, rows: list[Row]):
+        self.writer.writerows(
+            (row.line, row.expression, row.result or "", row.error or "") for row in rows)
+
+
+class JsonlWriter:
+    def __init__(self, out: TextIO):
+        self.out = out
+
+    def write(self, rows: list[Row]):
+        lines = []
+        for row in rows:
+            record = {"line": row.line, "expression": row.expression}
+            if row.error is None:
+                record["result"] = row.result
+            else:
+                record["error"] = row.error
+            lines.append(json.dumps(record, ensure_ascii=False))
+        self.out.write("\n".join(lines) + "\n")
+
+
+WRITERS = {"csv": CsvWriter, "jsonl": JsonlWriter}
+
+
+def run_batch(stream: TextIO, out: TextIO, fmt: str = "csv", jobs: int = 1,
+              chunk_size: int = CHUNK_SIZE, timeout: float | None = None,
+              memory_mb: int | None = None) -> tuple[int, int]:
+    """stream の式をすべて評価して out に書き出す。(成功した行数, エラーの行数) を返す。"""
+    writer = WRITERS[fmt](out)
+    ok = errors = 0
+    chunks = read_chunks(stream, chunk_size)
+    for rows in evaluate_stream(chunks, jobs, timeout, memory_mb):
+        writer.write(rows)
+        failed = sum(row.error is not None for row in rows)
+        errors += failed
+        ok += len(rows) - failed
+    out.flush()
+    return ok, errors
+
+
+def run_batch_files(source: str, output: str | None, fmt: str | None, jobs: int | None,
+                    chunk_size: int = CHUNK_SIZE, timeout: float | None = None,
+                    memory_mb: int | None = None) -> tuple[int, int]:
+    """CLI 用: ファイル名 ("-" は標準入力) を開いて run_batch する。
+    fmt を省くと出力ファイルの拡張子 (.jsonl / .ndjson なら JSONL) で決める。"""
+    if fmt is None:
+        fmt = "jsonl" if output and output.endswith((".jsonl", ".ndjson")) else "csv"
+    jobs = jobs or os.cpu_count() or 1
+    stream = sys.stdin if source == "-" else open(source, encoding="utf-8")
+    out = sys.stdout if output is None else open(output, "w", encoding="utf-8", newline="")
+    try:
+        return run_batch(stream, out, fmt, jobs, chunk_size, timeout, memory_mb)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+        if out is not sys.stdout:
+            out.close()
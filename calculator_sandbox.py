@@ -0,0 +1,186 @@
+"""
+関数電卓 — 時間とメモリを制限した評価
+====================================
+式の評価を別プロセスのワーカーで行い、1 式あたりの実行時間 (壁時計) と
+ワーカーのメモリ (アドレス空間) に上限を付ける。時間を超えた式はワーカーごと止め、
+新しいワーカーを立ち上げて残りの式を続ける。calculator.evaluate の見積もりを
+すり抜けた重い式が 1 つあっても、バッチ全体が止まらない。
+
+式はまとめて (チャンクで) ワーカーに送る。ワーカーは今どの式をいつから計算しているかを
+共有メモリに書くので、親は時間切れになった式だけをエラーにして、その次から再開できる。
+
+使い方:
+  with BoundedEvaluator(timeout=1.0, memory_mb=256) as sandbox:
+      sandbox.evaluate("fact 2000")                  →  値 (失敗なら例外)
+      sandbox.evaluate_chunk(["1 + 2", "fact 9 ^ 9"])  →  [(True, 3), (False, 例外)]
+
+  python calculator.py --batch formulas.txt --timeout 1 --memory 256
+"""
+
+import multiprocessing
+import time
+from multiprocessing.sharedctypes import RawArray
+
+from calculator import evaluate
+
+TIMEOUT = 1.0               # 1 式あたりの制限時間 (秒)
+MEMORY_MB = 512             # ワーカー 1 つのアドレス空間の上限 (MB)
+POLL_INTERVAL = 0.05        # 結果を待つ間に時間切れを確かめる間隔 (秒)
+
+
+# ──────────────────────────────────────
+#  ワーカープロセス
+# ──────────────────────────────────────
+def _limit_memory(memory_mb: int | None):
+    if not memory_mb:
+        return
+    try:
+        import resource     # Unix のみ。使えない環境では時間の制限だけにする
+    except ImportError:
+        return
+    limit = memory_mb << 20
+    soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+
+
+def _worker(conn, progress, memory_mb: int | None):
+    """式のリストを受け取り [(True, 値) | (False, 例外)] を返す。
+    progress[0] に計算中の式の番号、progress[1] にその開始時刻 (monotonic) を書く。"""
+    _limit_memory(memory_mb)
+    while True:
+        try:
+            exprs = conn.recv()
+        except EOFError:
+            return
+        if exprs is None:           # close() からの終了の合図
+            return
+        results = []
+        for i, expr in enumerate(exprs):
+            progress[1] = time.monotonic()
+            progress[0] = i
+            try:
+                results.append((True, evaluate(expr)))
+            except MemoryError:
+                results.append((False, MemoryError("エラー: メモリが足りません")))
+            except Exception as exc:
+                results.append((False, exc))
+        progress[0] = -1
+        conn.send(results)
+
+
+# ──────────────────────────────────────
+#  親プロセス側
+# ──────────────────────────────────────
+class BoundedEvaluator:
+    """ワーカープロセス 1 つで式を評価する。時間切れ・異常終了したワーカーは作り直す。
+    1 つのインスタンスを複数のスレッドから同時に使ってはいけない。"""
+
+    def __init__(self, timeout: float | None = TIMEOUT, memory_mb: int | None = MEMORY_MB):
+        self.timeout = timeout
+        self.memory_mb = memory_mb
+        self.restarts = 0       # 時間切れ・異常終了で作り直した回数
+        self._process = None
+        self._conn = None
+        self._progress = None
+
+    def _start(self):
+        parent, child = multiprocessing.Pipe()
+        self._progress = RawArray("d", 2)
+        self._progress[0] = -1
+        self._process = multiprocessing.Process(
+            target=_worker, args=(child, self._progress, self.memory_mb),
+            name="calculator-worker", daemon=True)
+        self._process.start()
+        child.close()
+        self._conn = parent
+
+    def _kill(self):
+        if self._process is None:
+            return
+        self._conn.close()
+        if self._process.is_alive():
+            self._process.kill()
+        self._process.join()
+        self._process = None
+        self.restarts += 1
+
+    def evaluate_chunk(self, exprs: list[str]) -> list[tuple[bool, object]]:
+        """式ごとに (True, 値) か (False, 例外) を入力と同じ順に返す。
+        時間切れの式は TimeoutError、ワーカーが落ちた式は MemoryError になる。"""
+        results = []
+        while len(results) < len(exprs):
+            if self._process is None:
+                self._start()
+            rest = exprs[len(results):]
+            try:
+                self._conn.send(rest)
+            except OSError:                 # 前のチャンクの後にワーカーが落ちていた
+                self._kill()
+                continue
+            done, timed_out = self._wait()
+            if done is not None:
+                results += done
+                continue
+            # 時間切れ・異常終了: それまでの結果は失われるので、止まった式まで進めて送り直す
+            index = int(self._progress[0])
+            if timed_out:
+                error = TimeoutError(f"エラー: 時間切れです ({self.timeout:g} 秒)")
+            else:               # メモリの上限などでワーカーが落ちた
+                error = MemoryError("エラー: メモリが足りません")
+            self._kill()
+            if index < 0:               # まだ 1 式目を始めていなかった
+                index = 0
+            results += self._retry(rest[:index])
+            results.append((False, error))
+        return results
+
+    def _retry(self, exprs: list[str]) -> list[tuple[bool, object]]:
+        # 止まった式より前の式は時間内に終わっていたので、新しいワーカーでもう一度計算する
+        return self.evaluate_chunk(exprs) if exprs else []
+
+    def _wait(self) -> tuple[list | None, bool]:
+        """結果を待つ。(結果, False) か、失敗なら (None, 時間切れだったか)。
+        ワーカーが落ちた場合はパイプの EOF が先に見えることがあるので、
+        is_alive() ではなくどこで待ちを抜けたかで見分ける。"""
+        conn, progress = self._conn, self._progress
+        while True:
+            if conn.poll(POLL_INTERVAL):
+                try:
+                    return conn.recv(), False
+                except (EOFError, OSError):
+                    return None, False
+            if not self._process.is_alive():
+                return None, False
+            if (self.timeout is not None and progress[0] >= 0
+                    and time.monotonic() - progress[1] > self.timeout):
+                return None, True
+
+    def evaluate(self, expr: str) -> object:
+        """1 式を評価する。失敗は calculator.evaluate と同じ例外か、
+        時間切れなら TimeoutError、メモリ不足なら MemoryError。"""
+        [(ok, value)] = self.evaluate_chunk([expr])
+        if ok:
+            return value
+        raise value
+
+    def close(self):
+        if self._process is not None:
+            # fork した子も親側の端を持っているので、閉じるだけでは EOF が届かない
+            try:
+                self._conn.send(None)
+            except OSError:             # ワーカーがもう落ちている
+                pass
+            self._conn.close()
+            self._process.join(1.0)
+            if self._process.is_alive():
+                self._process.kill()
+                self._process.join()
+            self._process = None
+
+    def __enter__(self) -> "BoundedEvaluator":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
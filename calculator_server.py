@@ -0,0 +1,377 @@
+"""
+関数電卓 — 評価サーバ (HTTP / JSON)
+==================================
+1 つの asyncio イベントループで HTTP/1.1 を受け、式の評価結果を JSON で返すサーバ。
+式ごとにプロセスを起動する代わりに常駐させ、インタプリタの起動時間を払わずに済ませる。
+
+- keep-alive とパイプライン: 1 本の接続で続けて送られたリクエストを読んだ順に処理を始め、
+  応答は届いた順に返す (先に終わった応答は前の応答を待ってから書く)
+- 結果のキャッシュ: 正規形 (calculator.normalize) が同じ式は全接続で 1 つの結果を共有し、
+  計算中の同じ式は 1 回だけ計算して待っている全員に返す。時間切れ・メモリ不足は覚えない
+- ワーカー: 評価は calculator_sandbox.BoundedEvaluator の子プロセスで行う。
+  イベントループは式を溜めてチャンクで渡すだけなので、重い式があっても止まらない
+- 結果の値・エラー文は calculator.evaluate / format_result と同じ
+
+使い方:
+  python calculator_server.py serve --port 8765 -j 4
+  curl -d '{"expr": "sqrt 6"}' localhost:8765/evaluate
+      → {"expr": "sqrt 6", "result": "2.449489743"}
+  curl -d '{"exprs": ["1 / 0", "fact 5"]}' localhost:8765/evaluate
+      → {"results": [{"expr": "1 / 0", "error": "エラー: ゼロ除算です"}, {"expr": "fact 5", "result": "120"}]}
+  curl localhost:8765/stats
+  python calculator_server.py loopback -c 50 -n 2000    : 同じプロセスから接続して負荷試験
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+
+from calculator import normalize
+from calculator_batch import BoundedChunks
+from calculator_sandbox import MEMORY_MB, TIMEOUT
+
+CACHE_SIZE = 100_000        # 覚えておく結果の数 (正規形の式ごと)
+BATCH_SIZE = 256            # ワーカーに 1 回で渡す式の数
+PIPELINE_LIMIT = 128        # 1 接続で応答を待たせておけるリクエスト数
+MAX_BODY = 1 << 20          # リクエスト本文の上限 (バイト)
+MAX_EXPRS = 10_000          # 1 リクエストの "exprs" の上限
+HEADER_LIMIT = 1 << 16      # リクエスト行 + ヘッダの上限 (バイト)
+
+STATUS = {
+    200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+    413: "Payload Too Large", 431: "Request Header Fields Too Large", 501: "Not Implemented",
+}
+
+
+class Request(NamedTuple):
+    method: str
+    path: str
+    body: bytes
+    keep_alive: bool
+
+
+class HttpError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+# ──────────────────────────────────────
+#  HTTP
+# ──────────────────────────────────────
+async def read_request(reader: asyncio.StreamReader) -> Request | None:
+    """リクエストを 1 つ読む。接続が閉じていれば None。"""
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError as exc:
+        if not exc.partial.strip():
+            return None
+        raise HttpError(400, "リクエストが途中で切れています") from None
+    except asyncio.LimitOverrunError:
+        raise HttpError(431, "ヘッダが長すぎます") from None
+    lines = head.decode("latin-1").split("\r\n")
+    try:
+        method, target, version = lines[0].split(" ")
+    except ValueError:
+        raise HttpError(400, "リクエスト行が不正です") from None
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            key, _, value = line.partition(":")
+            headers[key.strip().lower()] = value.strip()
+    if "transfer-encoding" in headers:
+        raise HttpError(501, "Transfer-Encoding には対応していません")
+    try:
+        length = int(headers.get("content-length", "0"))
+    except ValueError:
+        raise HttpError(400, "Content-Length が不正です") from None
+    if length > MAX_BODY:
+        raise HttpError(413, f"本文が大きすぎます (最大 {MAX_BODY} バイト)")
+    body = await reader.readexactly(length) if length else b""
+    connection = headers.get("connection", "").lower()
+    if version == "HTTP/1.1":
+        keep_alive = connection != "close"
+    else:
+        keep_alive = connection == "keep-alive"
+    return Request(method, target.split("?", 1)[0], body, keep_alive)
+
+
+def build_response(status: int, payload: dict, keep_alive: bool) -> bytes:
+    body = json.dumps(payload, ensure_ascii=False).encode()
+    head = (f"HTTP/1.1 {status} {STATUS[status]}\r\n"
+            "Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    return head.encode() + body
+
+
+# ──────────────────────────────────────
+#  サーバ
+# ──────────────────────────────────────
+class CalcServer:
+    def __init__(self, jobs: int | None = None, timeout: float | None = TIMEOUT,
+                 memory_mb: int | None = MEMORY_MB, cache_size: int = CACHE_SIZE):
+        self.jobs = jobs or os.cpu_count() or 1
+        self.cache_size = cache_size
+        self.cache: OrderedDict[str, dict] = OrderedDict()     # 正規形 → {"result"} / {"error"}
+        self.requests = 0
+        self.cache_hits = 0
+        self.evaluated = 0
+        self._inflight: dict[str, asyncio.Future] = {}
+        self._batch: list[tuple[str, asyncio.Future]] = []
+        self._bounded = BoundedChunks(timeout, memory_mb)
+        self._executor = ThreadPoolExecutor(self.jobs, thread_name_prefix="calculator")
+        self._server: asyncio.AbstractServer | None = None
+        self._clients: dict[asyncio.Task, asyncio.StreamWriter] = {}
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> int:
+        """待ち受けを開始し、実際のポート番号を返す。"""
+        self._server = await asyncio.start_server(self._handle_client, host, port,
+                                                  limit=HEADER_LIMIT)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+        # 開いたままの keep-alive 接続を閉じる。キャンセルではなく EOF で
+        # ハンドラを普通に終わらせる (3.11 はキャンセルされたハンドラをエラーとして記録する)
+        for writer in self._clients.values():
+            writer.transport.abort()
+        await asyncio.gather(*self._clients, return_exceptions=True)
+        if self._server is not None:
+            await self._server.wait_closed()
+        self._executor.shutdown()
+        self._bounded.close()
+
+    # ── 評価とキャッシュ ──
+    async def result(self, expr: str) -> dict:
+        """式の結果 {"result": 整形済みの値} か {"error": エラー文}"""
+        try:
+            source = normalize(expr)
+        except SyntaxError as exc:
+            return {"error": str(exc)}
+        cached = self.cache.get(source)
+        if cached is not None:
+            self.cache.move_to_end(source)
+            self.cache_hits += 1
+            return cached
+        future = self._inflight.get(source)
+        if future is None:
+            future = self._inflight[source] = asyncio.get_running_loop().create_future()
+            self._batch.append((source, future))
+            if len(self._batch) == 1:
+                # 同じループ 1 周のうちに来た式をまとめてからワーカーに渡す
+                asyncio.get_running_loop().call_soon(self._flush)
+        return await asyncio.shield(future)
+
+    def _flush(self):
+        batch, self._batch = self._batch, []
+        loop = asyncio.get_running_loop()
+        for i in range(0, len(batch), BATCH_SIZE):
+            chunk = batch[i:i + BATCH_SIZE]
+            task = loop.run_in_executor(self._executor, self._bounded,
+                                        [(0, source) for source, _ in chunk])
+            task.add_done_callback(lambda task, chunk=chunk: self._resolve(chunk, task))
+
+    def _resolve(self, chunk: list[tuple[str, asyncio.Future]], task: asyncio.Future):
+        try:
+            rows = task.result()
+        except Exception as exc:            # ワーカーを起動できないなど
+            rows = None
+            failure = {"error": f"エラー: 評価に失敗しました ({exc})"}
+        self.evaluated += len(chunk)
+        for i, (source, future) in enumerate(chunk):
+            if rows is None:
+                response = failure
+            else:
+                row = rows[i]
+                response = {"result": row.result} if row.error is None else {"error": row.error}
+                if not row.transient:       # 時間切れ・メモリ不足は次は通るかもしれない
+                    self.cache[source] = response
+            del self._inflight[source]
+            future.set_result(response)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "cache_hits": self.cache_hits,
+            "evaluated": self.evaluated,
+            "cached": len(self.cache),
+            "restarts": self._bounded.restarts,
+        }
+
+    # ── リクエスト ──
+    async def respond(self, request: Request) -> tuple[int, dict]:
+        self.requests += 1
+        if request.path == "/stats":
+            return 200, self.stats()
+        if request.path != "/evaluate":
+            raise HttpError(404, f"{request.path} はありません")
+        if request.method != "POST":
+            raise HttpError(405, "/evaluate は POST で送ってください")
+        try:
+            data = json.loads(request.body)
+        except ValueError:
+            raise HttpError(400, "本文が JSON ではありません") from None
+        if isinstance(data, dict) and isinstance(data.get("expr"), str):
+            return 200, {"expr": data["expr"], **await self.result(data["expr"])}
+        exprs = data.get("exprs") if isinstance(data, dict) else None
+        if not isinstance(exprs, list) or not all(isinstance(e, str) for e in exprs):
+            raise HttpError(400, '{"expr": "式"} か {"exprs": ["式", ...]} を送ってください')
+        if len(exprs) > MAX_EXPRS:
+            raise HttpError(413, f"式が多すぎます (最大 {MAX_EXPRS})")
+        results = await asyncio.gather(*map(self.result, exprs))
+        return 200, {"results": [{"expr": e, **r} for e, r in zip(exprs, results)]}
+
+    async def _respond_bytes(self, request: Request) -> bytes:
+        try:
+            status, payload = await self.respond(request)
+        except HttpError as exc:
+            status, payload = exc.status, {"error": str(exc)}
+        return build_response(status, payload, request.keep_alive)
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        # 読む側はリクエストを読んだらすぐ処理を始めて queue に積み、
+        # 書く側は queue の順に応答を待って書く (パイプラインでも応答の順は変わらない)
+        queue: asyncio.Queue = asyncio.Queue(PIPELINE_LIMIT)
+        sender = asyncio.create_task(self._send_responses(queue, writer))
+        task = asyncio.current_task()
+        self._clients[task] = writer
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                except HttpError as exc:
+                    await queue.put(build_response(exc.status, {"error": str(exc)}, False))
+                    break
+                if request is None:
+                    break
+                await queue.put(asyncio.ensure_future(self._respond_bytes(request)))
+                if not request.keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._clients.pop(task, None)
+            await queue.put(None)
+            await sender
+            writer.close()
+
+    async def _send_responses(self, queue: asyncio.Queue, writer: asyncio.StreamWriter):
+        broken = False          # 切れた後も queue は最後まで受け取り、読む側を止めない
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            response = item if isinstance(item, bytes) else await item
+            if broken:
+                continue
+            try:
+                writer.write(response)
+                if queue.empty():           # 続けて届いた応答はまとめて送る
+                    await writer.drain()
+            except ConnectionError:
+                broken = True
+
+
+# ──────────────────────────────────────
+#  負荷試験
+# ──────────────────────────────────────
+async def _client(port: int, exprs: list[str], pipeline: int) -> tuple[int, int]:
+    """exprs を pipeline 件ずつ続けて送り、応答を読む。(応答数, エラー応答数)"""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    answered = errors = 0
+    for i in range(0, len(exprs), pipeline):
+        group = exprs[i:i + pipeline]
+        for expr in group:
+            body = json.dumps({"expr": expr}).encode()
+            writer.write(b"POST /evaluate HTTP/1.1\r\nHost: localhost\r\n"
+                         b"Content-Length: %d\r\n\r\n%s" % (len(body), body))
+        await writer.drain()
+        for _ in group:
+            head = await reader.readuntil(b"\r\n\r\n")
+            length = int(head.split(b"Content-Length: ", 1)[1].split(b"\r\n", 1)[0])
+            payload = json.loads(await reader.readexactly(length))
+            answered += 1
+            errors += "error" in payload
+    writer.close()
+    return answered, errors
+
+
+async def loopback(clients: int, requests: int, pipeline: int = 16, distinct: int = 1000,
+                   jobs: int | None = None, seed: int = 0) -> dict:
+    """clients 本の接続から requests 件ずつ、distinct 種類の式を送る。"""
+    server = CalcServer(jobs)
+    port = await server.start()
+    rng = random.Random(seed)
+    pool = [f"{rng.randint(1, 99)} ^ {rng.randint(1, 9)} / sqrt {rng.randint(1, 999)}"
+            for _ in range(distinct)]
+    work = [[rng.choice(pool) for _ in range(requests)] for _ in range(clients)]
+    start = time.perf_counter()
+    done = await asyncio.gather(*(_client(port, exprs, pipeline) for exprs in work))
+    elapsed = time.perf_counter() - start
+    stats = server.stats()
+    await server.stop()
+    answered = sum(a for a, _ in done)
+    return {
+        "clients": clients,
+        "seconds": round(elapsed, 2),
+        "responses": answered,
+        "errors": sum(e for _, e in done),
+        "requests_per_sec": round(answered / elapsed, 1),
+        "evaluated": stats["evaluated"],
+        "cache_hits": stats["cache_hits"],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="関数電卓 評価サーバ")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sp = sub.add_parser("serve", help="評価サーバを起動する")
+    sp.add_argument("--host", default="127.0.0.1")
+    sp.add_argument("--port", type=int, default=8765)
+    sp.add_argument("-j", "--jobs", type=int, default=None, help="ワーカー数 (既定: CPU 数)")
+    sp.add_argument("--timeout", type=float, default=TIMEOUT, help="1 式に使える秒数")
+    sp.add_argument("--memory", type=int, default=MEMORY_MB, metavar="MB",
+                    help="ワーカー 1 つが使えるメモリ (MB)")
+    sp.add_argument("--cache-size", type=int, default=CACHE_SIZE)
+    lp = sub.add_parser("loopback", help="ローカルのクライアントを繋いで負荷試験")
+    lp.add_argument("-c", "--clients", type=int, default=50)
+    lp.add_argument("-n", "--requests", type=int, default=2000, help="1 接続あたりのリクエスト数")
+    lp.add_argument("-p", "--pipeline", type=int, default=16, help="応答を待たずに送る数")
+    lp.add_argument("--distinct", type=int, default=1000, help="式の種類")
+    lp.add_argument("-j", "--jobs", type=int, default=None)
+    lp.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        asyncio.run(_serve(args.host, args.port, args.jobs, args.timeout, args.memory,
+                           args.cache_size))
+    else:
+        result = asyncio.run(loopback(args.clients, args.requests, args.pipeline,
+                                      args.distinct, args.jobs, args.seed))
+        for key, value in result.items():
+            print(f"{key:20} {value}")
+
+
+async def _serve(host: str, port: int, jobs: int | None, timeout: float, memory_mb: int,
+                 cache_size: int):
+    server = CalcServer(jobs, timeout, memory_mb, cache_size)
+    port = await server.start(host, port)
+    print(f"listening on {host}:{port}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+if __name__ == "__main__":
+    main()
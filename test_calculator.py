@@ -0,0 +1,195 @@
+"""calculator.py のテスト (python -m pytest -q)"""
+
+import pytest
+
+from calculator import (MAX_DIGITS, CostError, Worksheet, compile_expr, evaluate, evaluate_many,
+                        format_result, validate)
+
+
+# ──────────────────────────────────────
+#  桁数の見積もり
+# ──────────────────────────────────────
+@pytest.mark.parametrize("expr", ["3 ^ 14000", "10 ^ 4300", "9 ^ 4600", "2 ^ 14285", "fact 1800"])
+def test_too_large_is_rejected_before_computing(expr):
+    with pytest.raises(CostError):
+        evaluate(expr)
+
+
+@pytest.mark.parametrize("expr", ["(10.0 ^ 400) ^ 2", "fact(10.0 ^ 400)"])
+def test_float_overflow_is_not_a_cost_error(expr):
+    validate(expr)          # 見積もりの対象外 (評価のときに報告する)
+    with pytest.raises(OverflowError) as info:
+        evaluate(expr)
+    assert not isinstance(info.value, CostError)
+    assert str(info.value).startswith("エラー")
+
+
+@pytest.mark.parametrize("expr", ["10 ^ 4000 * 10 ^ 4000", "9 * 10 ^ 4299 + 9 * 10 ^ 4299",
+                                  "-9 * 10 ^ 4299 - 9 * 10 ^ 4299"])
+def test_products_and_sums_are_bounded(expr):
+    with pytest.raises(CostError):
+        evaluate(expr)
+
+
+def test_large_results_can_be_formatted():
+    assert len(format_result(evaluate("9 * 10 ^ 4299 + 1"))) == MAX_DIGITS
+    assert format_result(evaluate("10.0 ^ 300 * 10.0 ^ 300")) == "inf"
+
+
+@pytest.mark.parametrize("base", [2, 3, 7, 9, 10, 99, 12345, -3])
+def test_accepted_powers_can_be_formatted(base):
+    # 見積もりが通した最大の指数とその次で、通ったものは必ず表示できる
+    exponent = 1
+    while True:
+        try:
+            evaluate(f"{base} ^ {exponent * 2}")
+        except OverflowError:
+            break
+        exponent *= 2
+    low, high = exponent, exponent * 2          # low は通り high は通らない
+    while high - low > 1:
+        mid = (low + high) // 2
+        try:
+            evaluate(f"{base} ^ {mid}")
+            low = mid
+        except OverflowError:
+            high = mid
+    value = evaluate(f"{base} ^ {low}")
+    assert len(format_result(abs(value))) <= MAX_DIGITS
+    # 境界の 1 つ上は本当に MAX_DIGITS 桁を超える (見積もりが多すぎない)
+    assert abs(base) ** high >= 10 ** MAX_DIGITS
+
+
+def test_accepted_factorials_can_be_formatted():
+    n = 1
+    while True:
+        try:
+            value = evaluate(f"fact {n + 1}")
+        except OverflowError:
+            break
+        n += 1
+    assert len(format_result(value)) <= MAX_DIGITS
+
+
+# ──────────────────────────────────────
+#  ワークシートの再計算
+# ──────────────────────────────────────
+def test_only_downstream_is_recomputed():
+    sheet = Worksheet()
+    sheet.assign("a", "2")
+    sheet.assign("b", "a * 10")
+    sheet.assign("c", "b + 1")
+    sheet.assign("x", "5")
+    sheet.assign("y", "x + 1")
+    before = sheet.evaluations
+    assert sheet.assign("a", "3") == ["a", "b", "c"]
+    assert sheet.evaluations - before == 3
+    assert (sheet.values["b"], sheet.values["c"], sheet.values["y"]) == (30, 31, 6)
+
+
+def test_unchanged_value_stops_propagation():
+    sheet = Worksheet()
+    sheet.assign("a", "-2")
+    sheet.assign("b", "a ^ 2")
+    sheet.assign("c", "b + 1")
+    before = sheet.evaluations
+    assert sheet.assign("a", "2") == ["a"]      # b は 4 のまま、c は計算しない
+    assert sheet.evaluations - before == 2
+    assert sheet.values["c"] == 5
+
+
+def test_diamond_is_computed_once_in_order():
+    sheet = Worksheet()
+    sheet.assign("a", "1")
+    sheet.assign("b", "a + 1")
+    sheet.assign("c", "a * 2")
+    sheet.assign("d", "b + c")
+    before = sheet.evaluations
+    updated = sheet.assign("a", "10")
+    assert sorted(updated) == ["a", "b", "c", "d"] and updated[0] == "a" and updated[-1] == "d"
+    assert sheet.evaluations - before == 4
+    assert sheet.values["d"] == 31
+
+
+def test_formula_waits_for_undefined_name():
+    sheet = Worksheet()
+    sheet.assign("b", "a + 1")
+    assert "b" in sheet.errors
+    assert sheet.assign("a", "1") == ["a", "b"]
+    assert sheet.values["b"] == 2 and "b" not in sheet.errors
+
+
+def test_remove_and_errors_propagate():
+    sheet = Worksheet()
+    sheet.assign("a", "0")
+    sheet.assign("b", "1 / a")
+    sheet.assign("c", "b + 1")
+    assert "b" in sheet.errors and "c" in sheet.errors
+    assert sheet.assign("a", "4") == ["a", "b", "c"]
+    assert sheet.values["c"] == 1.25
+    assert sheet.remove("a") == ["a", "b", "c"]
+    assert "a" not in sheet.values and "c" in sheet.errors
+
+
+def test_cycle_is_rejected_and_sheet_unchanged():
+    sheet = Worksheet()
+    sheet.assign("a", "1")
+    sheet.assign("b", "a + 1")
+    with pytest.raises(ValueError):
+        sheet.assign("a", "b + 1")
+    assert sheet.formulas["a"].source == "1"
+    assert sheet.assign("a", "5") == ["a", "b"]
+
+
+def test_long_chain():
+    sheet = Worksheet()
+    sheet.assign("v0", "0")
+    for i in range(1, 3000):
+        sheet.assign(f"v{i}", f"v{i - 1} + 1")
+    assert len(sheet.assign("v0", "1")) == 3000
+    assert sheet.values["v2999"] == 3000
+
+
+def test_describe_reports_errors_once():
+    sheet = Worksheet()
+    sheet.assign("a", "10 ^ 4000 * 10 ^ 4000")
+    sheet.assign("b", "1 / 0")
+    assert sheet.describe("a").count("エラー") == 1
+    assert sheet.describe("b") == "b = 1 / 0  (エラー: ゼロ除算です)"
+
+
+# ──────────────────────────────────────
+#  配列での一括評価 (evaluate_many)
+# ──────────────────────────────────────
+@pytest.mark.parametrize("expr", ["sin x ^ 2 + log10 y", "root(y, 3) - abs(x)", "fact y / 7",
+                                  "sqrt(y) * pi // 2", "atan(x) % 1 + e", "-x ^ 2 + floor y"])
+def test_many_matches_scalar_evaluate(expr):
+    np = pytest.importorskip("numpy")
+    xs = np.linspace(-2.0, 2.0, 9)
+    ys = np.arange(1.0, 10.0)
+    result = evaluate_many(expr, x=xs, y=ys)
+    expression = compile_expr(expr)
+    expected = [expression(x=float(x), y=int(y)) for x, y in zip(xs, ys)]
+    assert result.dtype == np.float64
+    assert np.allclose(result, expected)
+
+
+def test_many_factorial_is_elementwise():
+    np = pytest.importorskip("numpy")
+    result = evaluate_many("fact x", x=[0, 1, 5, 170, 171, -1, 2.5])
+    assert result[:3].tolist() == [1.0, 1.0, 120.0]
+    assert np.isfinite(result[3]) and np.isinf(result[4])
+    assert np.isnan(result[5:]).all()
+
+
+def test_many_domain_errors_become_nan_and_inf():
+    np = pytest.importorskip("numpy")
+    result = evaluate_many("1 / x + log(y)", x=[0.0, 1.0, 1.0], y=[1.0, -1.0, 0.0])
+    assert np.isinf(result[0]) and np.isnan(result[1]) and np.isinf(result[2])
+
+
+def test_many_broadcasts_scalars_and_checks_names():
+    np = pytest.importorskip("numpy")
+    assert evaluate_many("x * y", x=np.ones((2, 3)), y=2).tolist() == [[2.0] * 3] * 2
+    with pytest.raises(NameError):
+        evaluate_many("x + z", x=[1.0])
@@ -0,0 +1,81 @@
+"""calculator_batch.py のテスト (python -m pytest -q)"""
+
+import csv
+import io
+import json
+import multiprocessing
+import time
+
+import pytest
+
+import calculator_sandbox
+from calculator import evaluate
+from calculator_batch import error_row, run_batch
+
+SOURCE = """\
+1 + 2
+# コメント
+
+1 / 0
+fact 5
+sqrt(
+2 ^ 10
+"""
+
+
+def parse_csv(text: str) -> list[dict]:
+    return list(csv.DictReader(io.StringIO(text)))
+
+
+def test_rows_keep_input_line_numbers_and_errors():
+    out = io.StringIO()
+    assert run_batch(io.StringIO(SOURCE), out) == (3, 2)
+    rows = parse_csv(out.getvalue())
+    assert [(r["line"], r["result"]) for r in rows] == \
+        [("1", "3"), ("4", ""), ("5", "120"), ("6", ""), ("7", "1024")]
+    assert rows[1]["error"] == "エラー: ゼロ除算です"
+    assert rows[3]["error"].startswith("構文エラー")
+
+
+def test_jsonl_has_result_or_error():
+    out = io.StringIO()
+    run_batch(io.StringIO(SOURCE), out, "jsonl")
+    records = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert records[0] == {"line": 1, "expression": "1 + 2", "result": "3"}
+    assert records[1] == {"line": 4, "expression": "1 / 0", "error": "エラー: ゼロ除算です"}
+
+
+@pytest.mark.parametrize("jobs, timeout", [(1, None), (3, None), (2, 5.0)])
+def test_parallel_output_is_in_input_order(jobs, timeout):
+    exprs = [f"{i} * 2" if i % 7 else f"{i} / 0" for i in range(500)]
+    out = io.StringIO()
+    ok, errors = run_batch(io.StringIO("\n".join(exprs)), out, jobs=jobs, chunk_size=16,
+                           timeout=timeout)
+    rows = parse_csv(out.getvalue())
+    assert (ok, errors) == (500 - 72, 72)
+    assert [r["expression"] for r in rows] == exprs
+    assert [r["result"] for r in rows if r["result"]] == \
+        [str(i * 2) for i in range(500) if i % 7]
+
+
+def test_transient_errors():
+    assert not error_row(1, "1 / 0", ZeroDivisionError("x")).transient
+    assert not error_row(1, "1 +", SyntaxError("x")).transient
+    assert error_row(1, "fact 9", TimeoutError("x")).transient
+    assert error_row(1, "fact 9", MemoryError("x")).transient
+
+
+@pytest.mark.skipif(multiprocessing.get_start_method() != "fork",
+                    reason="ワーカーが fork で作られる環境のみ")
+def test_timeout_fails_only_that_line(monkeypatch):
+    def slow_evaluate(expr):
+        if expr == "sleep":         # 止まらない式の代わり (fork したワーカーに引き継がれる)
+            time.sleep(60)
+        return evaluate(expr)
+
+    monkeypatch.setattr(calculator_sandbox, "evaluate", slow_evaluate)
+    out = io.StringIO()
+    assert run_batch(io.StringIO("1 + 1\nsleep\n2 + 2\n"), out, timeout=0.2) == (2, 1)
+    rows = parse_csv(out.getvalue())
+    assert [r["result"] for r in rows] == ["2", "", "4"]
+    assert "時間切れ" in rows[1]["error"]
@@ -0,0 +1,81 @@
+"""calculator_sandbox.py のテスト (python -m pytest -q)"""
+
+import multiprocessing
+import os
+import signal
+import time
+
+import pytest
+
+import calculator_sandbox
+from calculator import evaluate
+from calculator_sandbox import BoundedEvaluator
+
+# ワーカーは fork で作られ、差し替えた evaluate をそのまま受け継ぐ
+pytestmark = pytest.mark.skipif(multiprocessing.get_start_method() != "fork",
+                                reason="ワーカーが fork で作られる環境のみ")
+
+
+def fake_evaluate(expr: str):
+    """"sleep" は止まらない式、"crash" はワーカーごと落ちる式の代わり"""
+    if expr == "sleep":
+        time.sleep(60)
+    if expr == "crash":
+        os.kill(os.getpid(), signal.SIGKILL)
+    return evaluate(expr)
+
+
+@pytest.fixture
+def sandbox(monkeypatch):
+    monkeypatch.setattr(calculator_sandbox, "evaluate", fake_evaluate)
+    with BoundedEvaluator(timeout=0.2, memory_mb=None) as sandbox:
+        yield sandbox
+
+
+def summary(results):
+    return [value if ok else type(value) for ok, value in results]
+
+
+# ──────────────────────────────────────
+#  時間切れ・異常終了の見分け
+# ──────────────────────────────────────
+def test_timeout_only_fails_the_slow_expression(sandbox):
+    results = sandbox.evaluate_chunk(["1 + 2", "sleep", "3 * 4"])
+    assert summary(results) == [3, TimeoutError, 12]
+    assert "0.2 秒" in str(results[1][1])
+    assert sandbox.restarts == 1
+
+
+def test_crash_is_reported_as_memory_error(sandbox):
+    results = sandbox.evaluate_chunk(["1 + 2", "crash", "3 * 4", "crash"])
+    assert summary(results) == [3, MemoryError, 12, MemoryError]
+    assert sandbox.restarts == 2
+
+
+def test_ordinary_errors_keep_the_worker(sandbox):
+    results = sandbox.evaluate_chunk(["1 / 0", "1 +", "2 ^ 10"])
+    assert summary(results) == [ZeroDivisionError, SyntaxError, 1024]
+    assert sandbox.restarts == 0
+
+
+def test_evaluate_raises(sandbox):
+    assert sandbox.evaluate("6 * 7") == 42
+    with pytest.raises(TimeoutError):
+        sandbox.evaluate("sleep")
+    assert sandbox.evaluate("6 * 7") == 42
+
+
+def test_worker_dead_between_chunks(sandbox):
+    assert sandbox.evaluate("1 + 1") == 2
+    sandbox._process.kill()
+    sandbox._process.join()
+    assert sandbox.evaluate("2 + 2") == 4
+    assert sandbox.restarts == 1
+
+
+def test_close_after_worker_died(sandbox):
+    sandbox.evaluate("1 + 1")
+    sandbox._process.kill()
+    sandbox._process.join()
+    sandbox.close()
+    assert sandbox._process is None
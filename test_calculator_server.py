@@ -0,0 +1,91 @@
+"""calculator_server.py のテスト (python -m pytest -q)"""
+
+import asyncio
+import json
+import multiprocessing
+import time
+
+import pytest
+
+import calculator_sandbox
+from calculator import evaluate
+from calculator_server import CalcServer
+
+# ワーカーは fork で作られ、差し替えた evaluate をそのまま受け継ぐ
+pytestmark = pytest.mark.skipif(multiprocessing.get_start_method() != "fork",
+                                reason="ワーカーが fork で作られる環境のみ")
+
+
+def fake_evaluate(expr: str):
+    """"nap" は少し時間のかかる式、"sleep" は止まらない式の代わり"""
+    if expr == "nap":
+        time.sleep(0.3)
+        return 1
+    if expr == "sleep":
+        time.sleep(60)
+    return evaluate(expr)
+
+
+@pytest.fixture(autouse=True)
+def slow_expressions(monkeypatch):
+    monkeypatch.setattr(calculator_sandbox, "evaluate", fake_evaluate)
+
+
+async def pipelined(port: int, bodies: list[dict]) -> list[dict]:
+    """bodies を 1 本の接続で続けて送り、応答を届いた順に返す"""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    for body in bodies:
+        data = json.dumps(body).encode()
+        writer.write(b"POST /evaluate HTTP/1.1\r\nHost: localhost\r\n"
+                     b"Content-Length: %d\r\n\r\n%s" % (len(data), data))
+    await writer.drain()
+    responses = []
+    for _ in bodies:
+        head = await reader.readuntil(b"\r\n\r\n")
+        length = int(head.split(b"Content-Length: ", 1)[1].split(b"\r\n", 1)[0])
+        responses.append(json.loads(await reader.readexactly(length)))
+    writer.close()
+    return responses
+
+
+def run(scenario, **options):
+    async def main():
+        server = CalcServer(jobs=2, memory_mb=None, **options)
+        port = await server.start()
+        try:
+            return await scenario(server, port)
+        finally:
+            await server.stop()
+    return asyncio.run(main())
+
+
+def test_pipelined_responses_keep_request_order():
+    async def scenario(server, port):
+        await pipelined(port, [{"expr": "1 + 1"}])     # 後の 1 + 1 はキャッシュですぐ終わる
+        return await pipelined(port, [{"expr": "nap"}, {"expr": "1 + 1"},
+                                      {"exprs": ["1 / 0", "fact 5"]}])
+    first, second, third = run(scenario)
+    assert first == {"expr": "nap", "result": "1"}
+    assert second == {"expr": "1 + 1", "result": "2"}
+    assert third["results"] == [{"expr": "1 / 0", "error": "エラー: ゼロ除算です"},
+                                {"expr": "fact 5", "result": "120"}]
+
+
+def test_same_expression_is_evaluated_once():
+    async def scenario(server, port):
+        await pipelined(port, [{"exprs": ["2 ^ 10", "2^10", " 2 ^ 10 "]}])
+        await pipelined(port, [{"expr": "2 ^ 10"}])
+        return server.stats()
+    stats = run(scenario)
+    assert stats["evaluated"] == 1 and stats["cache_hits"] == 1
+
+
+def test_transient_errors_are_not_cached():
+    async def scenario(server, port):
+        [timed_out, failed] = (await pipelined(port, [{"exprs": ["sleep", "1 / 0"]}]))[0]["results"]
+        return timed_out, failed, server.stats(), set(server.cache)
+    timed_out, failed, stats, cached = run(scenario, timeout=0.2)
+    assert "時間切れ" in timed_out["error"]
+    assert failed["error"] == "エラー: ゼロ除算です"
+    assert cached == {"1 / 0"}
+    assert stats["restarts"] == 1
@@ -0,0 +1,58 @@
+"""tetris.py (描画) のテスト (python -m pytest -q)"""
+
+import os
+import random
+
+import pytest
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+pygame = pytest.importorskip("pygame")
+
+from tetris import CELL, SCREEN_H, SCREEN_W, Renderer  # noqa: E402
+from tetris_engine import (INPUT_HARD_DROP, INPUT_LEFT, INPUT_RIGHT, INPUT_ROTATE,  # noqa: E402
+                           TICK_MS, Game)
+
+
+@pytest.fixture(scope="module", autouse=True)
+def display():
+    pygame.init()
+    yield
+    pygame.quit()
+
+
+def pixels(surface) -> bytes:
+    return pygame.image.tobytes(surface, "RGB")
+
+
+def test_incremental_draw_matches_full_draw():
+    # 差分だけ描き直した画面が、毎回全部描いた画面と同じになる (補間したピースの跡が残らない)
+    screen = pygame.Surface((SCREEN_W, SCREEN_H))
+    fresh = pygame.Surface((SCREEN_W, SCREEN_H))
+    renderer = Renderer(screen)
+    reference = Renderer(fresh)
+    rng = random.Random(1)
+    game = Game(3)
+    for frame in range(300):
+        if frame % 3 == 0:
+            if rng.random() < 0.3:
+                game.handle_input(rng.choice([INPUT_LEFT, INPUT_RIGHT, INPUT_ROTATE,
+                                              INPUT_HARD_DROP]))
+            game.update(TICK_MS)
+        alpha = rng.random()
+        renderer.draw(game, alpha)
+        reference._shown = None         # 毎回全部描き直させる
+        reference.draw(game, alpha)
+        assert pixels(screen) == pixels(fresh)
+        if game.game_over:
+            break
+
+
+def test_falling_piece_is_interpolated():
+    renderer = Renderer(pygame.Surface((SCREEN_W, SCREEN_H)))
+    game = Game(1)
+    shifts = []
+    for timer in (0, game.fall_interval // 2, game.fall_interval - TICK_MS):
+        game.fall_timer = timer
+        renderer.draw(game, 1.0)
+        shifts.append(renderer._piece_shown[4])
+    assert shifts[0] < shifts[1] < shifts[2] <= CELL
@@ -0,0 +1,74 @@
+"""tetris_batch.py のテスト (python -m pytest -q)"""
+
+import random
+
+import numpy as np
+import pytest
+
+from tetris_batch import (HARD_DROP, HOLD, LEFT, PIECE_NAMES, RIGHT, ROTATE_CCW, ROTATE_CW,
+                          SOFT_DROP, BatchGame)
+from tetris_engine import (COLS, INPUT_HARD_DROP, INPUT_HOLD, INPUT_LEFT, INPUT_RIGHT,
+                           INPUT_ROTATE, INPUT_ROTATE_CCW, INPUT_SOFT_DROP, SHAPES, Game)
+
+# BatchGame の行動コード → Game の入力コード
+INPUTS = {
+    LEFT: INPUT_LEFT, RIGHT: INPUT_RIGHT, SOFT_DROP: INPUT_SOFT_DROP,
+    ROTATE_CW: INPUT_ROTATE, ROTATE_CCW: INPUT_ROTATE_CCW,
+    HARD_DROP: INPUT_HARD_DROP, HOLD: INPUT_HOLD,
+}
+ACTIONS = [LEFT, RIGHT, SOFT_DROP, ROTATE_CW, ROTATE_CCW, HOLD] * 2 + [HARD_DROP] * 3
+
+
+def upcoming(game: Game):
+    """game の next より後に出るピースの名前 (game の 7-bag と乱数を今の時点で写して先読みする)"""
+    rng = random.Random()
+    rng.setstate(game.rng.getstate())
+    bag = list(game.bag)
+
+    def pieces():
+        while True:
+            if not bag:
+                bag.extend(SHAPES)
+                rng.shuffle(bag)
+            yield bag.pop()
+    return pieces()
+
+
+def batch_like(game: Game) -> BatchGame:
+    """game と同じ順にピースが出る 1 ゲームの BatchGame (乱数の種類が違うので並びを渡す)"""
+    batch = BatchGame(1)
+    queue = upcoming(game)
+    batch._next_kind = lambda idx: np.array([PIECE_NAMES.index(next(queue))])
+    batch.kind[0] = PIECE_NAMES.index(game.current.name)
+    batch.next_kind[0] = PIECE_NAMES.index(game.next_piece.name)
+    return batch
+
+
+def assert_same(game: Game, batch: BatchGame):
+    cells = [[bool(row >> c & 1) for c in range(COLS)] for row in game.board]
+    assert batch.cells()[0].tolist() == cells
+    assert (int(batch.score[0]), int(batch.lines[0]), int(batch.level[0])) == \
+        (game.score, game.lines, game.level)
+    assert bool(batch.game_over[0]) == game.game_over
+    if not game.game_over:
+        piece = game.current
+        assert (PIECE_NAMES[batch.kind[0]], batch.x[0], batch.y[0], batch.rot[0]) == \
+            (piece.name, piece.x, piece.y, piece.rotation)
+    hold = game.hold_piece.name if game.hold_piece is not None else None
+    assert (PIECE_NAMES[batch.hold_kind[0]] if batch.hold_kind[0] >= 0 else None) == hold
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_batch_matches_game(seed):
+    rng = random.Random(seed)
+    game = Game(seed)
+    batch = batch_like(game)
+    for _ in range(1500):
+        action = rng.choice(ACTIONS)
+        game.handle_input(INPUTS[action])
+        if game.clearing_rows:
+            game.update(game.clear_timer)       # BatchGame は揃った行をすぐ消す
+        batch.step([action])
+        assert_same(game, batch)
+        if game.game_over:
+            break
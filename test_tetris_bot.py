@@ -0,0 +1,32 @@
+"""tetris_bot.py のテスト (python -m pytest -q)"""
+
+from tetris_bot import VISIBLE, Bot, drop_placements
+from tetris_engine import ROWS
+
+
+def board_of(*rows: str) -> list[int]:
+    """下詰めの盤面 ("#" = 埋まっている)"""
+    masks = [sum(1 << c for c, ch in enumerate(row) if ch == "#") for row in rows]
+    return [0] * (ROWS - len(masks)) + masks
+
+
+# 下向きの T がちょうど入る T-Spin ダブルの溝
+TSD = board_of("####......",
+               "###...####",
+               "####.#####")
+
+
+def test_rotation_into_slot_is_tspin():
+    spins = {(p.rotation, p.tspin, p.path) for p in drop_placements(TSD, "T", 3, ROWS - 3, 1)}
+    assert (2, "full", ("cw",)) in spins
+    assert (0, "mini", ("ccw",)) in spins
+
+
+def test_move_after_rotation_is_not_tspin():
+    for p in drop_placements(TSD, "T", 3, ROWS - 3, 1):
+        if set(p.path) - {"cw", "ccw"}:
+            assert p.tspin == ""
+
+
+def test_depth_is_capped_to_visible_pieces():
+    assert Bot(depth=5).depth == VISIBLE
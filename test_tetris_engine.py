@@ -0,0 +1,104 @@
+"""tetris_engine.py のテスト (python -m pytest -q)"""
+
+import random
+
+import pytest
+
+from tetris_engine import (INPUT_HARD_DROP, INPUT_HOLD, INPUT_LEFT, INPUT_RIGHT, INPUT_ROTATE,
+                           INPUT_ROTATE_CCW, INPUT_SOFT_DROP, Game, RewindBuffer)
+
+INPUTS = [INPUT_LEFT, INPUT_RIGHT, INPUT_SOFT_DROP, INPUT_ROTATE, INPUT_ROTATE_CCW,
+          INPUT_HOLD] + [INPUT_HARD_DROP] * 2
+
+
+def play(game: Game, rng: random.Random, ticks: int):
+    """乱数で決めた入力と update(16) を交互に送る"""
+    for _ in range(ticks):
+        if game.game_over:
+            return
+        if not game.clearing_rows:
+            game.handle_input(rng.choice(INPUTS))
+        game.update(16)
+
+
+# ──────────────────────────────────────
+#  snapshot / restore
+# ──────────────────────────────────────
+@pytest.mark.parametrize("seed", range(4))
+def test_restore_replays_identically(seed):
+    game = Game(seed)
+    play(game, random.Random(seed), 200)
+    snap = game.snapshot()
+    play(game, random.Random(100 + seed), 300)
+    after = game.snapshot()
+
+    # 戻すと取った時点と同じ状態になり、同じ入力で同じ先へ進む (7-bag の乱数も含めて)
+    game.restore(snap)
+    assert game.snapshot() == snap
+    play(game, random.Random(100 + seed), 300)
+    assert game.snapshot() == after
+
+
+def test_restore_into_another_game():
+    game = Game(3)
+    play(game, random.Random(3), 150)
+    snap = game.snapshot()
+    other = Game(99)
+    other.restore(snap)
+    assert other.snapshot() == snap
+    assert other.seed == 99         # seed はそのまま
+
+
+def test_snapshot_is_not_changed_by_play():
+    game = Game(1)
+    snap = game.snapshot()
+    copy = tuple(snap)
+    play(game, random.Random(1), 300)
+    assert tuple(snap) == copy
+
+
+# ──────────────────────────────────────
+#  RewindBuffer
+# ──────────────────────────────────────
+def drop(game: Game, rewind: RewindBuffer):
+    game.handle_input(INPUT_HARD_DROP)
+    while game.clearing_rows:
+        game.update(game.clear_timer)
+    rewind.track(game)
+
+
+def test_undo_returns_to_previous_piece():
+    game = Game(7)
+    rewind = RewindBuffer()
+    rewind.track(game)
+    history = [game.snapshot()]
+    for _ in range(5):
+        drop(game, rewind)
+        history.append(game.snapshot())
+    for expected in reversed(history[:-1]):
+        assert rewind.undo(game)
+        assert game.snapshot() == expected
+    assert not rewind.undo(game)
+
+
+def test_undo_after_game_over_retries_last_piece():
+    game = Game(2)
+    rewind = RewindBuffer()
+    rewind.track(game)
+    while not game.game_over:
+        before = game.snapshot()
+        drop(game, rewind)
+    assert rewind.undo(game)
+    assert not game.game_over
+    assert game.snapshot() == before
+
+
+def test_capacity_drops_oldest():
+    game = Game(4)
+    rewind = RewindBuffer(capacity=3)
+    rewind.track(game)
+    for _ in range(6):
+        drop(game, rewind)
+    assert not game.game_over and len(rewind) == 3
+    assert rewind.undo(game) and rewind.undo(game)
+    assert not rewind.undo(game)
@@ -0,0 +1,61 @@
+"""tetris_replay.py のテスト (python -m pytest -q)"""
+
+import pytest
+
+from tetris_bot import Bot, run_headless
+from tetris_replay import END, HEADER, TAG_TICK8, TAG_TICK32, audit, replay, replay_steps
+
+
+@pytest.fixture(scope="module")
+def recording(tmp_path_factory):
+    path = tmp_path_factory.mktemp("replay") / "game.trp"
+    stats = run_headless(Bot(depth=1, time_budget_ms=None), 40, seed=5, record=str(path))
+    return path, stats
+
+
+def test_round_trip(recording):
+    path, stats = recording
+    result = replay(str(path))
+    assert result.ok
+    assert (result.score, result.lines) == (stats["score"], stats["lines"])
+    assert (result.expected_score, result.expected_lines) == (stats["score"], stats["lines"])
+
+
+def test_steps_match_replay(recording):
+    path, _ = recording
+    game, steps = replay_steps(str(path))
+    ticks = sum(1 for _ in steps)
+    result = replay(str(path))
+    assert (game.score, game.lines, ticks) == (result.score, result.lines, result.ticks)
+
+
+def test_missing_end_record_is_incomplete(recording, tmp_path):
+    path, _ = recording
+    cut = tmp_path / "cut.trp"
+    cut.write_bytes(path.read_bytes()[:-(END.size + 1)])
+    result = audit(str(cut))
+    assert result.ok is None and result.error is None
+
+
+@pytest.mark.parametrize("cut_at", ["header", "tick8", "tick", "end"])
+def test_truncated_file_is_reported_not_raised(recording, tmp_path, cut_at):
+    path, _ = recording
+    data = path.read_bytes()
+    cut = tmp_path / "cut.trp"
+    if cut_at == "header":
+        cut.write_bytes(data[:HEADER.size - 1])
+    elif cut_at == "tick8":
+        cut.write_bytes(data[:HEADER.size] + bytes([TAG_TICK8]))
+    elif cut_at == "tick":
+        cut.write_bytes(data[:HEADER.size] + bytes([TAG_TICK32, 1]))
+    else:
+        cut.write_bytes(data[:-5])
+    result = audit(str(cut))
+    assert result.ok is False and result.error
+
+
+def test_unknown_record_is_reported(recording, tmp_path):
+    path, _ = recording
+    bad = tmp_path / "bad.trp"
+    bad.write_bytes(path.read_bytes()[:20] + b"\x55")
+    assert "0x55" in audit(str(bad)).error
@@ -0,0 +1,38 @@
+"""tetris_solver.py のテスト (python -m pytest -q)"""
+
+import random
+
+import pytest
+
+from tetris_engine import COLS, FULL_ROW, ROWS, SHAPES, Game
+from tetris_solver import (landing_placements, landing_positions, pc_heights,
+                           play_solution, solve_perfect_clear)
+
+
+def random_board(rng: random.Random) -> list[int]:
+    board = [0] * ROWS
+    for r in range(ROWS - rng.randint(0, 6), ROWS):
+        board[r] = rng.getrandbits(COLS) & ~(1 << rng.randrange(COLS)) & FULL_ROW
+    return board
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_landing_positions_match_placements(seed):
+    # 探索用のビット演算版は、入力列つきの幅優先探索と同じ着地状態を返す
+    board = random_board(random.Random(seed))
+    for name in SHAPES:
+        expected = sorted((p.x, p.y, p.rotation) for p in landing_placements(board, name))
+        assert sorted(landing_positions(board, name)) == expected
+
+
+@pytest.mark.parametrize("seed", [0, 2, 12])
+def test_perfect_clear_solution_clears_board(seed):
+    game = Game(seed)
+    steps = solve_perfect_clear(game, peek=True, time_limit=None)
+    assert steps is not None
+    assert play_solution(game, steps)
+    assert not any(game.board)
+
+
+def test_pc_heights_on_empty_board():
+    assert pc_heights([0] * ROWS, 4) == [(2, 5), (4, 10)]
@@ -0,0 +1,36 @@
+"""tetris_telemetry.py のテスト (python -m pytest -q)"""
+
+import json
+
+import pytest
+
+from tetris_engine import EVENT_LEVEL, INPUT_HARD_DROP, Game
+from tetris_telemetry import TelemetryWriter, read_log
+
+
+@pytest.mark.parametrize("name", ["play.tlog", "play.ndjson"])
+def test_events_round_trip(tmp_path, name):
+    path = tmp_path / name
+    game = Game(1)
+    writer = TelemetryWriter(str(path), game)
+    for _ in range(5):
+        game.handle_input(INPUT_HARD_DROP)
+    game.level = 300                    # 2990 ライン以上で届くレベル
+    writer.emit(game, EVENT_LEVEL)
+    writer.close(game)
+    if name.endswith(".tlog"):
+        records = list(read_log(str(path)))
+    else:
+        records = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [r["event"] for r in records].count("lock") == 5
+    assert records[-1]["event"] == "level" and records[-1]["level"] == 300
+    assert writer.error is None and game.telemetry is None
+
+
+def test_writer_error_is_raised_on_close(tmp_path):
+    game = Game(1)
+    writer = TelemetryWriter(str(tmp_path / "play.tlog"), game)
+    writer.emit(game, EVENT_LEVEL, a=1000)      # i8 に入らない
+    with pytest.raises(RuntimeError):
+        writer.close(game)
+    assert writer.error is not None
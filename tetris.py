@@ -11,15 +11,22 @@
   ESC    : 終了
 """
 
-import pygame
-import random
+import json
+import os
 import sys
+import time
+from collections import OrderedDict
+
+import pygame
+
+from tetris_engine import (
+    COLS, ROWS, TICK_MS, INPUT_ROTATE, INPUT_HARD_DROP, INPUT_HOLD, INPUT_RESTART,
+    PIECE_STATES, Tetromino, Game, RewindBuffer, AutoShift,
+)
 
 # ──────────────────────────────────────
 #  定数
 # ──────────────────────────────────────
-COLS = 10
-ROWS = 20
 CELL = 32          # 1 マスのピクセルサイズ
 SIDE_W = 180       # サイドパネル幅
 TOP_MARGIN = 40    # 上部マージン
@@ -27,7 +34,8 @@ TOP_MARGIN = 40    # 上部マージン
 SCREEN_W = COLS * CELL + SIDE_W + 20
 SCREEN_H = ROWS * CELL + TOP_MARGIN + 10
 
-FPS = 60
+FPS = 60           # 描画の上限フレームレート
+MAX_TICKS_PER_FRAME = 250 // TICK_MS  # 長いストールでも追いつくのは 250ms 分まで
 
 # ── 色定義 ──
 BG_COLOR       = (18, 18, 30)
@@ -38,614 +46,415 @@ TEXT_COLOR      = (220, 220, 240)
 TEXT_DIM        = (120, 120, 160)
 GAMEOVER_BG    = (0, 0, 0, 180)
 
-# テトリミノの色（鮮やか）
-COLORS = {
-    "I": (0, 220, 255),    # シアン
-    "O": (255, 220, 0),    # 黄
-    "T": (180, 60, 255),   # 紫
-    "S": (80, 255, 80),    # 緑
-    "Z": (255, 60, 60),    # 赤
-    "J": (60, 100, 255),   # 青
-    "L": (255, 160, 40),   # オレンジ
-}
-
-# テトリミノの形状定義 (4回転状態)
-SHAPES = {
-    "I": [
-        [(0, 1), (1, 1), (2, 1), (3, 1)],
-        [(2, 0), (2, 1), (2, 2), (2, 3)],
-        [(0, 2), (1, 2), (2, 2), (3, 2)],
-        [(1, 0), (1, 1), (1, 2), (1, 3)],
-    ],
-    "O": [
-        [(1, 0), (2, 0), (1, 1), (2, 1)],
-        [(1, 0), (2, 0), (1, 1), (2, 1)],
-        [(1, 0), (2, 0), (1, 1), (2, 1)],
-        [(1, 0), (2, 0), (1, 1), (2, 1)],
-    ],
-    "T": [
-        [(0, 1), (1, 1), (2, 1), (1, 0)],
-        [(1, 0), (1, 1), (1, 2), (2, 1)],
-        [(0, 1), (1, 1), (2, 1), (1, 2)],
-        [(1, 0), (1, 1), (1, 2), (0, 1)],
-    ],
-    "S": [
-        [(1, 0), (2, 0), (0, 1), (1, 1)],
-        [(1, 0), (1, 1), (2, 1), (2, 2)],
-        [(1, 1), (2, 1), (0, 2), (1, 2)],
-        [(0, 0), (0, 1), (1, 1), (1, 2)],
-    ],
-    "Z": [
-        [(0, 0), (1, 0), (1, 1), (2, 1)],
-        [(2, 0), (1, 1), (2, 1), (1, 2)],
-        [(0, 1), (1, 1), (1, 2), (2, 2)],
-        [(1, 0), (0, 1), (1, 1), (0, 2)],
-    ],
-    "J": [
-        [(0, 0), (0, 1), (1, 1), (2, 1)],
-        [(1, 0), (2, 0), (1, 1), (1, 2)],
-        [(0, 1), (1, 1), (2, 1), (2, 2)],
-        [(1, 0), (1, 1), (0, 2), (1, 2)],
-    ],
-    "L": [
-        [(2, 0), (0, 1), (1, 1), (2, 1)],
-        [(1, 0), (1, 1), (1, 2), (2, 2)],
-        [(0, 1), (1, 1), (2, 1), (0, 2)],
-        [(0, 0), (1, 0), (1, 1), (1, 2)],
-    ],
-}
-
-LINE_SCORES = {0: 0, 1: 100, 2: 300, 3: 500, 4: 800}
-
-# ── SRS ウォールキックオフセット ──
-# (from_rotation, to_rotation) → [(dx, dy), ...]
-# J, L, S, T, Z 用
-SRS_KICKS_JLSTZ = {
-    (0, 1): [(0, 0), (-1, 0), (-1, -1), (0, 2), (-1, 2)],
-    (1, 0): [(0, 0), (1, 0), (1, 1), (0, -2), (1, -2)],
-    (1, 2): [(0, 0), (1, 0), (1, 1), (0, -2), (1, -2)],
-    (2, 1): [(0, 0), (-1, 0), (-1, -1), (0, 2), (-1, 2)],
-    (2, 3): [(0, 0), (1, 0), (1, -1), (0, 2), (1, 2)],
-    (3, 2): [(0, 0), (-1, 0), (-1, 1), (0, -2), (-1, -2)],
-    (3, 0): [(0, 0), (-1, 0), (-1, 1), (0, -2), (-1, -2)],
-    (0, 3): [(0, 0), (1, 0), (1, -1), (0, 2), (1, 2)],
-}
-# I ピース用
-SRS_KICKS_I = {
-    (0, 1): [(0, 0), (-2, 0), (1, 0), (-2, 1), (1, -2)],
-    (1, 0): [(0, 0), (2, 0), (-1, 0), (2, -1), (-1, 2)],
-    (1, 2): [(0, 0), (-1, 0), (2, 0), (-1, -2), (2, 1)],
-    (2, 1): [(0, 0), (1, 0), (-2, 0), (1, 2), (-2, -1)],
-    (2, 3): [(0, 0), (2, 0), (-1, 0), (2, -1), (-1, 2)],
-    (3, 2): [(0, 0), (-2, 0), (1, 0), (-2, 1), (1, -2)],
-    (3, 0): [(0, 0), (1, 0), (-2, 0), (1, 2), (-2, -1)],
-    (0, 3): [(0, 0), (-1, 0), (2, 0), (-1, -2), (2, 1)],
-}
-
-# T-Spin 判定用: T ピースの中心からの 4 隅オフセット
-T_CORNERS = [(-1, -1), (1, -1), (-1, 1), (1, 1)]
-# T ピースの "前方" コーナー（回転方向の前面 2 つ）
-T_FRONT_CORNERS = {
-    0: [(-1, -1), (1, -1)],   # 上向き
-    1: [(1, -1), (1, 1)],     # 右向き
-    2: [(-1, 1), (1, 1)],     # 下向き
-    3: [(-1, -1), (-1, 1)],   # 左向き
-}
+FONT_NAME = "Segoe UI"
+# フォント名 → ファイルの解決結果の保存先 (システムフォントの走査は初回起動時だけ)
+FONT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "tetris", "fonts.json")
 
 
 # ──────────────────────────────────────
-#  テトリミノ
+#  フォント
 # ──────────────────────────────────────
-class Tetromino:
-    def __init__(self, shape_name: str):
-        self.name = shape_name
-        self.color = COLORS[shape_name]
-        self.rotation = 0
-        # ボード上の位置 (左上基準)
-        self.x = COLS // 2 - 2
-        self.y = -1
-
-    def cells(self) -> list[tuple[int, int]]:
-        """現在の回転状態でのセル座標 (ボード座標)"""
-        return [
-            (self.x + dx, self.y + dy)
-            for dx, dy in SHAPES[self.name][self.rotation]
-        ]
-
-    def rotated_cells(self, direction: int = 1) -> list[tuple[int, int]]:
-        """回転後のセル座標 (実際には回転しない)"""
-        new_rot = (self.rotation + direction) % 4
-        return [
-            (self.x + dx, self.y + dy)
-            for dx, dy in SHAPES[self.name][new_rot]
-        ]
-
-    def rotate(self, direction: int = 1):
-        self.rotation = (self.rotation + direction) % 4
-
-    def shape_cells(self) -> list[tuple[int, int]]:
-        """形状のみのセル座標 (位置オフセットなし)"""
-        return SHAPES[self.name][self.rotation]
+_fonts: dict[tuple[str, int, bool], pygame.font.Font] = {}
+_font_paths: dict[str, list] | None = None
+
+
+def load_font(name: str, size: int, bold: bool = False) -> pygame.font.Font:
+    """pygame.font.SysFont と同じフォントを返す。
+    名前の解決結果は FONT_CACHE_PATH に保存して次回の起動から使い回し、
+    同じ (名前, サイズ, 太字) の Font はプロセス内で共有する。"""
+    key = (name, size, bold)
+    font = _fonts.get(key)
+    if font is None:
+        path, synthetic_bold = _resolve_font(name, bold)
+        font = pygame.font.Font(path, size)
+        if synthetic_bold:
+            font.set_bold(True)
+        _fonts[key] = font
+    return font
+
+
+def _resolve_font(name: str, bold: bool) -> tuple[str | None, bool]:
+    """(フォントファイル, 疑似太字にするか)。見つからなければファイルは None (既定フォント)。"""
+    global _font_paths
+    if _font_paths is None:
+        try:
+            with open(FONT_CACHE_PATH) as f:
+                _font_paths = json.load(f)
+        except (OSError, ValueError):
+            _font_paths = {}
+
+    key = f"{name}|{'bold' if bold else 'regular'}"
+    entry = _font_paths.get(key)
+    if entry is not None and (entry[0] is None or os.path.exists(entry[0])):
+        return entry[0], entry[1]
+
+    # ここで初めてシステムフォントの一覧を走査する
+    path = pygame.font.match_font(name, bold=bold)
+    # 太字のファイルが無ければ SysFont と同様に通常体を太字描画する
+    synthetic_bold = bold and (path is None or path == pygame.font.match_font(name))
+    _font_paths[key] = [path, synthetic_bold]
+    try:
+        os.makedirs(os.path.dirname(FONT_CACHE_PATH), exist_ok=True)
+        with open(FONT_CACHE_PATH, "w") as f:
+            json.dump(_font_paths, f)
+    except OSError:
+        pass
+    return path, synthetic_bold
 
 
 # ──────────────────────────────────────
-#  ゲーム本体
+#  描画
 # ──────────────────────────────────────
-class Game:
-    def __init__(self):
-        self.reset()
-
-    def reset(self):
-        # ボード: None = 空, tuple = 色
-        self.board: list[list[tuple | None]] = [
-            [None] * COLS for _ in range(ROWS)
-        ]
-        self.score = 0
-        self.level = 1
-        self.lines = 0
-        self.game_over = False
-
-        self.bag: list[str] = []
-        self.current = self._next_piece()
-        self.next_piece = self._next_piece()
-
-        # ホールド
-        self.hold_piece: Tetromino | None = None
-        self.hold_used = False      # 1ターンに1回だけホールド可能
-
-        self.fall_interval = self._calc_interval()
-        self.fall_timer = 0
-        self.lock_delay = 500       # ms
-        self.lock_timer = 0
-        self.on_ground = False
-
-        # T-Spin 判定用
-        self.last_action = ""       # "rotate" or "move"
-        self.last_kick_index = 0    # 使用した SRS キックのインデックス
-        self.last_tspin = ""        # 直前の消去で判定された T-Spin 種別
-
-        # アニメーション
-        self.clearing_rows: list[int] = []
-        self.clear_timer = 0
-        self.clear_duration = 250   # ms
-
-    def _refill_bag(self):
-        """7-bag ランダム生成"""
-        bag = list(SHAPES.keys())
-        random.shuffle(bag)
-        self.bag = bag
-
-    def _next_piece(self) -> Tetromino:
-        if not self.bag:
-            self._refill_bag()
-        return Tetromino(self.bag.pop())
-
-    def _calc_interval(self) -> int:
-        """レベルに応じた落下間隔 (ms)"""
-        return max(80, 800 - (self.level - 1) * 70)
-
-    def _valid_pos(self, cells: list[tuple[int, int]]) -> bool:
-        for x, y in cells:
-            if x < 0 or x >= COLS:
-                return False
-            if y >= ROWS:
-                return False
-            if y >= 0 and self.board[y][x] is not None:
-                return False
-        return True
-
-    # ── 操作 ──
-    def move(self, dx: int, dy: int) -> bool:
-        self.current.x += dx
-        self.current.y += dy
-        if not self._valid_pos(self.current.cells()):
-            self.current.x -= dx
-            self.current.y -= dy
-            return False
-        self.last_action = "move"
-        return True
-
-    def rotate(self, direction: int = 1):
-        """SRS ウォールキック付き回転"""
-        piece = self.current
-        from_rot = piece.rotation
-        to_rot = (from_rot + direction) % 4
-
-        # キックテーブル選択
-        if piece.name == "O":
-            # O ピースは回転不要
-            return
-        if piece.name == "I":
-            kicks = SRS_KICKS_I.get((from_rot, to_rot), [(0, 0)])
-        else:
-            kicks = SRS_KICKS_JLSTZ.get((from_rot, to_rot), [(0, 0)])
-
-        for i, (kick_dx, kick_dy) in enumerate(kicks):
-            test_cells = [
-                (piece.x + dx + kick_dx, piece.y + dy - kick_dy)
-                for dx, dy in SHAPES[piece.name][to_rot]
-            ]
-            if self._valid_pos(test_cells):
-                piece.rotation = to_rot
-                piece.x += kick_dx
-                piece.y -= kick_dy    # SRS の dy は上が正
-                self.last_action = "rotate"
-                self.last_kick_index = i
-                return
-
-    def hold(self):
-        """現在のピースをホールドし、保留中のピースと交換する。"""
-        if self.hold_used:
-            return  # 1ターンに1回のみ
-
-        self.hold_used = True
-        if self.hold_piece is None:
-            # 初回ホールド: current を保管し、次のピースを出す
-            self.hold_piece = Tetromino(self.current.name)
-            self.current = self.next_piece
-            self.next_piece = self._next_piece()
-        else:
-            # 2回目以降: current と hold を交換
-            old_name = self.hold_piece.name
-            self.hold_piece = Tetromino(self.current.name)
-            self.current = Tetromino(old_name)
-
-        # 状態リセット
-        self.on_ground = False
-        self.lock_timer = 0
-        self.fall_timer = 0
-        self.last_action = "hold"
-
-        if not self._valid_pos(self.current.cells()):
-            self.game_over = True
-
-    def hard_drop(self):
-        while self.move(0, 1):
-            self.score += 2
-        self._lock()
-
-    def ghost_y(self) -> int:
-        """ゴーストピースの Y オフセット"""
-        dy = 0
-        while True:
-            test = [(x, y + dy + 1) for x, y in self.current.cells()]
-            if not self._valid_pos(test):
-                return dy
-            dy += 1
-
-    # ── T-Spin 判定 ──
-    def _check_tspin(self) -> str:
-        """T-Spin の種類を判定する。"" → '', 'mini', 'full'"""
-        if self.current.name != "T" or self.last_action != "rotate":
-            return ""
-
-        # T ピースの中心座標を算出（回転状態に応じて）
-        # T の形状は常に (1,1) が中心
-        cx = self.current.x + 1
-        cy = self.current.y + 1
-
-        # 4 隅のうち埋まっている数をカウント
-        filled = 0
-        for dx, dy in T_CORNERS:
-            nx, ny = cx + dx, cy + dy
-            if nx < 0 or nx >= COLS or ny < 0 or ny >= ROWS:
-                filled += 1  # 壁/床もブロック扱い
-            elif self.board[ny][nx] is not None:
-                filled += 1
-
-        if filled < 3:
-            return ""
-
-        # 前方 2 隅が埋まっているなら正規 T-Spin
-        front_filled = 0
-        for dx, dy in T_FRONT_CORNERS[self.current.rotation]:
-            nx, ny = cx + dx, cy + dy
-            if nx < 0 or nx >= COLS or ny < 0 or ny >= ROWS:
-                front_filled += 1
-            elif self.board[ny][nx] is not None:
-                front_filled += 1
-
-        if front_filled == 2:
-            return "full"
-
-        # キックインデックスが 4（最後のオフセット）なら正規 T-Spin
-        if self.last_kick_index == 4:
-            return "full"
-
-        return "mini"
-
-    # ── 固定 & ライン消去 ──
-    def _lock(self):
-        # T-Spin 判定（ボードにセットする前に行う）
-        tspin = self._check_tspin()
-
-        for x, y in self.current.cells():
-            if 0 <= y < ROWS and 0 <= x < COLS:
-                self.board[y][x] = self.current.color
-            elif y < 0:
-                self.game_over = True
-                return
-
-        # ライン消去チェック
-        full_rows = [
-            r for r in range(ROWS)
-            if all(self.board[r][c] is not None for c in range(COLS))
-        ]
-        if full_rows:
-            self.clearing_rows = full_rows
-            self.clear_timer = self.clear_duration
-            self.last_tspin = tspin
-        else:
-            # ライン消去なしでも T-Spin 0 行ボーナス
-            if tspin == "full":
-                self.score += 400
-                self.last_tspin = tspin
-            elif tspin == "mini":
-                self.score += 100
-                self.last_tspin = tspin
-            else:
-                self.last_tspin = ""
-            self._spawn_next()
-
-    def _clear_lines(self):
-        num = len(self.clearing_rows)
-        tspin = self.last_tspin
-        for r in sorted(self.clearing_rows):
-            del self.board[r]
-            self.board.insert(0, [None] * COLS)
-
-        self.lines += num
-
-        # スコア計算 (T-Spin ボーナス)
-        if tspin == "full":
-            # T-Spin Single=800, Double=1200, Triple=1600
-            tspin_scores = {1: 800, 2: 1200, 3: 1600}
-            self.score += tspin_scores.get(num, 800)
-        elif tspin == "mini":
-            # T-Spin Mini Single=200, Double=400
-            mini_scores = {1: 200, 2: 400}
-            self.score += mini_scores.get(num, 200)
-        else:
-            self.score += LINE_SCORES.get(num, 800)
-
-        self.level = self.lines // 10 + 1
-        self.fall_interval = self._calc_interval()
-        self.clearing_rows = []
-        self.last_tspin = ""
-        self._spawn_next()
-
-    def _spawn_next(self):
-        self.current = self.next_piece
-        self.next_piece = self._next_piece()
-        self.on_ground = False
-        self.lock_timer = 0
-        self.hold_used = False   # 新しいピースでホールド解禁
-
-        if not self._valid_pos(self.current.cells()):
-            self.game_over = True
-
-    # ── 更新 ──
-    def update(self, dt: int):
-        if self.game_over:
-            return
+class RenderCache:
+    """キー → Surface の LRU キャッシュ。上限を超えたら最も古いものから捨てる。"""
 
-        # ライン消去アニメーション中
-        if self.clearing_rows:
-            self.clear_timer -= dt
-            if self.clear_timer <= 0:
-                self._clear_lines()
-            return
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self._items: OrderedDict = OrderedDict()
 
-        # 自然落下
-        self.fall_timer += dt
-        if self.fall_timer >= self.fall_interval:
-            self.fall_timer = 0
-            if not self.move(0, 1):
-                # 地面に到達
-                if self.on_ground:
-                    self.lock_timer += self.fall_interval
-                    if self.lock_timer >= self.lock_delay:
-                        self._lock()
-                else:
-                    self.on_ground = True
-                    self.lock_timer = 0
-            else:
-                self.on_ground = False
-                self.lock_timer = 0
+    def get(self, key, factory) -> pygame.Surface:
+        surf = self._items.get(key)
+        if surf is not None:
+            self._items.move_to_end(key)
+            return surf
+        surf = factory()
+        self._items[key] = surf
+        if len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+        return surf
+
+    def __len__(self) -> int:
+        return len(self._items)
 
 
-# ──────────────────────────────────────
-#  描画
-# ──────────────────────────────────────
 class Renderer:
     def __init__(self, screen: pygame.Surface):
         self.screen = screen
         self.board_x = 10
         self.board_y = TOP_MARGIN
-        self.font_large = pygame.font.SysFont("Segoe UI", 28, bold=True)
-        self.font_mid = pygame.font.SysFont("Segoe UI", 20, bold=True)
-        self.font_small = pygame.font.SysFont("Segoe UI", 16)
-
-    def draw(self, game: Game):
-        self.screen.fill(BG_COLOR)
-        self._draw_board_bg()
-        self._draw_grid(game)
-        self._draw_ghost(game)
-        self._draw_current(game)
-        self._draw_clearing(game)
-        self._draw_side_panel(game)
-        if game.game_over:
-            self._draw_game_over()
+        self.font_large = load_font(FONT_NAME, 28, bold=True)
+        self.font_mid = load_font(FONT_NAME, 20, bold=True)
+        self.font_small = load_font(FONT_NAME, 16)
 
-    def _draw_board_bg(self):
+        self.panel_rect = pygame.Rect(
+            self.board_x + COLS * CELL + 10, self.board_y,
+            SIDE_W - 20, ROWS * CELL
+        )
+        # (色, アルファ, サイズ) → 描画済みブロック
+        self._sprites: dict[tuple, pygame.Surface] = {}
+        # 文字列・プレビューの描画結果 (内容が変わったときだけ描き直す)
+        self._cache = RenderCache()
+        # サイドパネル全体を合成した画像
+        self._panel = pygame.Surface(self.panel_rect.size, 0, self.screen)
+        # 背景 + ボード枠 + グリッド線 + パネル背景 (変化しない部分)
+        self._background = self._build_background()
+
+        # ダーティ矩形用: 前フレームに各セルへ描いた内容と、パネル / オーバーレイの状態
+        self._frame: list = [None] * (ROWS * COLS)
+        self._shown: list | None = None
+        self._panel_state: tuple | None = None
+        self._overlay_shown = False
+        # セルの上に重ねて描いた操作中のピース: (形, 回転, x, y, 落下のピクセル数) と覆ったセル
+        self._piece_shown: tuple | None = None
+        self._piece_cells: list[int] = []
+
+    # ── キャッシュ ──
+    def _build_background(self) -> pygame.Surface:
+        bg = pygame.Surface((SCREEN_W, SCREEN_H), 0, self.screen)
+        bg.fill(BG_COLOR)
         rect = pygame.Rect(
             self.board_x, self.board_y,
             COLS * CELL, ROWS * CELL
         )
-        pygame.draw.rect(self.screen, (12, 12, 22), rect)
-        pygame.draw.rect(self.screen, PANEL_BORDER, rect, 2)
-
-    def _draw_cell(self, x: int, y: int, color: tuple, alpha: int = 255):
-        px = self.board_x + x * CELL
-        py = self.board_y + y * CELL
-
+        pygame.draw.rect(bg, (12, 12, 22), rect)
+        pygame.draw.rect(bg, PANEL_BORDER, rect, 2)
+        for r in range(ROWS):
+            for c in range(COLS):
+                px = self.board_x + c * CELL
+                py = self.board_y + r * CELL
+                pygame.draw.rect(bg, GRID_COLOR, (px, py, CELL, CELL), 1)
+        pygame.draw.rect(bg, PANEL_BG, self.panel_rect, border_radius=8)
+        pygame.draw.rect(bg, PANEL_BORDER, self.panel_rect, 2, border_radius=8)
+        return bg
+
+    def _sprite(self, color: tuple, alpha: int = 255,
+                size: int = CELL) -> pygame.Surface:
+        """ブロック 1 個ぶんの画像を返す。初回だけ描画してキャッシュする。"""
+        key = (color, alpha, size)
+        surf = self._sprites.get(key)
+        if surf is not None:
+            return surf
+
+        hl = tuple(min(c + 60, 255) for c in color)
+        sh = tuple(max(c - 80, 0) for c in color)
+        last = size - 1
         if alpha < 255:
-            surf = pygame.Surface((CELL, CELL), pygame.SRCALPHA)
+            surf = pygame.Surface((size, size), pygame.SRCALPHA)
             # ベース
             surf.fill((*color, alpha))
             # ハイライト (上・左)
-            hl = tuple(min(c + 60, 255) for c in color)
-            pygame.draw.line(surf, (*hl, alpha), (0, 0), (CELL - 1, 0), 2)
-            pygame.draw.line(surf, (*hl, alpha), (0, 0), (0, CELL - 1), 2)
+            pygame.draw.line(surf, (*hl, alpha), (0, 0), (last, 0), 2)
+            pygame.draw.line(surf, (*hl, alpha), (0, 0), (0, last), 2)
             # シャドウ (下・右)
-            sh = tuple(max(c - 80, 0) for c in color)
-            pygame.draw.line(surf, (*sh, alpha), (0, CELL - 1), (CELL - 1, CELL - 1), 2)
-            pygame.draw.line(surf, (*sh, alpha), (CELL - 1, 0), (CELL - 1, CELL - 1), 2)
-            self.screen.blit(surf, (px, py))
+            pygame.draw.line(surf, (*sh, alpha), (0, last), (last, last), 2)
+            pygame.draw.line(surf, (*sh, alpha), (last, 0), (last, last), 2)
         else:
-            rect = pygame.Rect(px, py, CELL, CELL)
-            pygame.draw.rect(self.screen, color, rect)
+            surf = pygame.Surface((size, size), 0, self.screen)
+            surf.fill(color)
             # ハイライト
-            hl = tuple(min(c + 60, 255) for c in color)
-            pygame.draw.line(self.screen, hl, (px, py), (px + CELL - 1, py), 2)
-            pygame.draw.line(self.screen, hl, (px, py), (px, py + CELL - 1), 2)
+            pygame.draw.line(surf, hl, (0, 0), (last, 0), 2)
+            pygame.draw.line(surf, hl, (0, 0), (0, last), 2)
             # シャドウ
-            sh = tuple(max(c - 80, 0) for c in color)
-            pygame.draw.line(self.screen, sh, (px, py + CELL - 1), (px + CELL - 1, py + CELL - 1), 2)
-            pygame.draw.line(self.screen, sh, (px + CELL - 1, py), (px + CELL - 1, py + CELL - 1), 2)
-            # 内側の光沢
-            inner = pygame.Rect(px + 4, py + 4, CELL - 8, CELL - 8)
+            pygame.draw.line(surf, sh, (0, last), (last, last), 2)
+            pygame.draw.line(surf, sh, (last, 0), (last, last), 2)
+            # 内側の光沢 (プレビュー用の小さいブロックは余白を詰める)
+            inset = 4 if size >= CELL else 3
             gl = tuple(min(c + 30, 255) for c in color)
-            pygame.draw.rect(self.screen, gl, inner)
+            pygame.draw.rect(surf, gl, (inset, inset, size - inset * 2, size - inset * 2))
+        self._sprites[key] = surf
+        return surf
+
+    # ── 描画 ──
+    def draw(self, game: Game, alpha: float = 0.0) -> list[pygame.Rect]:
+        """変化した部分だけを描き直し、更新が必要な矩形のリストを返す。
+        alpha は最後のティックから次のティックまでの経過割合 (0〜1) で、
+        時間で変化する表示 (自然落下・消去アニメーション) をティックの間で補間する。"""
+        if game.game_over and self._overlay_shown:
+            return []       # オーバーレイ表示中は画面が変わらない
+        full = self._shown is None or self._overlay_shown
+        if full:
+            self._draw_board_bg()
+            self._shown = [()] * (ROWS * COLS)
+            self._panel_state = None
+            self._overlay_shown = False
+
+        frame = self._frame
+        for i in range(ROWS * COLS):
+            frame[i] = None
+        self._draw_grid(game)
+        self._draw_ghost(game)
+        self._draw_clearing(game, alpha)
+        piece = self._piece_key(game, alpha)
+        if piece != self._piece_shown:
+            for i in self._piece_cells:
+                self._shown[i] = ()     # 前フレームのピースの下を描き直させる
+        dirty = self._flush_cells()
+        dirty += self._draw_current(game, piece, dirty)
+        dirty += self._draw_side_panel(game, full)
+
+        if game.game_over:
+            self._draw_game_over()
+            self._overlay_shown = True
+            full = True
+        if full:
+            return [self.screen.get_rect()]
+        return dirty
+
+    def _draw_board_bg(self):
+        self.screen.blit(self._background, (0, 0))
+
+    def clear_area(self, rect: pygame.Rect):
+        """rect の範囲を背景で塗り直す (盤面・パネル外のオーバーレイ用)。"""
+        self.screen.blit(self._background, rect, rect)
+
+    def _draw_cell(self, x: int, y: int, color: tuple, alpha: int = 255):
+        px = self.board_x + x * CELL
+        py = self.board_y + y * CELL
+        self.screen.blit(self._sprite(color, alpha), (px, py))
 
     def _draw_grid(self, game: Game):
+        frame = self._frame
+        clearing = game.clearing_rows
         for r in range(ROWS):
+            # 消去アニメーション行には描画しない
+            if not game.board[r] or r in clearing:
+                continue
+            row = game.colors[r]
             for c in range(COLS):
-                color = game.board[r][c]
-                if color is not None:
-                    # 消去アニメーション行には描画しない
-                    if r not in game.clearing_rows:
-                        self._draw_cell(c, r, color)
-
-                # グリッド線
-                px = self.board_x + c * CELL
-                py = self.board_y + r * CELL
-                pygame.draw.rect(self.screen, GRID_COLOR, (px, py, CELL, CELL), 1)
+                if row[c] is not None:
+                    frame[r * COLS + c] = ("block", row[c])
 
     def _draw_ghost(self, game: Game):
         if game.game_over or game.clearing_rows:
             return
-        dy = game.ghost_y()
-        for x, y in game.current.cells():
-            gy = y + dy
-            if 0 <= gy < ROWS and 0 <= x < COLS:
-                self._draw_cell(x, gy, game.current.color, alpha=50)
-
-    def _draw_current(self, game: Game):
-        if game.clearing_rows:
-            return
-        for x, y in game.current.cells():
+        piece = game.current
+        cell = ("ghost", piece.state.color)
+        px = piece.x
+        py = piece.y + game.ghost_y()
+        frame = self._frame
+        for dx, dy in piece.state.cells:
+            x = px + dx
+            y = py + dy
             if 0 <= y < ROWS and 0 <= x < COLS:
-                self._draw_cell(x, y, game.current.color)
+                frame[y * COLS + x] = cell
 
-    def _draw_clearing(self, game: Game):
+    def _piece_key(self, game: Game, alpha: float) -> tuple | None:
+        """操作中のピースの描く位置。自然落下の途中なら、次の 1 段までの進み具合を
+        ピクセル数で持つ (ティックの間も滑らかに落ちて見える)。"""
+        if game.clearing_rows:
+            return None
+        piece = game.current
+        shift = 0
+        if not game.game_over and game.ghost_y():
+            progress = (game.fall_timer + alpha * TICK_MS) / game.fall_interval
+            shift = int(min(progress, 1.0) * CELL)
+        return piece.name, piece.rotation, piece.x, piece.y, shift
+
+    def _draw_current(self, game: Game, key: tuple | None,
+                      dirty: list[pygame.Rect]) -> list[pygame.Rect]:
+        """操作中のピースをセルの上に重ねて描く。位置が変わらず、下のセルも
+        描き直していなければ何もしない。"""
+        if key is None:
+            self._piece_shown, self._piece_cells = None, []
+            return []
+        piece = game.current
+        shift = key[4]
+        rects = []
+        cells = []
+        for dx, dy in piece.state.cells:
+            x, y = piece.x + dx, piece.y + dy
+            rects.append(pygame.Rect(self.board_x + x * CELL,
+                                     self.board_y + y * CELL + shift, CELL, CELL))
+            for row in (y, y + 1) if shift else (y,):
+                if 0 <= row < ROWS and 0 <= x < COLS:
+                    cells.append(row * COLS + x)
+        if key == self._piece_shown and rects[0].unionall(rects).collidelist(dirty) < 0:
+            return []
+        self._piece_shown, self._piece_cells = key, cells
+
+        board = pygame.Rect(self.board_x, self.board_y, COLS * CELL, ROWS * CELL)
+        sprite = self._sprite(piece.state.color)
+        self.screen.set_clip(board)         # 盤面より上にはみ出した部分は描かない
+        for rect in rects:
+            self.screen.blit(sprite, rect)
+        self.screen.set_clip(None)
+        return [rects[0].unionall(rects).clip(board)]
+
+    def _draw_clearing(self, game: Game, alpha: float = 0.0):
         """消去行のフラッシュアニメーション"""
         if not game.clearing_rows:
             return
-        progress = 1.0 - game.clear_timer / game.clear_duration
+        remaining = max(0.0, game.clear_timer - alpha * TICK_MS)
+        progress = 1.0 - remaining / game.clear_duration
         flash = int(255 * abs((progress * 4) % 2 - 1))
         for r in game.clearing_rows:
             for c in range(COLS):
-                px = self.board_x + c * CELL
-                py = self.board_y + r * CELL
-                pygame.draw.rect(
-                    self.screen, (flash, flash, flash),
-                    (px, py, CELL, CELL)
-                )
-
-    def _draw_side_panel(self, game: Game):
-        panel_x = self.board_x + COLS * CELL + 10
-        panel_y = self.board_y
+                self._frame[r * COLS + c] = ("flash", flash)
+
+    def _flush_cells(self) -> list[pygame.Rect]:
+        """前フレームと内容が変わったセルだけを画面に描く。"""
+        dirty = []
+        shown = self._shown
+        screen = self.screen
+        for i, cell in enumerate(self._frame):
+            if cell == shown[i]:
+                continue
+            shown[i] = cell
+            r, c = divmod(i, COLS)
+            rect = pygame.Rect(self.board_x + c * CELL, self.board_y + r * CELL, CELL, CELL)
+            if cell is None:
+                screen.blit(self._background, rect, rect)
+            elif cell[0] == "flash":
+                screen.fill((cell[1],) * 3, rect)
+            elif cell[0] == "ghost":
+                screen.blit(self._background, rect, rect)
+                screen.blit(self._sprite(cell[1], 50), rect)
+            else:
+                screen.blit(self._sprite(cell[1]), rect)
+                if cell[0] == "block":
+                    # 固定済みブロックにはグリッド線が重なる
+                    pygame.draw.rect(screen, GRID_COLOR, rect, 1)
+            dirty.append(rect)
+        return dirty
+
+    def _text(self, font: pygame.font.Font, text: str,
+              color: tuple) -> pygame.Surface:
+        return self._cache.get(
+            ("text", id(font), text, color),
+            lambda: font.render(text, True, color),
+        )
 
+    def _draw_side_panel(self, game: Game, force: bool = False) -> list[pygame.Rect]:
+        """値が変わったときだけパネルを合成し直す。変化が無ければ何も描かない。"""
+        hold = game.hold_piece.name if game.hold_piece is not None else None
+        state = (game.score, game.level, game.lines, hold, game.next_piece.name)
+        if state != self._panel_state:
+            self._panel_state = state
+            self._compose_panel(game)
+        elif not force:
+            return []
+        self.screen.blit(self._panel, self.panel_rect)
+        return [self.panel_rect]
+
+    def _compose_panel(self, game: Game):
+        panel = self._panel
         # パネル背景
-        panel_rect = pygame.Rect(panel_x, panel_y, SIDE_W - 20, ROWS * CELL)
-        pygame.draw.rect(self.screen, PANEL_BG, panel_rect, border_radius=8)
-        pygame.draw.rect(self.screen, PANEL_BORDER, panel_rect, 2, border_radius=8)
+        panel.blit(self._background, (0, 0), self.panel_rect)
 
-        cx = panel_x + (SIDE_W - 20) // 2
-        y = panel_y + 15
+        cx = (SIDE_W - 20) // 2
+        y = 15
 
         # タイトル
-        title = self.font_large.render("TETRIS", True, (100, 200, 255))
-        self.screen.blit(title, (cx - title.get_width() // 2, y))
+        title = self._text(self.font_large, "TETRIS", (100, 200, 255))
+        panel.blit(title, (cx - title.get_width() // 2, y))
         y += 45
 
         # SCORE
-        self._draw_label_value(cx, y, "SCORE", str(game.score))
+        self._draw_label_value(panel, cx, y, "SCORE", str(game.score))
         y += 55
 
         # LEVEL
-        self._draw_label_value(cx, y, "LEVEL", str(game.level))
+        self._draw_label_value(panel, cx, y, "LEVEL", str(game.level))
         y += 55
 
         # LINES
-        self._draw_label_value(cx, y, "LINES", str(game.lines))
+        self._draw_label_value(panel, cx, y, "LINES", str(game.lines))
         y += 70
 
         # HOLD
-        label = self.font_mid.render("HOLD", True, TEXT_DIM)
-        self.screen.blit(label, (cx - label.get_width() // 2, y))
+        label = self._text(self.font_mid, "HOLD", TEXT_DIM)
+        panel.blit(label, (cx - label.get_width() // 2, y))
         y += 30
         if game.hold_piece is not None:
-            self._draw_preview(game.hold_piece, cx, y)
+            self._draw_preview(panel, game.hold_piece, cx, y)
         else:
-            empty = self.font_small.render("---", True, TEXT_DIM)
-            self.screen.blit(empty, (cx - empty.get_width() // 2, y + 10))
+            empty = self._text(self.font_small, "---", TEXT_DIM)
+            panel.blit(empty, (cx - empty.get_width() // 2, y + 10))
         y += 75
 
         # NEXT
-        label = self.font_mid.render("NEXT", True, TEXT_DIM)
-        self.screen.blit(label, (cx - label.get_width() // 2, y))
+        label = self._text(self.font_mid, "NEXT", TEXT_DIM)
+        panel.blit(label, (cx - label.get_width() // 2, y))
         y += 30
 
         # Next ピース描画
-        self._draw_preview(game.next_piece, cx, y)
-
-    def _draw_label_value(self, cx: int, y: int, label: str, value: str):
-        lbl = self.font_small.render(label, True, TEXT_DIM)
-        self.screen.blit(lbl, (cx - lbl.get_width() // 2, y))
-        val = self.font_mid.render(value, True, TEXT_COLOR)
-        self.screen.blit(val, (cx - val.get_width() // 2, y + 20))
+        self._draw_preview(panel, game.next_piece, cx, y)
+
+    def _draw_label_value(self, surf: pygame.Surface, cx: int, y: int,
+                          label: str, value: str):
+        lbl = self._text(self.font_small, label, TEXT_DIM)
+        surf.blit(lbl, (cx - lbl.get_width() // 2, y))
+        val = self._text(self.font_mid, value, TEXT_COLOR)
+        surf.blit(val, (cx - val.get_width() // 2, y + 20))
+
+    def _preview(self, name: str) -> pygame.Surface:
+        """ピースの回転 0 の形を小さいブロックで描いた画像 (透過)"""
+        state = PIECE_STATES[name][0]
+        small = CELL - 4
+        surf = pygame.Surface(
+            ((state.max_dx - state.min_dx + 1) * small, (state.max_dy - state.min_dy + 1) * small),
+            pygame.SRCALPHA,
+        )
+        sprite = self._sprite(state.color, 255, small)
+        for dx, dy in state.cells:
+            surf.blit(sprite, ((dx - state.min_dx) * small, (dy - state.min_dy) * small))
+        return surf
 
-    def _draw_preview(self, piece: Tetromino, cx: int, top_y: int):
-        cells = SHAPES[piece.name][0]
+    def _draw_preview(self, surf: pygame.Surface, piece: Tetromino,
+                      cx: int, top_y: int):
         # 中央揃え
-        min_x = min(x for x, _ in cells)
-        max_x = max(x for x, _ in cells)
-        min_y = min(y for _, y in cells)
-        max_y = max(y for _, y in cells)
-        w = (max_x - min_x + 1) * (CELL - 4)
-        h = (max_y - min_y + 1) * (CELL - 4)
-        off_x = cx - w // 2
-        off_y = top_y
-
-        small = CELL - 4
-        for dx, dy in cells:
-            px = off_x + (dx - min_x) * small
-            py = off_y + (dy - min_y) * small
-            rect = pygame.Rect(px, py, small, small)
-            pygame.draw.rect(self.screen, piece.color, rect)
-            hl = tuple(min(c + 60, 255) for c in piece.color)
-            pygame.draw.line(self.screen, hl, (px, py), (px + small - 1, py), 2)
-            pygame.draw.line(self.screen, hl, (px, py), (px, py + small - 1), 2)
-            sh = tuple(max(c - 80, 0) for c in piece.color)
-            pygame.draw.line(self.screen, sh,
-                             (px, py + small - 1), (px + small - 1, py + small - 1), 2)
-            pygame.draw.line(self.screen, sh,
-                             (px + small - 1, py), (px + small - 1, py + small - 1), 2)
-            inner = pygame.Rect(px + 3, py + 3, small - 6, small - 6)
-            gl = tuple(min(c + 30, 255) for c in piece.color)
-            pygame.draw.rect(self.screen, gl, inner)
+        image = self._cache.get(("preview", piece.name), lambda: self._preview(piece.name))
+        surf.blit(image, (cx - image.get_width() // 2, top_y))
 
     def _draw_game_over(self):
         overlay = pygame.Surface((SCREEN_W, SCREEN_H), pygame.SRCALPHA)
@@ -654,68 +463,151 @@ class Renderer:
 
         cx, cy = SCREEN_W // 2, SCREEN_H // 2
 
-        go_text = self.font_large.render("GAME OVER", True, (255, 80, 80))
+        go_text = self._text(self.font_large, "GAME OVER", (255, 80, 80))
         self.screen.blit(go_text, (cx - go_text.get_width() // 2, cy - 30))
 
-        hint = self.font_small.render("Press R to Restart", True, TEXT_COLOR)
+        hint = self._text(self.font_small, "Press R to Restart", TEXT_COLOR)
         self.screen.blit(hint, (cx - hint.get_width() // 2, cy + 15))
 
 
 # ──────────────────────────────────────
 #  メインループ
 # ──────────────────────────────────────
-def main():
-    pygame.init()
+# キー → 入力コード
+# 押した瞬間に 1 回だけ働くキー (左右・下は AutoShift がキー状態を見て処理する)
+KEY_INPUTS = {
+    pygame.K_UP: INPUT_ROTATE,
+    pygame.K_SPACE: INPUT_HARD_DROP,
+    pygame.K_c: INPUT_HOLD,
+}
+
+
+def main(bot=None, seed: int | None = None, record: str | None = None,
+         profile: str | None = None, telemetry: str | None = None):
+    """bot (tetris_bot.Bot など play(game) を持つもの) を渡すとキー入力の代わりに操作する。
+    record にパスを渡すと、入力と経過時間をリプレイファイルに書き出しながら遊ぶ。
+    profile にパスを渡すとフレームごとの処理時間を計測し、終了時に書き出す (F3 で表示)。
+    telemetry にパスを渡すとピースごとのイベントをバックグラウンドで書き出す。
+    Backspace で直前に置いたピースを取り消す (記録中はリプレイと食い違うので無効)。"""
+    # 使うモジュールだけ初期化する (pygame.init() は音声やジョイスティックも開くので遅い)
+    pygame.display.init()
+    pygame.font.init()
     screen = pygame.display.set_mode((SCREEN_W, SCREEN_H))
     pygame.display.set_caption("テトリス")
     clock = pygame.time.Clock()
 
-    game = Game()
+    game = Game(seed)
     renderer = Renderer(screen)
 
-    # キーリピート: 初回 170ms, 以降 50ms
-    pygame.key.set_repeat(170, 50)
-
+    recorder = None
+    if record is not None:
+        from tetris_replay import ReplayWriter
+        recorder = ReplayWriter(record, game)
+
+    events = None
+    if telemetry is not None:
+        from tetris_telemetry import TelemetryWriter
+        events = TelemetryWriter(telemetry, game)
+
+    profiler = None
+    if profile is not None:
+        from tetris_profile import FrameProfiler
+        profiler = FrameProfiler()
+        profiler.instrument(renderer)
+
+    def quit_game():
+        if recorder is not None:
+            recorder.close(game)
+        if events is not None:
+            events.close(game)
+        if profiler is not None:
+            profiler.export(profile)
+        pygame.quit()
+        sys.exit()
+
+    # シミュレーションは TICK_MS 刻みの固定ティック、描画は FPS を上限に可変。
+    # 描画が遅れても落下・ロック遅延・DAS は実時間どおりに進む。
+    shift = AutoShift()
+    rewind = RewindBuffer() if record is None else None
+    perf = time.perf_counter
+    accumulator = 0.0
+    last = perf()
     while True:
-        dt = clock.tick(FPS)
+        t_start = perf()
+        clock.tick(FPS)
+        t_tick = perf()
+        accumulator += (t_tick - last) * 1000
+        last = t_tick
 
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
-                pygame.quit()
-                sys.exit()
+                quit_game()
 
             if event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_ESCAPE:
-                    pygame.quit()
-                    sys.exit()
+                    quit_game()
+
+                if event.key == pygame.K_F3 and profiler is not None:
+                    profiler.toggle_overlay()
+                    continue
+
+                if (event.key == pygame.K_BACKSPACE and rewind is not None
+                        and bot is None and not game.clearing_rows):
+                    if rewind.undo(game):
+                        shift.reset()
+                    continue
 
                 if game.game_over:
                     if event.key == pygame.K_r:
-                        game.reset()
+                        game.handle_input(INPUT_RESTART)
+                        shift.reset()
+                        if rewind is not None:
+                            rewind.clear()
                     continue
 
-                if game.clearing_rows:
+                if game.clearing_rows or bot is not None:
                     continue
 
-                if event.key == pygame.K_LEFT:
-                    game.move(-1, 0)
-                elif event.key == pygame.K_RIGHT:
-                    game.move(1, 0)
-                elif event.key == pygame.K_DOWN:
-                    if game.move(0, 1):
-                        game.score += 1
-                        game.fall_timer = 0
-                elif event.key == pygame.K_UP:
-                    game.rotate()
-                elif event.key == pygame.K_SPACE:
-                    game.hard_drop()
-                elif event.key == pygame.K_c:
-                    game.hold()
-
-        game.update(dt)
-        renderer.draw(game)
-        pygame.display.flip()
+                code = KEY_INPUTS.get(event.key)
+                if code is not None:
+                    game.handle_input(code)
+        t_events = perf()
+
+        if bot is not None and not game.game_over and not game.clearing_rows:
+            bot.play(game)
+
+        keys = pygame.key.get_pressed()
+        ticks = 0
+        while accumulator >= TICK_MS:
+            if ticks == MAX_TICKS_PER_FRAME:
+                accumulator = 0.0       # 追いつけない分は捨てる
+                break
+            if bot is None:
+                shift.tick(game, keys[pygame.K_LEFT], keys[pygame.K_RIGHT], keys[pygame.K_DOWN])
+            game.update(TICK_MS)
+            accumulator -= TICK_MS
+            ticks += 1
+        if rewind is not None:
+            rewind.track(game)
+        t_update = perf()
+        dirty = renderer.draw(game, accumulator / TICK_MS)
+        t_draw = perf()
+        if profiler is not None:
+            dirty += profiler.draw_overlay(renderer)
+        pygame.display.update(dirty)
+
+        if profiler is not None:
+            profiler.record_frame(t_start, t_tick, t_events, t_update, t_draw, perf())
 
 
 if __name__ == "__main__":
-    main()
+    import argparse
+    parser = argparse.ArgumentParser(description="テトリス")
+    parser.add_argument("--seed", type=int, default=None, help="7-bag の乱数シード")
+    parser.add_argument("--record", default=None, help="リプレイの保存先")
+    parser.add_argument("--profile", default=None,
+                        help="フレーム計測の書き出し先 (.json / .csv)")
+    parser.add_argument("--telemetry", default=None,
+                        help="イベントログの書き出し先 (.ndjson / .jsonl ならテキスト、他はバイナリ)")
+    args = parser.parse_args()
+    main(seed=args.seed, record=args.record, profile=args.profile, telemetry=args.telemetry)
@@ -0,0 +1,416 @@
+"""
+テトリス — NumPy バッチ環境
+============================
+tetris.Game と同じルール (SRS キック / 7-bag / スコア / T-Spin) で
+N 個の独立したゲームを同時に進める。セルフプレイのデータ生成用。
+
+ボード・ピース位置・回転・バッグ・スコアをすべて NumPy 配列で持ち、
+move / rotate / hard_drop / ロック / ライン消去をゲーム軸でベクトル化している。
+ライン消去アニメーションは無く、揃った行はロック時に即座に消える。
+
+行動コード (step に渡す):
+  0 NOOP  1 LEFT  2 RIGHT  3 SOFT_DROP  4 ROTATE_CW  5 ROTATE_CCW
+  6 HARD_DROP  7 HOLD
+"""
+
+import numpy as np
+
+from tetris_engine import (
+    COLS, ROWS, SHAPES, LINE_SCORES,
+    SRS_KICKS_JLSTZ, SRS_KICKS_I, T_CORNERS, T_FRONT_CORNERS,
+)
+
+# ──────────────────────────────────────
+#  定数
+# ──────────────────────────────────────
+NOOP, LEFT, RIGHT, SOFT_DROP, ROTATE_CW, ROTATE_CCW, HARD_DROP, HOLD = range(8)
+
+PIECE_NAMES = list(SHAPES.keys())
+KIND_I = PIECE_NAMES.index("I")
+KIND_O = PIECE_NAMES.index("O")
+KIND_T = PIECE_NAMES.index("T")
+
+# last_action の値
+ACT_NONE, ACT_MOVE, ACT_ROTATE, ACT_HOLD = range(4)
+
+# ── 壁付きビットボード ──
+# 1 行 = uint32。bit PAD..PAD+COLS-1 が盤面、それ以外のビットは壁として常に 1。
+# 盤面の上に TOP 行 (壁のみ)、下に FLOOR 行 (全ビット 1 = 床) を足しておくと、
+# 境界判定がマスクの AND だけで済む。
+PAD = 4
+TOP = 4
+FLOOR = 4
+HEIGHT = TOP + ROWS + FLOOR
+CELL_BITS = ((1 << COLS) - 1) << PAD
+SOLID_ROW = 0xFFFFFFFF
+WALL_ROW = SOLID_ROW ^ CELL_BITS
+MAX_SHIFT = 32 - 4
+
+DY = np.arange(4)
+
+
+def _build_tables():
+    """形状マスク・キック・スコアの参照表を NumPy 配列にする。"""
+    masks = np.zeros((len(PIECE_NAMES), 4, 4), dtype=np.uint32)
+    min_dy = np.zeros((len(PIECE_NAMES), 4), dtype=np.int64)
+    for k, name in enumerate(PIECE_NAMES):
+        for r, cells in enumerate(SHAPES[name]):
+            for dx, dy in cells:
+                masks[k, r, dy] |= 1 << dx
+            min_dy[k, r] = min(dy for _, dy in cells)
+
+    # kicks[kind, from_rot, dir(0=右回転, 1=左回転), i] = (dx, dy)
+    kicks = np.zeros((len(PIECE_NAMES), 4, 2, 5, 2), dtype=np.int64)
+    for k, name in enumerate(PIECE_NAMES):
+        if name == "O":
+            continue
+        table = SRS_KICKS_I if name == "I" else SRS_KICKS_JLSTZ
+        for frm in range(4):
+            for d, direction in enumerate((1, -1)):
+                kicks[k, frm, d] = table[(frm, (frm + direction) % 4)]
+
+    # score_table[tspin(0=なし, 1=mini, 2=full), 消去行数]
+    score_table = np.array([
+        [LINE_SCORES.get(n, 800) for n in range(5)],
+        [100, 200, 400, 200, 200],
+        [400, 800, 1200, 1600, 800],
+    ], dtype=np.int64)
+
+    front = np.array([T_FRONT_CORNERS[r] for r in range(4)], dtype=np.int64)
+    return masks, min_dy, kicks, score_table, front
+
+
+MASKS, MIN_DY, KICKS, SCORE_TABLE, FRONT_CORNERS = _build_tables()
+CORNERS = np.array(T_CORNERS, dtype=np.int64)
+
+
+# ──────────────────────────────────────
+#  バッチゲーム本体
+# ──────────────────────────────────────
+class BatchGame:
+    def __init__(self, n: int, seed: int | None = None):
+        self.n = n
+        self.rng = np.random.default_rng(seed)
+
+        self.board = np.empty((n, HEIGHT), dtype=np.uint32)
+        self.kind = np.zeros(n, dtype=np.int64)
+        self.x = np.zeros(n, dtype=np.int64)
+        self.y = np.zeros(n, dtype=np.int64)
+        self.rot = np.zeros(n, dtype=np.int64)
+        self.next_kind = np.zeros(n, dtype=np.int64)
+        self.hold_kind = np.full(n, -1, dtype=np.int64)    # -1 = ホールドなし
+        self.hold_used = np.zeros(n, dtype=bool)
+
+        # 7-bag: 末尾から取り出す (Game.bag.pop() と同じ順序)
+        self.bags = np.zeros((n, len(PIECE_NAMES)), dtype=np.int64)
+        self.bag_len = np.zeros(n, dtype=np.int64)
+
+        self.score = np.zeros(n, dtype=np.int64)
+        self.lines = np.zeros(n, dtype=np.int64)
+        self.level = np.ones(n, dtype=np.int64)
+        self.game_over = np.zeros(n, dtype=bool)
+
+        self.fall_interval = np.zeros(n, dtype=np.int64)
+        self.fall_timer = np.zeros(n, dtype=np.int64)
+        self.lock_delay = 500
+        self.lock_timer = np.zeros(n, dtype=np.int64)
+        self.on_ground = np.zeros(n, dtype=bool)
+
+        # T-Spin 判定用
+        self.last_action = np.zeros(n, dtype=np.int64)
+        self.last_kick = np.zeros(n, dtype=np.int64)
+        self.last_tspin = np.zeros(n, dtype=np.int64)     # 0=なし, 1=mini, 2=full
+        self.last_lines = np.zeros(n, dtype=np.int64)
+
+        self.reset()
+
+    def _select(self, mask) -> np.ndarray:
+        """mask (None = 全ゲーム) から、進行中のゲームのインデックスを返す。"""
+        if mask is None:
+            return np.flatnonzero(~self.game_over)
+        return np.flatnonzero(np.asarray(mask, dtype=bool) & ~self.game_over)
+
+    def reset(self, mask=None):
+        """mask で選んだゲーム (None = 全ゲーム) を初期状態に戻す。"""
+        idx = np.arange(self.n) if mask is None else np.flatnonzero(mask)
+        if not idx.size:
+            return
+        self.board[idx] = WALL_ROW
+        self.board[idx, TOP + ROWS:] = SOLID_ROW
+        self.score[idx] = 0
+        self.lines[idx] = 0
+        self.level[idx] = 1
+        self.game_over[idx] = False
+        self.bag_len[idx] = 0
+        self.hold_kind[idx] = -1
+        self.hold_used[idx] = False
+        self.fall_interval[idx] = self._calc_interval(self.level[idx])
+        self.fall_timer[idx] = 0
+        self.lock_timer[idx] = 0
+        self.on_ground[idx] = False
+        self.last_action[idx] = ACT_NONE
+        self.last_kick[idx] = 0
+        self.last_tspin[idx] = 0
+        self.last_lines[idx] = 0
+
+        self._set_piece(idx, self._next_kind(idx))
+        self.next_kind[idx] = self._next_kind(idx)
+
+    # ── バッグ / 生成 ──
+    def _next_kind(self, idx: np.ndarray) -> np.ndarray:
+        empty = idx[self.bag_len[idx] == 0]
+        if empty.size:
+            base = np.tile(np.arange(len(PIECE_NAMES)), (empty.size, 1))
+            self.bags[empty] = self.rng.permuted(base, axis=1)
+            self.bag_len[empty] = len(PIECE_NAMES)
+        self.bag_len[idx] -= 1
+        return self.bags[idx, self.bag_len[idx]]
+
+    def _set_piece(self, idx: np.ndarray, kind: np.ndarray):
+        self.kind[idx] = kind
+        self.x[idx] = COLS // 2 - 2
+        self.y[idx] = -1
+        self.rot[idx] = 0
+
+    @staticmethod
+    def _calc_interval(level: np.ndarray) -> np.ndarray:
+        return np.maximum(80, 800 - (level - 1) * 70)
+
+    # ── 衝突判定 ──
+    def _fits(self, idx, kind, rot, x, y) -> np.ndarray:
+        """各ゲームについて、(kind, rot) を (x, y) に置けるかを返す。"""
+        rows = np.clip(y[:, None] + (TOP + DY), 0, HEIGHT - 1)
+        shift = np.clip(x + PAD, 0, MAX_SHIFT).astype(np.uint32)
+        masks = MASKS[kind, rot] << shift[:, None]
+        return ~(self.board[idx[:, None], rows] & masks).any(axis=1)
+
+    def _spawn_check(self, idx: np.ndarray):
+        ok = self._fits(idx, self.kind[idx], self.rot[idx], self.x[idx], self.y[idx])
+        self.game_over[idx[~ok]] = True
+
+    # ── 操作 ──
+    def move(self, dx: int, dy: int, mask=None) -> np.ndarray:
+        """全ゲーム (または mask) を (dx, dy) 動かす。動けたゲームを bool 配列で返す。"""
+        idx = self._select(mask)
+        moved = np.zeros(self.n, dtype=bool)
+        if not idx.size:
+            return moved
+        nx = self.x[idx] + dx
+        ny = self.y[idx] + dy
+        ok = self._fits(idx, self.kind[idx], self.rot[idx], nx, ny)
+        hit = idx[ok]
+        self.x[hit] = nx[ok]
+        self.y[hit] = ny[ok]
+        self.last_action[hit] = ACT_MOVE
+        moved[hit] = True
+        return moved
+
+    def rotate(self, direction: int = 1, mask=None) -> np.ndarray:
+        """SRS ウォールキック付き回転。回転できたゲームを bool 配列で返す。"""
+        idx = self._select(mask)
+        idx = idx[self.kind[idx] != KIND_O]     # O ピースは回転不要
+        rotated = np.zeros(self.n, dtype=bool)
+        d = 0 if direction == 1 else 1
+        kind = self.kind[idx]
+        frm = self.rot[idx]
+        to = (frm + direction) % 4
+        pending = np.ones(idx.size, dtype=bool)
+
+        for i in range(5):
+            p = np.flatnonzero(pending)
+            if not p.size:
+                break
+            g = idx[p]
+            nx = self.x[g] + KICKS[kind[p], frm[p], d, i, 0]
+            ny = self.y[g] - KICKS[kind[p], frm[p], d, i, 1]    # SRS の dy は上が正
+            ok = self._fits(g, kind[p], to[p], nx, ny)
+            hit = g[ok]
+            self.x[hit] = nx[ok]
+            self.y[hit] = ny[ok]
+            self.rot[hit] = to[p][ok]
+            self.last_action[hit] = ACT_ROTATE
+            self.last_kick[hit] = i
+            rotated[hit] = True
+            pending[p[ok]] = False
+        return rotated
+
+    def soft_drop(self, mask=None) -> np.ndarray:
+        """1 マス落下 (+1 点)。キー入力の ↓ と同じ扱い。"""
+        moved = self.move(0, 1, mask)
+        self.score[moved] += 1
+        self.fall_timer[moved] = 0
+        return moved
+
+    def hold(self, mask=None):
+        idx = self._select(mask)
+        idx = idx[~self.hold_used[idx]]         # 1ターンに1回のみ
+        if not idx.size:
+            return
+        self.hold_used[idx] = True
+        old = self.hold_kind[idx]
+        self.hold_kind[idx] = self.kind[idx]
+
+        first = old < 0
+        # 初回ホールド: 次のピースを出す / 2回目以降: 交換
+        new_kind = np.where(first, self.next_kind[idx], old)
+        self._set_piece(idx, new_kind)
+        f = idx[first]
+        if f.size:
+            self.next_kind[f] = self._next_kind(f)
+
+        self.on_ground[idx] = False
+        self.lock_timer[idx] = 0
+        self.fall_timer[idx] = 0
+        self.last_action[idx] = ACT_HOLD
+        self._spawn_check(idx)
+
+    def hard_drop(self, mask=None):
+        idx = self._select(mask)
+        if not idx.size:
+            return
+        kind, rot, x = self.kind[idx], self.rot[idx], self.x[idx]
+        dist = np.zeros(idx.size, dtype=np.int64)
+        falling = np.ones(idx.size, dtype=bool)
+        while falling.any():
+            p = np.flatnonzero(falling)
+            ok = self._fits(idx[p], kind[p], rot[p], x[p], self.y[idx[p]] + dist[p] + 1)
+            dist[p[ok]] += 1
+            falling[p[~ok]] = False
+        self.y[idx] += dist
+        self.score[idx] += 2 * dist
+        self.last_action[idx[dist > 0]] = ACT_MOVE
+        self._lock(idx)
+
+    def ghost_y(self) -> np.ndarray:
+        """各ゲームのゴーストピースの Y オフセット"""
+        idx = np.arange(self.n)
+        kind, rot, x = self.kind, self.rot, self.x
+        dist = np.zeros(self.n, dtype=np.int64)
+        falling = ~self.game_over
+        while falling.any():
+            p = np.flatnonzero(falling)
+            ok = self._fits(idx[p], kind[p], rot[p], x[p], self.y[p] + dist[p] + 1)
+            dist[p[ok]] += 1
+            falling[p[~ok]] = False
+        return dist
+
+    # ── T-Spin 判定 ──
+    def _check_tspin(self, idx: np.ndarray) -> np.ndarray:
+        """T-Spin の種類 (0=なし, 1=mini, 2=full) を返す。"""
+        result = np.zeros(idx.size, dtype=np.int64)
+        cand = (self.kind[idx] == KIND_T) & (self.last_action[idx] == ACT_ROTATE)
+        p = np.flatnonzero(cand)
+        if not p.size:
+            return result
+        g = idx[p]
+        cx = self.x[g] + 1
+        cy = self.y[g] + 1
+
+        def filled(dx, dy):
+            nx = cx[:, None] + dx
+            ny = cy[:, None] + dy
+            outside = (nx < 0) | (nx >= COLS) | (ny < 0) | (ny >= ROWS)
+            rows = self.board[g[:, None], np.clip(ny + TOP, 0, HEIGHT - 1)]
+            bits = (rows >> np.clip(nx + PAD, 0, 31).astype(np.uint32)) & 1
+            return outside | (bits != 0)
+
+        corners = filled(CORNERS[:, 0], CORNERS[:, 1]).sum(axis=1)
+        front = FRONT_CORNERS[self.rot[g]]
+        front_filled = filled(front[:, :, 0], front[:, :, 1]).sum(axis=1)
+
+        kind = np.where((front_filled == 2) | (self.last_kick[g] == 4), 2, 1)
+        result[p] = np.where(corners >= 3, kind, 0)
+        return result
+
+    # ── 固定 & ライン消去 ──
+    def _lock(self, idx: np.ndarray):
+        tspin = self._check_tspin(idx)
+        kind, rot = self.kind[idx], self.rot[idx]
+        x, y = self.x[idx], self.y[idx]
+
+        # 盤面より上にはみ出したらゲームオーバー (盤面には書き込まない)
+        top_out = y + MIN_DY[kind, rot] < 0
+        self.game_over[idx[top_out]] = True
+        keep = ~top_out
+        idx, tspin = idx[keep], tspin[keep]
+        kind, rot, x, y = kind[keep], rot[keep], x[keep], y[keep]
+        if not idx.size:
+            return
+
+        rows = y[:, None] + (TOP + DY)
+        masks = MASKS[kind, rot] << (x + PAD).astype(np.uint32)[:, None]
+        self.board[idx[:, None], rows] |= masks
+
+        # ライン消去: 揃った行を先頭へ安定ソートし、空行で置き換える
+        field = self.board[idx, TOP:TOP + ROWS]
+        full = field == SOLID_ROW
+        num = full.sum(axis=1)
+        c = np.flatnonzero(num)
+        if c.size:
+            order = np.argsort(~full[c], axis=1, kind="stable")
+            packed = np.take_along_axis(field[c], order, axis=1)
+            packed[np.arange(ROWS) < num[c][:, None]] = WALL_ROW
+            self.board[idx[c], TOP:TOP + ROWS] = packed
+
+        self.score[idx] += SCORE_TABLE[tspin, num]
+        self.lines[idx] += num
+        self.level[idx] = self.lines[idx] // 10 + 1
+        self.fall_interval[idx] = self._calc_interval(self.level[idx])
+        self.last_tspin[idx] = tspin
+        self.last_lines[idx] = num
+        self._spawn_next(idx)
+
+    def _spawn_next(self, idx: np.ndarray):
+        self._set_piece(idx, self.next_kind[idx])
+        self.next_kind[idx] = self._next_kind(idx)
+        self.on_ground[idx] = False
+        self.lock_timer[idx] = 0
+        self.hold_used[idx] = False     # 新しいピースでホールド解禁
+        self._spawn_check(idx)
+
+    # ── 更新 ──
+    def update(self, dt: int, mask=None):
+        """自然落下とロック遅延を dt ミリ秒ぶん進める (Game.update と同じ規則)。"""
+        idx = self._select(mask)
+        self.fall_timer[idx] += dt
+        idx = idx[self.fall_timer[idx] >= self.fall_interval[idx]]
+        if not idx.size:
+            return
+        self.fall_timer[idx] = 0
+        fell = np.zeros(self.n, dtype=bool)
+        fell[idx] = True
+        moved = self.move(0, 1, fell)
+
+        landed = idx[~moved[idx]]
+        self.on_ground[idx[moved[idx]]] = False
+        self.lock_timer[idx[moved[idx]]] = 0
+
+        grounded = landed[self.on_ground[landed]]
+        first = landed[~self.on_ground[landed]]
+        self.on_ground[first] = True
+        self.lock_timer[first] = 0
+
+        self.lock_timer[grounded] += self.fall_interval[grounded]
+        self._lock(grounded[self.lock_timer[grounded] >= self.lock_delay])
+
+    def step(self, actions, dt: int = 0) -> tuple[np.ndarray, np.ndarray]:
+        """行動コードの配列を 1 つずつ各ゲームに適用し、(獲得スコア, ゲームオーバー) を返す。"""
+        actions = np.asarray(actions)
+        before = self.score.copy()
+        self.move(-1, 0, actions == LEFT)
+        self.move(1, 0, actions == RIGHT)
+        self.soft_drop(actions == SOFT_DROP)
+        self.rotate(1, actions == ROTATE_CW)
+        self.rotate(-1, actions == ROTATE_CCW)
+        self.hard_drop(actions == HARD_DROP)
+        self.hold(actions == HOLD)
+        if dt:
+            self.update(dt)
+        return self.score - before, self.game_over.copy()
+
+    # ── 観測 ──
+    def cells(self) -> np.ndarray:
+        """固定済みブロックの占有状態を (N, ROWS, COLS) の bool 配列で返す。"""
+        field = self.board[:, TOP:TOP + ROWS, None]
+        shifts = (PAD + np.arange(COLS)).astype(np.uint32)
+        return ((field >> shifts) & 1).astype(bool)
@@ -0,0 +1,358 @@
+"""
+テトリス — ベンチマーク
+======================
+シード固定のゲームでエンジンと描画の速度を測り、結果を JSON で出力する。
+コミットごとに保存して比較すれば、変更で速くなったか遅くなったかが分かる。
+
+使い方:
+  python tetris_bench.py                          : 全項目を測って表示
+  python tetris_bench.py -o base.json             : 結果を JSON に保存
+  python tetris_bench.py --compare base.json      : 保存した結果との差を表示
+  python tetris_bench.py --only engine,ghost_y    : 一部の項目だけ測る
+
+測定項目:
+  engine  : 入力列を再実行したときのピース数 / 秒・ライン数 / 秒
+            (handle_input → move / rotate / hard_drop → _lock → _clear_lines)
+  ghost_y : ghost_y() 1 回あたりの時間 (ns)
+  tspin   : _check_tspin() 1 回あたりの時間 (ns、T ミノの回転直後の状態)
+  render  : Renderer.draw のフレーム数 / 秒 (SDL の dummy ドライバ)
+  memory  : Game 1 個あたりのメモリ (tracemalloc)
+  startup : 新しいプロセスで tetris_engine / tetris を import する時間 (ms)
+
+入力列はボット (貪欲法) で一度だけ作り、計測では同じシードのゲームに
+そのまま流し込むので、ボットの思考時間は結果に含まれない。
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import pygame
+
+from tetris import SCREEN_H, SCREEN_W, Renderer
+from tetris_engine import INPUT_HARD_DROP, Game
+from tetris_bot import Bot
+from tetris_profile import percentile
+
+BENCHMARKS = ("engine", "ghost_y", "tspin", "render", "memory", "startup")
+
+# 指標名の末尾で良し悪しの向きを決める (大きいほど良い / 小さいほど良い)
+HIGHER_IS_BETTER = ("_per_sec", "fps")
+LOWER_IS_BETTER = ("_ns", "_ms", "_bytes")
+
+
+# ──────────────────────────────────────
+#  入力列の生成
+# ──────────────────────────────────────
+class InputScript:
+    """Game.recorder として入力コードと経過時間をメモリ上に記録する。
+    steps は (is_tick, 値) の列で、同じシードの Game に流すと同じ展開になる。"""
+
+    def __init__(self, seed: int):
+        self.seed = seed
+        self.steps: list[tuple[bool, int]] = []
+        self.pieces = 0
+
+    def record_input(self, code: int):
+        self.steps.append((False, code))
+        if code == INPUT_HARD_DROP:
+            self.pieces += 1
+
+    def record_tick(self, dt: int):
+        self.steps.append((True, dt))
+
+    def play(self, game: Game):
+        """記録した入力をすべて game に流す。"""
+        handle_input = game.handle_input
+        update = game.update
+        for is_tick, value in self.steps:
+            if is_tick:
+                update(value)
+            else:
+                handle_input(value)
+
+
+def make_script(seed: int, pieces: int) -> InputScript:
+    """貪欲法のボットで pieces 個 (またはゲームオーバーまで) 置いた入力列を作る。"""
+    bot = Bot(depth=1, spins=False, time_budget_ms=None)
+    game = Game(seed)
+    script = InputScript(seed)
+    game.recorder = script
+    while script.pieces < pieces and not game.game_over:
+        if game.clearing_rows:
+            game.update(game.clear_timer)   # 消去アニメーションを即座に終える
+            continue
+        if not bot.play(game):
+            break
+    game.recorder = None
+    return script
+
+
+# ──────────────────────────────────────
+#  計測
+# ──────────────────────────────────────
+def latency_stats(samples: list[float]) -> dict[str, float]:
+    """ns 単位のサンプル列から平均 / p50 / p99"""
+    return {
+        "mean_ns": round(sum(samples) / len(samples), 1),
+        "p50_ns": round(percentile(samples, 0.50), 1),
+        "p99_ns": round(percentile(samples, 0.99), 1),
+        "samples": len(samples),
+    }
+
+
+def bench_engine(scripts: list[InputScript], repeat: int) -> dict:
+    """入力列の再実行にかかった時間 (repeat 回のうち最速) からスループットを出す。"""
+    best = float("inf")
+    lines = 0
+    for _ in range(repeat):
+        games = [Game(s.seed) for s in scripts]
+        start = time.perf_counter()
+        for script, game in zip(scripts, games):
+            script.play(game)
+        best = min(best, time.perf_counter() - start)
+        lines = sum(g.lines for g in games)
+    pieces = sum(s.pieces for s in scripts)
+    return {
+        "pieces": pieces,
+        "lines": lines,
+        "seconds": round(best, 4),
+        "pieces_per_sec": round(pieces / best, 1),
+        "lines_per_sec": round(lines / best, 1),
+    }
+
+
+def _sample_states(scripts: list[InputScript], measure, inner: int) -> list[float]:
+    """入力列を再実行しながら各入力の直前の状態で measure(game) を inner 回呼び、
+    1 回あたりの時間 (ns) を集める。measure が None を返した状態は数えない。"""
+    perf = time.perf_counter_ns
+    samples = []
+    for script in scripts:
+        game = Game(script.seed)
+        for is_tick, value in script.steps:
+            if is_tick:
+                game.update(value)
+                continue
+            if not game.game_over and not game.clearing_rows:
+                fn = measure(game)
+                if fn is not None:
+                    start = perf()
+                    for _ in range(inner):
+                        fn()
+                    samples.append((perf() - start) / inner)
+            game.handle_input(value)
+    return samples
+
+
+def bench_ghost_y(scripts: list[InputScript], inner: int) -> dict:
+    return latency_stats(_sample_states(scripts, lambda g: g.ghost_y, inner))
+
+
+def bench_tspin(scripts: list[InputScript], inner: int) -> dict:
+    """T ミノが出ている状態で、回転直後とみなして判定の全経路を通す。
+    (last_action を一時的に書き換えるので _sample_states は使わない)"""
+    perf = time.perf_counter_ns
+    samples = []
+    for script in scripts:
+        game = Game(script.seed)
+        for is_tick, value in script.steps:
+            if is_tick:
+                game.update(value)
+                continue
+            if not game.game_over and not game.clearing_rows and game.current.name == "T":
+                action = game.last_action
+                game.last_action = "rotate"
+                check = game._check_tspin
+                start = perf()
+                for _ in range(inner):
+                    check()
+                samples.append((perf() - start) / inner)
+                game.last_action = action
+            game.handle_input(value)
+    return latency_stats(samples)
+
+
+def bench_render(scripts: list[InputScript], frames: int) -> dict:
+    """入力列を 1 ステップずつ進めながら描画する。
+    draw_fps は差分描画、full_draw_fps は毎フレーム全体を描き直した場合。"""
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    pygame.display.init()
+    pygame.font.init()
+    screen = pygame.display.set_mode((SCREEN_W, SCREEN_H))
+    result = {}
+    for label, full in (("draw_fps", False), ("full_draw_fps", True)):
+        renderer = Renderer(screen)
+        drawn = 0
+        elapsed = 0.0
+        while drawn < frames:
+            for script in scripts:
+                game = Game(script.seed)
+                for is_tick, value in script.steps:
+                    if is_tick:
+                        game.update(value)
+                    else:
+                        game.handle_input(value)
+                    if full:
+                        renderer._shown = None
+                    start = time.perf_counter()
+                    pygame.display.update(renderer.draw(game))
+                    elapsed += time.perf_counter() - start
+                    drawn += 1
+                    if drawn == frames:
+                        break
+                if drawn == frames:
+                    break
+        result[label] = round(drawn / elapsed, 1)
+    result["frames"] = frames
+    pygame.quit()
+    return result
+
+
+def bench_memory(count: int) -> dict:
+    """Game を count 個作ったときの増加量から 1 個あたりのメモリを出す。"""
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    games = [Game(seed) for seed in range(count)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    total = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    del games
+    return {"games": count, "per_game_bytes": round(total / count)}
+
+
+def bench_startup(repeat: int) -> dict:
+    """新しいインタプリタで import にかかる時間 (repeat 回のうち最速)。
+    インタプリタ自体の起動時間は "-c pass" を測って差し引く。"""
+    here = os.path.dirname(os.path.abspath(__file__))
+
+    def run(code: str) -> float:
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, "-c", code], cwd=here, check=True,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            best = min(best, time.perf_counter() - start)
+        return best
+
+    base = run("pass")
+    return {
+        "engine_import_ms": round((run("import tetris_engine") - base) * 1000, 1),
+        "ui_import_ms": round((run("import tetris") - base) * 1000, 1),
+    }
+
+
+# ──────────────────────────────────────
+#  出力と比較
+# ──────────────────────────────────────
+def metadata() -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "pygame": pygame.version.ver,
+        "machine": platform.machine(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def flatten(results: dict) -> dict[str, float]:
+    """{"engine": {"pieces_per_sec": ...}} → {"engine.pieces_per_sec": ...}"""
+    return {
+        f"{bench}.{key}": value
+        for bench, values in results.items()
+        for key, value in values.items()
+    }
+
+
+def compare(base: dict, current: dict, threshold: float) -> int:
+    """base と current の指標を並べて表示し、threshold % を超えて悪化した数を返す。"""
+    old = flatten(base["results"])
+    new = flatten(current["results"])
+    regressions = 0
+    print(f"比較: {base['meta'].get('commit')} → {current['meta'].get('commit')}")
+    for key, value in new.items():
+        if key not in old or not old[key]:
+            continue
+        if key.endswith(HIGHER_IS_BETTER):
+            sign = 1
+        elif key.endswith(LOWER_IS_BETTER):
+            sign = -1
+        else:
+            continue
+        change = (value - old[key]) / old[key] * 100
+        worse = sign * change < -threshold
+        regressions += worse
+        mark = "  << 悪化" if worse else ""
+        print(f"  {key:30} {old[key]:>12} → {value:>12}  ({change:+6.1f}%){mark}")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="テトリス ベンチマーク")
+    parser.add_argument("--only", default=",".join(BENCHMARKS),
+                        help=f"測る項目 (カンマ区切り: {','.join(BENCHMARKS)})")
+    parser.add_argument("--games", type=int, default=3, help="使うゲーム (シード) の数")
+    parser.add_argument("--seed", type=int, default=0, help="最初のシード")
+    parser.add_argument("-n", "--pieces", type=int, default=500, help="1 ゲームのピース数")
+    parser.add_argument("--repeat", type=int, default=3, help="engine の繰り返し回数")
+    parser.add_argument("--frames", type=int, default=2000, help="render のフレーム数")
+    parser.add_argument("-o", "--output", default=None, help="結果の JSON の保存先")
+    parser.add_argument("--compare", default=None, help="比較する以前の結果 (JSON)")
+    parser.add_argument("--threshold", type=float, default=5.0,
+                        help="この %% を超える悪化があれば終了コード 1")
+    args = parser.parse_args()
+
+    selected = [name for name in args.only.split(",") if name]
+    unknown = set(selected) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"不明な項目: {', '.join(sorted(unknown))}")
+
+    scripts = [make_script(seed, args.pieces)
+               for seed in range(args.seed, args.seed + args.games)]
+
+    results = {}
+    for name in BENCHMARKS:
+        if name not in selected:
+            continue
+        if name == "engine":
+            results[name] = bench_engine(scripts, args.repeat)
+        elif name == "ghost_y":
+            results[name] = bench_ghost_y(scripts, inner=20)
+        elif name == "tspin":
+            results[name] = bench_tspin(scripts, inner=20)
+        elif name == "render":
+            results[name] = bench_render(scripts, args.frames)
+        elif name == "memory":
+            results[name] = bench_memory(100)
+        elif name == "startup":
+            results[name] = bench_startup(args.repeat)
+        print(f"{name:8} {json.dumps(results[name], ensure_ascii=False)}", file=sys.stderr)
+
+    report = {"meta": metadata(), "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.compare) as f:
+            base = json.load(f)
+        if compare(base, report, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,370 @@
+"""
+テトリス — ビームサーチ AI
+==========================
+現在のピース・ネクスト・ホールドの置き方をビームサーチで探し、
+重み付きヒューリスティック (穴 / 凸凹 / 高さ / T-Spin の溝) で盤面を評価する。
+
+使い方:
+  python tetris_bot.py                      : ウィンドウを開いて AI がプレイ
+  python tetris_bot.py --headless -n 10000  : 描画なしで 10000 ピース置く
+"""
+
+import argparse
+import time
+from typing import NamedTuple
+
+from tetris_engine import (
+    COLS, ROWS, FULL_ROW, SHAPE_BOTTOMS, SHAPE_MASKS,
+    INPUT_HARD_DROP, INPUT_HOLD,
+    Game, Placement, clear_score, piece_fits, search_placements, srs_rotate, tspin_kind,
+)
+
+# ──────────────────────────────────────
+#  評価関数の重み
+# ──────────────────────────────────────
+DEFAULT_WEIGHTS: dict[str, float] = {
+    "height":     -0.50,   # 列の高さの合計
+    "max_height": -0.30,   # 最も高い列
+    "holes":      -6.00,   # 上が塞がった空きマス
+    "bumpiness":  -0.60,   # 隣り合う列の高さの差の合計
+    "tslots":      2.00,   # T-Spin で 1 行以上消せる溝
+    "score":       0.02,   # ライン消去 / T-Spin の得点
+}
+
+# board_features() が返す特徴量の順序
+FEATURES = ("height", "max_height", "holes", "bumpiness", "tslots")
+
+VISIBLE = 2                 # 読めるピース数 (現在 + ネクスト)。depth はこれより深くできない
+
+SPAWN_X = COLS // 2 - 2
+SPAWN_Y = -1
+
+
+class Decision(NamedTuple):
+    """ボットの決定: 先にホールドするか、どこに置くか"""
+    hold: bool
+    placement: Placement
+
+
+# ──────────────────────────────────────
+#  盤面シミュレーション
+# ──────────────────────────────────────
+def place(board: list[int], name: str, rotation: int, x: int,
+          y: int) -> tuple[list[int], int]:
+    """ピースを固定し、ライン消去後のボードと消去行数を返す。"""
+    new = list(board)
+    for dy, mask in SHAPE_MASKS[name][rotation]:
+        new[y + dy] |= mask << x if x >= 0 else mask >> -x
+    kept = [row for row in new if row != FULL_ROW]
+    lines = ROWS - len(kept)
+    if lines:
+        kept[:0] = [0] * lines
+    return kept, lines
+
+
+def column_heights(board: list[int]) -> list[int]:
+    """ボードから列ごとの高さを求める。"""
+    heights = [0] * COLS
+    covered = 0
+    for r, row in enumerate(board):
+        new = row & ~covered
+        while new:
+            low = new & -new
+            heights[low.bit_length() - 1] = ROWS - r
+            new ^= low
+        covered |= row
+        if covered == FULL_ROW:
+            break
+    return heights
+
+
+def board_features(board: list[int]) -> tuple[int, ...]:
+    """評価に使う特徴量を FEATURES の順に計算する。"""
+    heights = [0] * COLS
+    covered = 0
+    holes = 0
+    top = 0
+    while top < ROWS and not board[top]:
+        top += 1
+    for r in range(top, ROWS):
+        row = board[r]
+        holes += (covered & ~row).bit_count()
+        new = row & ~covered
+        while new:
+            low = new & -new
+            heights[low.bit_length() - 1] = ROWS - r
+            new ^= low
+        covered |= row
+
+    bumpiness = 0
+    for c in range(COLS - 1):
+        bumpiness += abs(heights[c] - heights[c + 1])
+
+    return (
+        sum(heights),
+        max(heights),
+        holes,
+        bumpiness,
+        _count_tslots(board, heights),
+    )
+
+
+def _count_tslots(board: list[int], heights: list[int]) -> int:
+    """下向き T がはまり、回転で入れば T-Spin として 1 行以上消せる溝を数える。"""
+    slots = 0
+    for x in range(COLS - 2):
+        # 下向き T (rotation 2) の足 (x+1, y+2) が x+1 列の地表に乗る位置
+        y = ROWS - heights[x + 1] - 3
+        if y < 0 or board[y + 1] & (0b111 << x):
+            continue
+        # 両肩の上が塞がっていないと溝ではない (上から落とせてしまう)
+        if heights[x] <= ROWS - y - 1 and heights[x + 2] <= ROWS - y - 1:
+            continue
+        corners = 0
+        for cx, cy in ((x, y), (x + 2, y), (x, y + 2), (x + 2, y + 2)):
+            if cy >= ROWS or board[cy] >> cx & 1:
+                corners += 1
+        if corners >= 3 and board[y + 1] | (0b111 << x) == FULL_ROW:
+            slots += 1
+    return slots
+
+
+def evaluate(board: list[int], weights: dict[str, float]) -> float:
+    features = board_features(board)
+    return sum(weights.get(k, 0.0) * v for k, v in zip(FEATURES, features))
+
+
+def _drop_distance(board: list[int], heights: list[int], name: str,
+                   rotation: int, x: int, y: int) -> int:
+    """着地までの距離。地表より上にいれば列の高さから直接求める。"""
+    drop = ROWS
+    for dx, max_dy in SHAPE_BOTTOMS[name][rotation]:
+        gap = ROWS - heights[x + dx] - 1 - (y + max_dy)
+        if gap < drop:
+            drop = gap
+    if drop >= 0:
+        return drop
+    drop = 0
+    while piece_fits(board, name, rotation, x, y + drop + 1):
+        drop += 1
+    return drop
+
+
+def drop_placements(board: list[int], name: str, x: int = SPAWN_X, y: int = SPAWN_Y,
+                    rotation: int = 0) -> list[Placement]:
+    """(x, y, rotation) から回転 → 横移動 → ハードドロップだけで置ける
+    着地位置を列挙する (高速版)。回転したその場で着地する T は T-Spin を判定する。"""
+    heights = column_heights(board)
+    placements = []
+    starts = [(x, y, rotation, (), None)]       # (x, y, 回転, 経路, 最後の回転のキック)
+    result = srs_rotate(board, name, x, y, rotation, 1)
+    if result is not None:
+        starts.append((*result[:3], ("cw",), result[3]))
+        twice = srs_rotate(board, name, *result[:3], 1)
+        if twice is not None:
+            starts.append((*twice[:3], ("cw", "cw"), twice[3]))
+    result = srs_rotate(board, name, x, y, rotation, -1)
+    if result is not None:
+        starts.append((*result[:3], ("ccw",), result[3]))
+
+    for x, y, rot, spin_path, kick in starts:
+        if not piece_fits(board, name, rot, x, y):
+            continue
+        for step, action in ((0, None), (-1, "left"), (1, "right")):
+            nx = x + step
+            shifts = () if action is None else (action,)
+            while piece_fits(board, name, rot, nx, y):
+                drop = _drop_distance(board, heights, name, rot, nx, y)
+                fall = ("drop",) if drop > 1 else ("down",) * drop
+                tspin = ""
+                if name == "T" and kick is not None and not shifts and not drop:
+                    tspin = tspin_kind(board, nx, y, rot, kick)
+                placements.append(Placement(nx, y + drop, rot, tspin, spin_path + shifts + fall))
+                if action is None:
+                    break
+                nx += step
+                shifts += (action,)
+    return placements
+
+
+# ──────────────────────────────────────
+#  ボット本体
+# ──────────────────────────────────────
+class Bot:
+    def __init__(self, weights: dict[str, float] | None = None,
+                 beam_width: int = 6, depth: int = 2, spins: bool = True,
+                 time_budget_ms: float | None = 8.0):
+        self.weights = dict(DEFAULT_WEIGHTS)
+        if weights:
+            self.weights.update(weights)
+        self._feature_weights = tuple(self.weights.get(k, 0.0) for k in FEATURES)
+        self.beam_width = beam_width
+        self.depth = min(depth, VISIBLE)    # 何ピース先まで読むか (現在 + ネクスト = 2)
+        self.spins = spins                  # 1 手目はソフトドロップ / スピンも探す
+        self.time_budget_ms = time_budget_ms
+        self._cost = {True: 0.0, False: 0.0}    # _expand 1 回の時間 (移動平均、full ごと)
+
+    def _candidates(self, board: list[int], name: str, start: tuple[int, int, int],
+                    full: bool) -> list[Placement]:
+        if full and self.spins:
+            return search_placements(board, name, *start)
+        return drop_placements(board, name, *start)
+
+    def _expand(self, board: list[int], name: str, start: tuple[int, int, int], full: bool):
+        """start = (x, y, rotation) のピースの置き方をすべて試し、
+        (得点, ボード, Placement) を返す。full ならソフトドロップ / スピンも探す。"""
+        t = time.perf_counter()
+        seen = set()
+        out = []
+        min_dy = {rot: SHAPE_MASKS[name][rot][0][0] for rot in range(4)}
+        for p in self._candidates(board, name, start, full):
+            if p.y + min_dy[p.rotation] < 0:
+                continue                    # 盤面より上にはみ出す = ゲームオーバー
+            new, lines = place(board, name, p.rotation, p.x, p.y)
+            key = (tuple(new), p.tspin)
+            if key in seen:
+                continue
+            seen.add(key)
+            out.append((clear_score(lines, p.tspin), new, p))
+        self._cost[full] = 0.8 * self._cost[full] + 0.2 * (time.perf_counter() - t)
+        return out
+
+    def choose(self, game: Game) -> Decision | None:
+        """ビームサーチで次の一手を決める。置ける場所が無ければ None。"""
+        deadline = None
+        if self.time_budget_ms is not None:
+            deadline = time.perf_counter() + self.time_budget_ms / 1000
+
+        current = game.current
+        queue = [current.name, game.next_piece.name]
+        hold = game.hold_piece.name if game.hold_piece is not None else None
+        spawn = (SPAWN_X, SPAWN_Y, 0)
+        live = (current.x, current.y, current.rotation)     # 1 手目は今の位置から探す
+        w_score = self.weights.get("score", 0.0)
+
+        # ノード: (評価値, 累積得点, ボード, キュー位置, ホールド, ホールド可, 最初の手)
+        beam = [(0.0, 0.0, game.board, 0, hold, not game.hold_used, None)]
+        best = None
+        depth = 0
+        while beam:
+            children = []
+            for _, acc, board, i, held, can_hold, first in beam:
+                out_of_time = deadline is not None and time.perf_counter() > deadline
+                if depth and out_of_time:
+                    break
+                options = [(queue[i], i + 1, held, False)]
+                if can_hold:
+                    if held is None:
+                        if i + 1 < len(queue):
+                            options.append((queue[i + 1], i + 2, queue[i], True))
+                    elif held != queue[i]:
+                        options.append((held, i + 1, queue[i], True))
+
+                for name, ni, nheld, used_hold in options:
+                    # 次の展開がこれまでの平均で時間内に収まるかを見る。1 手目は全探索が
+                    # 収まらなければ残りをハードドロップで置ける位置だけにし、2 手目以降は打ち切る
+                    if deadline is not None and not out_of_time:
+                        now = time.perf_counter()
+                        out_of_time = now + self._cost[depth == 0] > deadline
+                    if depth and out_of_time:
+                        break
+                    full = depth == 0 and not out_of_time
+                    start = live if depth == 0 and not used_hold else spawn
+                    for gained, new, p in self._expand(board, name, start, full):
+                        total = acc + w_score * gained
+                        value = total + sum(
+                            w * v for w, v in zip(self._feature_weights, board_features(new))
+                        )
+                        move = first or Decision(used_hold, p)
+                        children.append((value, total, new, ni, nheld, True, move))
+
+            if not children:
+                break
+            children.sort(key=lambda node: node[0], reverse=True)
+            best = children[0][6]
+            depth += 1
+            if depth >= self.depth:
+                break
+            beam = [n for n in children[:self.beam_width] if n[3] < len(queue)]
+            if deadline is not None and time.perf_counter() > deadline:
+                break
+        return best
+
+    def play(self, game: Game) -> bool:
+        """1 ピースぶん考えて実行する。置けなかったら False。"""
+        decision = self.choose(game)
+        if decision is None:
+            return False
+        if decision.hold:
+            game.handle_input(INPUT_HOLD)
+        if not game.run_path(decision.placement.path):
+            return False
+        game.handle_input(INPUT_HARD_DROP)
+        return True
+
+
+# ──────────────────────────────────────
+#  ヘッドレス実行
+# ──────────────────────────────────────
+def run_headless(bot: Bot, pieces: int, seed: int | None = None,
+                 record: str | None = None) -> dict:
+    """描画なしで pieces 個置くかゲームオーバーまで進め、統計を返す。
+    record にパスを渡すとリプレイファイルも書き出す。"""
+    game = Game(seed)
+    recorder = None
+    if record is not None:
+        from tetris_replay import ReplayWriter
+        recorder = ReplayWriter(record, game)
+    placed = 0
+    start = time.perf_counter()
+    while placed < pieces and not game.game_over:
+        if game.clearing_rows:
+            game.update(game.clear_timer)   # 消去アニメーションを即座に終える
+            continue
+        if not bot.play(game):
+            break
+        placed += 1
+    elapsed = time.perf_counter() - start
+    if recorder is not None:
+        recorder.close(game)
+    return {
+        "pieces": placed,
+        "lines": game.lines,
+        "score": game.score,
+        "level": game.level,
+        "game_over": game.game_over,
+        "seconds": round(elapsed, 3),
+        "pieces_per_sec": round(placed / elapsed, 1) if elapsed else 0.0,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="テトリス ビームサーチ AI")
+    parser.add_argument("--headless", action="store_true", help="描画せずに実行する")
+    parser.add_argument("-n", "--pieces", type=int, default=1000,
+                        help="ヘッドレス時に置くピース数")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--record", default=None, help="リプレイの保存先")
+    parser.add_argument("--beam", type=int, default=6, help="ビーム幅")
+    parser.add_argument("--depth", type=int, default=VISIBLE, choices=range(1, VISIBLE + 1),
+                        help="読むピース数 (1 = 現在のピースだけ、2 = ネクストまで。"
+                             "見えるのはネクスト 1 つなのでそれより深くは読めない)")
+    parser.add_argument("--budget", type=float, default=8.0,
+                        help="1 手あたりの思考時間 (ms, 0 で無制限)")
+    parser.add_argument("--no-spins", action="store_true",
+                        help="ハードドロップで置ける位置だけを探す")
+    args = parser.parse_args()
+
+    bot = Bot(beam_width=args.beam, depth=args.depth, spins=not args.no_spins,
+              time_budget_ms=args.budget or None)
+    if args.headless:
+        stats = run_headless(bot, args.pieces, args.seed, args.record)
+        for key, value in stats.items():
+            print(f"  {key:15}: {value}")
+    else:
+        import tetris
+        tetris.main(bot=bot, seed=args.seed, record=args.record)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1137 @@
+"""
+テトリス — ゲームエンジン
+========================
+ルール・盤面・ピース・スコア・入力処理など、描画に依存しない部分。
+pygame を読み込まないので、ボット・リプレイ・サーバ・並列ワーカーなど
+ヘッドレスの用途ではこのモジュールだけを import すればよい。
+エンジンの名前は tetris.py ではなくここから import する。
+"""
+
+import random
+from collections import deque
+from typing import NamedTuple
+
+# ──────────────────────────────────────
+#  定数
+# ──────────────────────────────────────
+COLS = 10
+ROWS = 20
+
+# シミュレーションは描画と切り離した固定ティックで進める
+SIM_HZ = 250
+TICK_MS = 1000 // SIM_HZ            # 1 ティックの長さ (整数 ms なのでリプレイと一致する)
+
+# 押しっぱなしの自動リピート (ms)
+DAS_MS = 170       # 最初のリピートまでの遅延
+ARR_MS = 50        # 以降のリピート間隔 (0 なら壁まで一気に動く)
+SOFT_DROP_MS = 50  # ソフトドロップのリピート間隔
+
+# おじゃまラインの色
+GARBAGE_COLOR = (110, 110, 125)
+
+# テトリミノの色（鮮やか）
+COLORS = {
+    "I": (0, 220, 255),    # シアン
+    "O": (255, 220, 0),    # 黄
+    "T": (180, 60, 255),   # 紫
+    "S": (80, 255, 80),    # 緑
+    "Z": (255, 60, 60),    # 赤
+    "J": (60, 100, 255),   # 青
+    "L": (255, 160, 40),   # オレンジ
+}
+
+# テトリミノの形状定義 (4回転状態)
+SHAPES = {
+    "I": [
+        [(0, 1), (1, 1), (2, 1), (3, 1)],
+        [(2, 0), (2, 1), (2, 2), (2, 3)],
+        [(0, 2), (1, 2), (2, 2), (3, 2)],
+        [(1, 0), (1, 1), (1, 2), (1, 3)],
+    ],
+    "O": [
+        [(1, 0), (2, 0), (1, 1), (2, 1)],
+        [(1, 0), (2, 0), (1, 1), (2, 1)],
+        [(1, 0), (2, 0), (1, 1), (2, 1)],
+        [(1, 0), (2, 0), (1, 1), (2, 1)],
+    ],
+    "T": [
+        [(0, 1), (1, 1), (2, 1), (1, 0)],
+        [(1, 0), (1, 1), (1, 2), (2, 1)],
+        [(0, 1), (1, 1), (2, 1), (1, 2)],
+        [(1, 0), (1, 1), (1, 2), (0, 1)],
+    ],
+    "S": [
+        [(1, 0), (2, 0), (0, 1), (1, 1)],
+        [(1, 0), (1, 1), (2, 1), (2, 2)],
+        [(1, 1), (2, 1), (0, 2), (1, 2)],
+        [(0, 0), (0, 1), (1, 1), (1, 2)],
+    ],
+    "Z": [
+        [(0, 0), (1, 0), (1, 1), (2, 1)],
+        [(2, 0), (1, 1), (2, 1), (1, 2)],
+        [(0, 1), (1, 1), (1, 2), (2, 2)],
+        [(1, 0), (0, 1), (1, 1), (0, 2)],
+    ],
+    "J": [
+        [(0, 0), (0, 1), (1, 1), (2, 1)],
+        [(1, 0), (2, 0), (1, 1), (1, 2)],
+        [(0, 1), (1, 1), (2, 1), (2, 2)],
+        [(1, 0), (1, 1), (0, 2), (1, 2)],
+    ],
+    "L": [
+        [(2, 0), (0, 1), (1, 1), (2, 1)],
+        [(1, 0), (1, 1), (1, 2), (2, 2)],
+        [(0, 1), (1, 1), (2, 1), (0, 2)],
+        [(0, 0), (1, 0), (1, 1), (1, 2)],
+    ],
+}
+# 形状名 → 番号 (SHAPES の順。ログや通信でピースを 1 バイトで表すとき用)
+SHAPE_INDEX = {name: i for i, name in enumerate(SHAPES)}
+
+# ── ビットボード用の前計算 ──
+# ボードは 1 行 = 1 整数 (bit c が列 c の占有) で表現する
+FULL_ROW = (1 << COLS) - 1
+# 空の色行 (Game.colors の行は不変タプルなので全行で共有する)
+EMPTY_COLOR_ROW = (None,) * COLS
+
+
+def _build_shape_masks() -> tuple[dict, dict, dict]:
+    """形状ごとの行ビットマスク (dy, mask)・占有範囲 (min_dx, max_dx, max_dy)・
+    列ごとの最下段 (dx, max_dy) を作る。"""
+    masks: dict[str, list[tuple[tuple[int, int], ...]]] = {}
+    spans: dict[str, list[tuple[int, int, int]]] = {}
+    bottoms: dict[str, list[tuple[tuple[int, int], ...]]] = {}
+    for name, rotations in SHAPES.items():
+        masks[name] = []
+        spans[name] = []
+        bottoms[name] = []
+        for cells in rotations:
+            rows: dict[int, int] = {}
+            lowest: dict[int, int] = {}
+            for dx, dy in cells:
+                rows[dy] = rows.get(dy, 0) | (1 << dx)
+                lowest[dx] = max(lowest.get(dx, dy), dy)
+            masks[name].append(tuple(sorted(rows.items())))
+            spans[name].append((
+                min(dx for dx, _ in cells),
+                max(dx for dx, _ in cells),
+                max(dy for _, dy in cells),
+            ))
+            bottoms[name].append(tuple(sorted(lowest.items())))
+    return masks, spans, bottoms
+
+
+SHAPE_MASKS, SHAPE_SPANS, SHAPE_BOTTOMS = _build_shape_masks()
+
+LINE_SCORES = {0: 0, 1: 100, 2: 300, 3: 500, 4: 800}
+# T-Spin (0 行 / Single / Double / Triple) と T-Spin Mini (0 行 / Single / Double)
+TSPIN_SCORES = {0: 400, 1: 800, 2: 1200, 3: 1600}
+TSPIN_MINI_SCORES = {0: 100, 1: 200, 2: 400}
+
+# ── SRS ウォールキックオフセット ──
+# (from_rotation, to_rotation) → [(dx, dy), ...]
+# J, L, S, T, Z 用
+SRS_KICKS_JLSTZ = {
+    (0, 1): [(0, 0), (-1, 0), (-1, -1), (0, 2), (-1, 2)],
+    (1, 0): [(0, 0), (1, 0), (1, 1), (0, -2), (1, -2)],
+    (1, 2): [(0, 0), (1, 0), (1, 1), (0, -2), (1, -2)],
+    (2, 1): [(0, 0), (-1, 0), (-1, -1), (0, 2), (-1, 2)],
+    (2, 3): [(0, 0), (1, 0), (1, -1), (0, 2), (1, 2)],
+    (3, 2): [(0, 0), (-1, 0), (-1, 1), (0, -2), (-1, -2)],
+    (3, 0): [(0, 0), (-1, 0), (-1, 1), (0, -2), (-1, -2)],
+    (0, 3): [(0, 0), (1, 0), (1, -1), (0, 2), (1, 2)],
+}
+# I ピース用
+SRS_KICKS_I = {
+    (0, 1): [(0, 0), (-2, 0), (1, 0), (-2, 1), (1, -2)],
+    (1, 0): [(0, 0), (2, 0), (-1, 0), (2, -1), (-1, 2)],
+    (1, 2): [(0, 0), (-1, 0), (2, 0), (-1, -2), (2, 1)],
+    (2, 1): [(0, 0), (1, 0), (-2, 0), (1, 2), (-2, -1)],
+    (2, 3): [(0, 0), (2, 0), (-1, 0), (2, -1), (-1, 2)],
+    (3, 2): [(0, 0), (-2, 0), (1, 0), (-2, 1), (1, -2)],
+    (3, 0): [(0, 0), (1, 0), (-2, 0), (1, 2), (-2, -1)],
+    (0, 3): [(0, 0), (-1, 0), (2, 0), (-1, -2), (2, 1)],
+}
+
+# ── 入力コード (キー操作・ボット・リプレイで共通) ──
+INPUT_LEFT = 0
+INPUT_RIGHT = 1
+INPUT_SOFT_DROP = 2     # ↓ キー: 1 マス落下 (+1 点)
+INPUT_ROTATE = 3        # 右回転
+INPUT_ROTATE_CCW = 4    # 左回転
+INPUT_HARD_DROP = 5
+INPUT_HOLD = 6
+INPUT_DOWN = 7          # 得点なしの 1 マス落下 (Placement.path の "down")
+INPUT_SONIC_DROP = 8    # ロックせずに着地位置まで落とす ("drop")
+INPUT_RESTART = 9       # ゲームオーバー時のリスタート
+
+# Placement.path の入力名 → 入力コード
+PATH_INPUTS = {
+    "left": INPUT_LEFT,
+    "right": INPUT_RIGHT,
+    "down": INPUT_DOWN,
+    "drop": INPUT_SONIC_DROP,
+    "cw": INPUT_ROTATE,
+    "ccw": INPUT_ROTATE_CCW,
+}
+
+# ── テレメトリのイベント (Game.telemetry.emit に渡す種類) ──
+EVENT_SPAWN = 0
+EVENT_LOCK = 1          # a, b, c = x, y, rotation
+EVENT_CLEAR = 2         # a = 消去行数
+EVENT_HOLD = 3          # a = ホールドに入れたピースの番号 (SHAPES の順)
+EVENT_LEVEL = 4
+EVENT_GAME_OVER = 5
+
+# T-Spin 判定用: T ピースの中心からの 4 隅オフセット
+T_CORNERS = [(-1, -1), (1, -1), (-1, 1), (1, 1)]
+# T ピースの "前方" コーナー（回転方向の前面 2 つ）
+T_FRONT_CORNERS = {
+    0: [(-1, -1), (1, -1)],   # 上向き
+    1: [(1, -1), (1, 1)],     # 右向き
+    2: [(-1, 1), (1, 1)],     # 下向き
+    3: [(-1, -1), (-1, 1)],   # 左向き
+}
+
+# ──────────────────────────────────────
+#  テトリミノ
+# ──────────────────────────────────────
+class PieceState:
+    """形状と回転の組。28 通りを PIECE_STATES に 1 つずつだけ作って共有する (不変)。
+    セル・行マスク・占有範囲・列ごとの最下段に加えて、
+    左右回転の回転先とボード座標に直したキックのオフセットを前計算して持つ。"""
+    __slots__ = ("name", "rotation", "color", "cells", "masks",
+                 "min_dx", "max_dx", "min_dy", "max_dy", "bottoms", "kicks")
+
+    def __init__(self, name: str, rotation: int):
+        self.name = name
+        self.rotation = rotation
+        self.color = COLORS[name]
+        self.cells: tuple[tuple[int, int], ...] = tuple(SHAPES[name][rotation])
+        self.masks = SHAPE_MASKS[name][rotation]
+        self.min_dx, self.max_dx, self.max_dy = SHAPE_SPANS[name][rotation]
+        self.min_dy = min(dy for _, dy in self.cells)
+        self.bottoms = SHAPE_BOTTOMS[name][rotation]
+        # 回転方向 (1 / -1) → (回転先の PieceState, キックのオフセット (dx, dy) の列)
+        self.kicks: dict[int, tuple["PieceState", tuple[tuple[int, int], ...]]] = {}
+
+    def __repr__(self) -> str:
+        return f"PieceState({self.name!r}, {self.rotation})"
+
+
+def _build_piece_states() -> dict[str, tuple[PieceState, ...]]:
+    states = {
+        name: tuple(PieceState(name, rot) for rot in range(4))
+        for name in SHAPES
+    }
+    for name, rotations in states.items():
+        if name == "O":
+            continue    # O ピースは回転しない
+        table = SRS_KICKS_I if name == "I" else SRS_KICKS_JLSTZ
+        for state in rotations:
+            for direction in (1, -1):
+                target = rotations[(state.rotation + direction) % 4]
+                # SRS の dy は上が正なのでボード座標 (下が正) に直しておく
+                offsets = tuple(
+                    (dx, -dy) for dx, dy in table[(state.rotation, target.rotation)]
+                )
+                state.kicks[direction] = (target, offsets)
+    return states
+
+
+PIECE_STATES = _build_piece_states()
+
+
+class Tetromino:
+    """操作中のピース。位置と PieceState への参照だけを持つ。"""
+    __slots__ = ("state", "x", "y")
+
+    def __init__(self, shape_name: str, rotation: int = 0):
+        self.state = PIECE_STATES[shape_name][rotation]
+        # ボード上の位置 (左上基準)
+        self.x = COLS // 2 - 2
+        self.y = -1
+
+    @property
+    def name(self) -> str:
+        return self.state.name
+
+    @property
+    def color(self) -> tuple[int, int, int]:
+        return self.state.color
+
+    @property
+    def rotation(self) -> int:
+        return self.state.rotation
+
+    @rotation.setter
+    def rotation(self, value: int):
+        self.state = PIECE_STATES[self.state.name][value % 4]
+
+    def cells(self) -> list[tuple[int, int]]:
+        """現在の回転状態でのセル座標 (ボード座標)"""
+        x, y = self.x, self.y
+        return [(x + dx, y + dy) for dx, dy in self.state.cells]
+
+    def rotated_cells(self, direction: int = 1) -> list[tuple[int, int]]:
+        """回転後のセル座標 (実際には回転しない)"""
+        x, y = self.x, self.y
+        state = PIECE_STATES[self.state.name][(self.state.rotation + direction) % 4]
+        return [(x + dx, y + dy) for dx, dy in state.cells]
+
+    def rotate(self, direction: int = 1):
+        self.rotation = self.state.rotation + direction
+
+    def shape_cells(self) -> tuple[tuple[int, int], ...]:
+        """形状のみのセル座標 (位置オフセットなし)"""
+        return self.state.cells
+
+
+# ──────────────────────────────────────
+#  盤面操作 (Game とボットで共通)
+# ──────────────────────────────────────
+def state_fits(board: list[int], state: PieceState, x: int, y: int) -> bool:
+    """形状マスクをシフトしてボードと AND を取り、配置可能か判定する。"""
+    if x + state.min_dx < 0 or x + state.max_dx >= COLS or y + state.max_dy >= ROWS:
+        return False
+    for dy, mask in state.masks:
+        row = y + dy
+        if row >= 0 and board[row] & (mask << x if x >= 0 else mask >> -x):
+            return False
+    return True
+
+
+def piece_fits(board: list[int], name: str, rotation: int, x: int, y: int) -> bool:
+    """state_fits の (形状名, 回転) 版"""
+    return state_fits(board, PIECE_STATES[name][rotation], x, y)
+
+
+def rotate_state(board: list[int], state: PieceState, x: int, y: int,
+                 direction: int = 1) -> tuple[int, int, PieceState, int] | None:
+    """SRS ウォールキック付きで回転を試す。
+    成功すれば (x, y, 回転後の PieceState, キックのインデックス)、失敗すれば None。"""
+    entry = state.kicks.get(direction)
+    if entry is None:
+        if state.name == "O":
+            return None     # O ピースは回転不要
+        # 左右以外 (180° など) はキックなし
+        entry = (PIECE_STATES[state.name][(state.rotation + direction) % 4], ((0, 0),))
+    target, offsets = entry
+    for i, (dx, dy) in enumerate(offsets):
+        if state_fits(board, target, x + dx, y + dy):
+            return x + dx, y + dy, target, i
+    return None
+
+
+def srs_rotate(board: list[int], name: str, x: int, y: int, rotation: int,
+               direction: int = 1) -> tuple[int, int, int, int] | None:
+    """rotate_state の (形状名, 回転) 版。
+    成功すれば (x, y, rotation, キックのインデックス)、失敗すれば None を返す。"""
+    result = rotate_state(board, PIECE_STATES[name][rotation], x, y, direction)
+    if result is None:
+        return None
+    nx, ny, target, kick = result
+    return nx, ny, target.rotation, kick
+
+
+def tspin_kind(board: list[int], x: int, y: int, rotation: int,
+               kick_index: int) -> str:
+    """回転で (x, y, rotation) に入った T ピースの T-Spin 種別を返す。
+    "" → '', 'mini', 'full'"""
+    # T の形状は常に (1,1) が中心
+    cx = x + 1
+    cy = y + 1
+
+    # 4 隅のうち埋まっている数をカウント
+    filled = 0
+    for dx, dy in T_CORNERS:
+        nx, ny = cx + dx, cy + dy
+        if nx < 0 or nx >= COLS or ny < 0 or ny >= ROWS:
+            filled += 1  # 壁/床もブロック扱い
+        elif board[ny] >> nx & 1:
+            filled += 1
+
+    if filled < 3:
+        return ""
+
+    # 前方 2 隅が埋まっているなら正規 T-Spin
+    front_filled = 0
+    for dx, dy in T_FRONT_CORNERS[rotation]:
+        nx, ny = cx + dx, cy + dy
+        if nx < 0 or nx >= COLS or ny < 0 or ny >= ROWS:
+            front_filled += 1
+        elif board[ny] >> nx & 1:
+            front_filled += 1
+
+    if front_filled == 2:
+        return "full"
+
+    # キックインデックスが 4（最後のオフセット）なら正規 T-Spin
+    if kick_index == 4:
+        return "full"
+
+    return "mini"
+
+
+def clear_score(lines: int, tspin: str) -> int:
+    """消去行数と T-Spin 種別から得点を求める。"""
+    if tspin == "full":
+        return TSPIN_SCORES.get(lines, 800)
+    if tspin == "mini":
+        return TSPIN_MINI_SCORES.get(lines, 200)
+    return LINE_SCORES.get(lines, 800)
+
+
+class Placement(NamedTuple):
+    """到達可能な最終着地状態と、そこへ至る入力列。
+
+    path の各要素は "left" / "right" / "down" / "drop" / "cw" / "ccw"。
+    Game.run_path(path) で実行した後、hard_drop() で固定すると
+    (x, y, rotation) に置かれ、tspin の判定結果になる。
+    """
+    x: int
+    y: int
+    rotation: int
+    tspin: str
+    path: tuple[str, ...]
+
+
+# 探索で使う平行移動 (入力名, dx, dy)
+SEARCH_MOVES = (("left", -1, 0), ("right", 1, 0), ("down", 0, 1))
+
+
+def search_placements(board: list[int], name: str, x: int = COLS // 2 - 2,
+                      y: int = -1, rotation: int = 0) -> list[Placement]:
+    """(x, y, rotation) のピースが移動・回転・ソフトドロップで到達できる
+    最終着地状態をすべて列挙する (幅優先探索なので入力列は最短)。
+
+    T ピースは T-Spin 判定に効く「最後の操作」(移動 / 回転 / 5 番目のキック) も
+    状態に含め、訪問済み表 (状態をパックした整数 → 親) で重複を除く。
+    着地行は列の高さから (x, 回転) ごとに 1 回だけ求め、盤面から離れた空中の
+    下移動は探索に入れずにまとめて進める。
+    """
+    states = PIECE_STATES[name]
+    if not state_fits(board, states[rotation], x, y):
+        return []
+    is_t = name == "T"
+
+    # 着地する行: 地表 (列の高さ) より上にいれば (x, 回転) ごとに 1 回だけ求めた
+    # surface[(x, rot)] に落ちる。オーバーハングの下だけ 1 行ずつ調べ、結果を覚える
+    heights = [0] * COLS
+    covered = 0
+    for r, row in enumerate(board):
+        new = row & ~covered
+        while new:
+            low = new & -new
+            heights[low.bit_length() - 1] = ROWS - r
+            new ^= low
+        covered |= row
+    surface: dict[tuple[int, int], int] = {}
+    below: dict[tuple[int, int, int], int] = {}
+    # これより上の行はどのピースの当たり判定・キック (上下 2 行) にも盤面が関わらない
+    sky = ROWS - max(heights) - 3
+
+    def landing(state: PieceState, x: int, y: int) -> int:
+        key = (x, state.rotation)
+        top = surface.get(key)
+        if top is None:
+            top = surface[key] = min(ROWS - heights[x + dx] - 1 - max_dy
+                                     for dx, max_dy in state.bottoms)
+        if y <= top:
+            return top
+        key = (x, y, state.rotation)
+        land = below.get(key)
+        if land is None:
+            land = y
+            while state_fits(board, state, x, land + 1):
+                land += 1
+            below[key] = land
+        return land
+
+    def pack(x: int, y: int, rot: int, spin: int) -> int:
+        return (((y + 8) * 32 + x + 8) * 4 + rot) * 3 + spin
+
+    start = pack(x, y, rotation, 0)
+    parents: dict[int, tuple[int, str] | None] = {start: None}
+    # 入力数ごとの待ち行列 (空中の下移動はまとめて数入力先へ飛ぶので、単純な FIFO ではなく
+    # 入力数の順に取り出して最短の入力列を保つ)
+    levels: list[list[tuple[int, int, int, int, int]]] = [[(x, y, rotation, 0, start)]]
+    found: dict[tuple[int, int, int, str], int] = {}
+    dist = 0
+
+    def visit(nx: int, ny: int, nrot: int, spin: int, key: int, action: str, cost: int = 1):
+        nkey = (((ny + 8) * 32 + nx + 8) * 4 + nrot) * 3 + spin     # pack() と同じ
+        if nkey not in parents:
+            parents[nkey] = (key, action)
+            d = dist + cost
+            while len(levels) <= d:
+                levels.append([])
+            levels[d].append((nx, ny, nrot, spin, nkey))
+
+    while dist < len(levels):
+        for x, y, rot, spin, key in levels[dist]:
+            state = states[rot]
+            drop = landing(state, x, y) - y
+
+            for action, dx, dy in SEARCH_MOVES:
+                if not dy:
+                    if state_fits(board, state, x + dx, y):
+                        visit(x + dx, y, rot, 0, key, action)
+                    continue
+                if not drop:                    # 1 行下に入るかは着地行から分かる
+                    continue
+                ny = y + 1
+                if ny + state.max_dy < sky:
+                    # 何もない空中では高さが違っても同じ動きができるので、盤面に近づくまで
+                    # 下移動を続けた状態だけを探索に入れる (途中の状態は訪問済みにするだけ)
+                    nkey = key
+                    while ny + state.max_dy < sky and ny < y + drop:
+                        nkey_next = (((ny + 8) * 32 + x + 8) * 4 + rot) * 3
+                        if nkey_next in parents:
+                            break
+                        parents[nkey_next] = (nkey, action)
+                        nkey = nkey_next
+                        ny += 1
+                    else:
+                        visit(x, ny, rot, 0, nkey, action, ny - y)
+                    continue
+                visit(x, ny, rot, 0, key, action)
+
+            # 着地位置まで一気に落とす (ソフトドロップの連打を 1 入力にまとめる)
+            if drop > 1:
+                visit(x, y + drop, rot, 0, key, "drop")
+
+            for action, direction in (("cw", 1), ("ccw", -1)):
+                result = rotate_state(board, state, x, y, direction)
+                if result is not None:
+                    nx, ny, target, kick = result
+                    nspin = (2 if kick == 4 else 1) if is_t else 0
+                    visit(nx, ny, target.rotation, nspin, key, action)
+
+            if drop == 0:
+                tspin = ""
+                if spin:
+                    tspin = tspin_kind(board, x, y, rot, 4 if spin == 2 else 0)
+                found.setdefault((x, y, rot, tspin), key)
+        dist += 1
+
+    placements = []
+    for (px, py, prot, tspin), key in found.items():
+        path = []
+        link = parents[key]
+        while link is not None:
+            key, action = link
+            path.append(action)
+            link = parents[key]
+        path.reverse()
+        placements.append(Placement(px, py, prot, tspin, tuple(path)))
+    return placements
+
+
+# ──────────────────────────────────────
+#  ゲーム本体
+# ──────────────────────────────────────
+class GameSnapshot(NamedTuple):
+    """Game.snapshot() が返す不変の状態。盤面の行・色の行・乱数状態は
+    元の Game と共有するので、取得はタプルを数個作るだけで済む。"""
+    board: tuple[int, ...]
+    colors: tuple[tuple, ...]
+    heights: tuple[int, ...]
+    score: int
+    level: int
+    lines: int
+    pieces: int
+    game_over: bool
+    bag: tuple[str, ...]
+    rng_state: tuple
+    current: tuple[str, int, int, int]     # (name, x, y, rotation)
+    next_piece: str
+    hold_piece: str | None
+    hold_used: bool
+    fall_interval: int
+    fall_timer: int
+    lock_delay: int
+    lock_timer: int
+    on_ground: bool
+    last_action: str
+    last_kick_index: int
+    last_tspin: str
+    clearing_rows: tuple[int, ...]
+    clear_timer: int
+
+
+class Game:
+    def __init__(self, seed: int | None = None):
+        # 7-bag の乱数。seed を記録しておけばリプレイで同じ順番を再現できる
+        self.seed = seed if seed is not None else random.randrange(1 << 63)
+        self.rng = random.Random(self.seed)
+        self._rng_state = None      # snapshot() 用にキャッシュした rng.getstate()
+        # 入力と update(dt) を記録するもの (tetris_replay.ReplayWriter など)
+        self.recorder = None
+        # ピースの出現・固定・消去などのイベントを受け取るもの (tetris_telemetry.TelemetryWriter など)
+        self.telemetry = None
+        self.reset()
+
+    def reset(self):
+        # ボード: 行ごとの占有ビットマスク (bit c = 列 c)
+        self.board: list[int] = [0] * ROWS
+        # 色: None = 空, tuple = 色 (描画専用、Renderer だけが参照する)
+        # 各行は不変のタプルで、変更時は行ごと作り直す (スナップショットと共有できる)
+        self.colors: list[tuple] = [EMPTY_COLOR_ROW] * ROWS
+        # 列ごとの高さ (0 = 空, ROWS = 最上段まで埋まっている)
+        self._heights: list[int] = [0] * COLS
+        self.score = 0
+        self.level = 1
+        self.lines = 0
+        self.pieces = 0             # 固定したピースの数
+        self.game_over = False
+
+        self.bag: list[str] = []
+        self.current = self._next_piece()
+        self.next_piece = self._next_piece()
+
+        # ホールド
+        self.hold_piece: Tetromino | None = None
+        self.hold_used = False      # 1ターンに1回だけホールド可能
+
+        self.fall_interval = self._calc_interval()
+        self.fall_timer = 0
+        self.lock_delay = 500       # ms
+        self.lock_timer = 0
+        self.on_ground = False
+
+        # T-Spin 判定用
+        self.last_action = ""       # "rotate" or "move"
+        self.last_kick_index = 0    # 使用した SRS キックのインデックス
+        self.last_tspin = ""        # 直前の消去で判定された T-Spin 種別
+
+        # アニメーション
+        self.clearing_rows: list[int] = []
+        self.clear_timer = 0
+        self.clear_duration = 250   # ms
+
+        if self.telemetry is not None:
+            self.telemetry.emit(self, EVENT_SPAWN)
+
+    def _refill_bag(self):
+        """7-bag ランダム生成"""
+        bag = list(SHAPES.keys())
+        self.rng.shuffle(bag)
+        self.bag = bag
+        self._rng_state = None      # 乱数を進めたので snapshot 用のキャッシュは無効
+
+    # ── スナップショット ──
+    def snapshot(self) -> GameSnapshot:
+        """現在の状態を GameSnapshot として取り出す (restore() で戻せる)。"""
+        # 乱数は 7 個に 1 回しか進まないので、状態はバッグ補充ごとに 1 回だけ取る
+        rng_state = self._rng_state
+        if rng_state is None:
+            rng_state = self._rng_state = self.rng.getstate()
+        piece = self.current
+        hold = self.hold_piece
+        return GameSnapshot(
+            tuple(self.board), tuple(self.colors), tuple(self._heights),
+            self.score, self.level, self.lines, self.pieces, self.game_over,
+            tuple(self.bag), rng_state,
+            (piece.name, piece.x, piece.y, piece.rotation),
+            self.next_piece.name, None if hold is None else hold.name, self.hold_used,
+            self.fall_interval, self.fall_timer, self.lock_delay, self.lock_timer,
+            self.on_ground, self.last_action, self.last_kick_index, self.last_tspin,
+            tuple(self.clearing_rows), self.clear_timer,
+        )
+
+    def restore(self, snap: GameSnapshot):
+        """snapshot() で取り出した状態に戻す。seed と recorder はそのまま。"""
+        self.board = list(snap.board)
+        self.colors = list(snap.colors)
+        self._heights = list(snap.heights)
+        self.score = snap.score
+        self.level = snap.level
+        self.lines = snap.lines
+        self.pieces = snap.pieces
+        self.game_over = snap.game_over
+        self.bag = list(snap.bag)
+        if snap.rng_state is not self._rng_state:
+            self.rng.setstate(snap.rng_state)
+            self._rng_state = snap.rng_state
+
+        name, x, y, rotation = snap.current
+        self.current = Tetromino(name, rotation)
+        self.current.x, self.current.y = x, y
+        self.next_piece = Tetromino(snap.next_piece)
+        self.hold_piece = None if snap.hold_piece is None else Tetromino(snap.hold_piece)
+        self.hold_used = snap.hold_used
+
+        self.fall_interval = snap.fall_interval
+        self.fall_timer = snap.fall_timer
+        self.lock_delay = snap.lock_delay
+        self.lock_timer = snap.lock_timer
+        self.on_ground = snap.on_ground
+        self.last_action = snap.last_action
+        self.last_kick_index = snap.last_kick_index
+        self.last_tspin = snap.last_tspin
+        self.clearing_rows = list(snap.clearing_rows)
+        self.clear_timer = snap.clear_timer
+
+    def _next_piece(self) -> Tetromino:
+        if not self.bag:
+            self._refill_bag()
+        return Tetromino(self.bag.pop())
+
+    def _calc_interval(self) -> int:
+        """レベルに応じた落下間隔 (ms)"""
+        return max(80, 800 - (self.level - 1) * 70)
+
+    def _valid_pos(self, cells: list[tuple[int, int]]) -> bool:
+        for x, y in cells:
+            if x < 0 or x >= COLS:
+                return False
+            if y >= ROWS:
+                return False
+            if y >= 0 and self.board[y] >> x & 1:
+                return False
+        return True
+
+    @property
+    def column_heights(self) -> tuple[int, ...]:
+        """列ごとの高さ (読み取り専用)。ロック / ライン消去のたびに差分更新される。"""
+        return tuple(self._heights)
+
+    def _recalc_heights(self):
+        """ボード全体を走査して列の高さを作り直す (ボードを直接書き換えた後用)。"""
+        for c in range(COLS):
+            self._heights[c] = self._scan_height(c, 0)
+
+    def _scan_height(self, col: int, start: int) -> int:
+        """start 行から下へ col 列を走査し、最初に埋まっているセルから高さを求める。"""
+        bit = 1 << col
+        board = self.board
+        for r in range(start, ROWS):
+            if board[r] & bit:
+                return ROWS - r
+        return 0
+
+    def _surface_drop(self, state: PieceState, x: int, y: int) -> int:
+        """ピースが各列の地表より完全に上にあれば、着地までの距離を返す。
+        オーバーハングの下に入り込んでいる場合などは -1 を返す。"""
+        heights = self._heights
+        drop = ROWS
+        for dx, max_dy in state.bottoms:
+            col = x + dx
+            if col < 0 or col >= COLS:
+                return -1
+            gap = ROWS - heights[col] - 1 - (y + max_dy)
+            if gap < 0:
+                return -1
+            if gap < drop:
+                drop = gap
+        return drop
+
+    def _fits(self, state: PieceState, x: int, y: int) -> bool:
+        return state_fits(self.board, state, x, y)
+
+    # ── 操作 ──
+    def move(self, dx: int, dy: int) -> bool:
+        piece = self.current
+        if not self._fits(piece.state, piece.x + dx, piece.y + dy):
+            return False
+        piece.x += dx
+        piece.y += dy
+        self.last_action = "move"
+        return True
+
+    def rotate(self, direction: int = 1) -> bool:
+        """SRS ウォールキック付き回転"""
+        piece = self.current
+        result = rotate_state(self.board, piece.state, piece.x, piece.y, direction)
+        if result is None:
+            return False
+        piece.x, piece.y, piece.state, self.last_kick_index = result
+        self.last_action = "rotate"
+        return True
+
+    def sonic_drop(self) -> bool:
+        """ロックせずに着地位置まで落とす。"""
+        dy = self.ghost_y()
+        if not dy:
+            return False
+        self.current.y += dy
+        self.last_action = "move"
+        return True
+
+    # ── 着地位置の列挙 (ボット用) ──
+    def legal_placements(self) -> list[Placement]:
+        """現在のピースが到達できる最終着地状態と、そこへ至る入力列を返す。"""
+        piece = self.current
+        return search_placements(
+            self.board, piece.name, piece.x, piece.y, piece.rotation
+        )
+
+    def run_path(self, path: tuple[str, ...]) -> bool:
+        """Placement.path の入力列を順に実行する。途中で失敗したら False。"""
+        for action in path:
+            if not self.handle_input(PATH_INPUTS[action]):
+                return False
+        return True
+
+    def handle_input(self, code: int) -> bool:
+        """入力コードを 1 つ処理する。記録中なら recorder にも渡す。
+        操作が受け付けられなかった (動けなかった) ときは False。"""
+        if self.recorder is not None:
+            self.recorder.record_input(code)
+
+        if self.game_over:
+            if code == INPUT_RESTART:
+                self.reset()
+                return True
+            return False
+        if self.clearing_rows:
+            return False
+
+        if code == INPUT_LEFT:
+            return self.move(-1, 0)
+        if code == INPUT_RIGHT:
+            return self.move(1, 0)
+        if code == INPUT_SOFT_DROP:
+            if self.move(0, 1):
+                self.score += 1
+                self.fall_timer = 0
+                return True
+            return False
+        if code == INPUT_ROTATE:
+            return self.rotate(1)
+        if code == INPUT_ROTATE_CCW:
+            return self.rotate(-1)
+        if code == INPUT_HARD_DROP:
+            self.hard_drop()
+            return True
+        if code == INPUT_HOLD:
+            used = self.hold_used
+            self.hold()
+            return not used
+        if code == INPUT_DOWN:
+            return self.move(0, 1)
+        if code == INPUT_SONIC_DROP:
+            return self.sonic_drop()
+        return False
+
+    def hold(self):
+        """現在のピースをホールドし、保留中のピースと交換する。"""
+        if self.hold_used:
+            return  # 1ターンに1回のみ
+
+        self.hold_used = True
+        if self.hold_piece is None:
+            # 初回ホールド: current を保管し、次のピースを出す
+            self.hold_piece = Tetromino(self.current.name)
+            self.current = self.next_piece
+            self.next_piece = self._next_piece()
+        else:
+            # 2回目以降: current と hold を交換
+            old_name = self.hold_piece.name
+            self.hold_piece = Tetromino(self.current.name)
+            self.current = Tetromino(old_name)
+
+        # 状態リセット
+        self.on_ground = False
+        self.lock_timer = 0
+        self.fall_timer = 0
+        self.last_action = "hold"
+
+        if self.telemetry is not None:
+            self.telemetry.emit(self, EVENT_HOLD, SHAPE_INDEX[self.hold_piece.name])
+
+        piece = self.current
+        if (self._surface_drop(piece.state, piece.x, piece.y) < 0
+                and not self._fits(piece.state, piece.x, piece.y)):
+            self._top_out()
+
+    def hard_drop(self):
+        dy = self.ghost_y()
+        if dy:
+            self.current.y += dy
+            self.score += 2 * dy
+            self.last_action = "move"
+        self._lock()
+
+    def ghost_y(self) -> int:
+        """ゴーストピースの Y オフセット"""
+        piece = self.current
+        # 地表より上にいれば列の高さから着地行が直接求まる
+        dy = self._surface_drop(piece.state, piece.x, piece.y)
+        if dy >= 0:
+            return dy
+        dy = 0
+        while self._fits(piece.state, piece.x, piece.y + dy + 1):
+            dy += 1
+        return dy
+
+    # ── T-Spin 判定 ──
+    def _check_tspin(self) -> str:
+        """T-Spin の種類を判定する。"" → '', 'mini', 'full'"""
+        if self.current.name != "T" or self.last_action != "rotate":
+            return ""
+        piece = self.current
+        return tspin_kind(
+            self.board, piece.x, piece.y, piece.rotation, self.last_kick_index
+        )
+
+    # ── 固定 & ライン消去 ──
+    def _lock(self):
+        # T-Spin 判定（ボードにセットする前に行う）
+        tspin = self._check_tspin()
+        self.pieces += 1
+
+        board = self.board
+        colors = self.colors
+        piece = self.current
+        px, py = piece.x, piece.y
+        color = piece.state.color
+        heights = self._heights
+        touched = set()
+        for dx, dy in piece.state.cells:
+            x = px + dx
+            y = py + dy
+            if 0 <= y < ROWS and 0 <= x < COLS:
+                board[y] |= 1 << x
+                row = colors[y]
+                colors[y] = row[:x] + (color,) + row[x + 1:]
+                touched.add(y)
+                if ROWS - y > heights[x]:
+                    heights[x] = ROWS - y
+            elif y < 0:
+                self._top_out()
+                return
+
+        if self.telemetry is not None:
+            self.telemetry.emit(self, EVENT_LOCK, px, py, piece.rotation, tspin)
+
+        # ライン消去チェック (ピースが置かれた行だけ見ればよい)
+        full_rows = sorted(r for r in touched if board[r] == FULL_ROW)
+        if full_rows:
+            self.clearing_rows = full_rows
+            self.clear_timer = self.clear_duration
+            self.last_tspin = tspin
+        else:
+            # ライン消去なしでも T-Spin 0 行ボーナス
+            self.score += clear_score(0, tspin)
+            self.last_tspin = tspin
+            self._spawn_next()
+
+    def _clear_lines(self):
+        num = len(self.clearing_rows)
+        tspin = self.last_tspin
+        cleared = set(self.clearing_rows)
+        keep = [r for r in range(ROWS) if r not in cleared]
+        self.board = [0] * num + [self.board[r] for r in keep]
+        self.colors = [EMPTY_COLOR_ROW] * num + [self.colors[r] for r in keep]
+
+        # 列の高さ: 最上段のセルが消えた列だけ走査し直し、他は消去行数ぶん下げる
+        heights = self._heights
+        for c in range(COLS):
+            top = ROWS - heights[c]
+            if top in cleared:
+                heights[c] = self._scan_height(c, top + num)
+            else:
+                heights[c] -= num
+
+        self.lines += num
+
+        # スコア計算 (T-Spin ボーナス)
+        self.score += clear_score(num, tspin)
+
+        level = self.level
+        self.level = self.lines // 10 + 1
+        if self.telemetry is not None:
+            self.telemetry.emit(self, EVENT_CLEAR, num, tspin=tspin)
+            if self.level != level:
+                self.telemetry.emit(self, EVENT_LEVEL)
+        self.fall_interval = self._calc_interval()
+        self.clearing_rows = []
+        self.last_tspin = ""
+        self._spawn_next()
+
+    def add_garbage(self, count: int, hole: int):
+        """下から count 行のおじゃまライン (hole 列だけ空き) をせり上げる。
+        消去アニメーション中は行番号がずれるので呼ばないこと。
+        押し出されたブロックがあるか、操作中のピースが置けなくなればゲームオーバー。"""
+        count = min(count, ROWS)
+        if count <= 0:
+            return
+        if any(self.board[:count]):
+            self._top_out()
+        row = FULL_ROW & ~(1 << hole)
+        self.board = self.board[count:] + [row] * count
+        garbage = tuple(None if c == hole else GARBAGE_COLOR for c in range(COLS))
+        self.colors = self.colors[count:] + [garbage] * count
+        heights = self._heights
+        for c in range(COLS):
+            if c != hole or heights[c]:
+                heights[c] = min(ROWS, heights[c] + count)
+
+        # 操作中のピースに重なったら、置ける位置まで持ち上げる
+        piece = self.current
+        for _ in range(count):
+            if self._fits(piece.state, piece.x, piece.y):
+                break
+            piece.y -= 1
+        else:
+            if not self._fits(piece.state, piece.x, piece.y):
+                self._top_out()
+
+    def _spawn_next(self):
+        self.current = self.next_piece
+        self.next_piece = self._next_piece()
+        self.on_ground = False
+        self.lock_timer = 0
+        self.hold_used = False   # 新しいピースでホールド解禁
+
+        piece = self.current
+        if (self._surface_drop(piece.state, piece.x, piece.y) < 0
+                and not self._fits(piece.state, piece.x, piece.y)):
+            self._top_out()
+        elif self.telemetry is not None:
+            self.telemetry.emit(self, EVENT_SPAWN)
+
+    def _top_out(self):
+        if self.game_over:
+            return
+        self.game_over = True
+        if self.telemetry is not None:
+            self.telemetry.emit(self, EVENT_GAME_OVER)
+
+    # ── 更新 ──
+    def update(self, dt: int):
+        if self.recorder is not None:
+            self.recorder.record_tick(dt)
+        if self.game_over:
+            return
+
+        # ライン消去アニメーション中
+        if self.clearing_rows:
+            self.clear_timer -= dt
+            if self.clear_timer <= 0:
+                self._clear_lines()
+            return
+
+        # 自然落下
+        self.fall_timer += dt
+        if self.fall_timer >= self.fall_interval:
+            self.fall_timer = 0
+            if not self.move(0, 1):
+                # 地面に到達
+                if self.on_ground:
+                    self.lock_timer += self.fall_interval
+                    if self.lock_timer >= self.lock_delay:
+                        self._lock()
+                else:
+                    self.on_ground = True
+                    self.lock_timer = 0
+            else:
+                self.on_ground = False
+                self.lock_timer = 0
+
+
+class RewindBuffer:
+    """ピースが出るたびにスナップショットを取り、古いものから捨てるリングバッファ。
+    undo() で 1 つ前のピースが出た時点に戻す。"""
+
+    def __init__(self, capacity: int = 64):
+        self._snaps: deque[GameSnapshot] = deque(maxlen=capacity)
+        self._pieces: int | None = None
+
+    def __len__(self) -> int:
+        return len(self._snaps)
+
+    def clear(self):
+        self._snaps.clear()
+        self._pieces = None
+
+    def track(self, game: Game):
+        """毎フレーム呼ぶ。新しいピースが出ていればスナップショットを積む。"""
+        if game.pieces != self._pieces and not game.clearing_rows and not game.game_over:
+            self._pieces = game.pieces
+            self._snaps.append(game.snapshot())
+
+    def undo(self, game: Game) -> bool:
+        """直前に置いたピースを取り消す (ゲームオーバー中なら最後のピースをやり直す)。
+        戻れる状態がなければ False。"""
+        if game.game_over and self._snaps:
+            snap = self._snaps[-1]
+        elif len(self._snaps) >= 2:
+            self._snaps.pop()
+            snap = self._snaps[-1]
+        else:
+            return False
+        game.restore(snap)
+        self._pieces = snap.pieces
+        return True
+
+
+# ──────────────────────────────────────
+#  入力
+# ──────────────────────────────────────
+class AutoShift:
+    """左右移動とソフトドロップの DAS / ARR をティック単位で進める状態機械。
+    毎ティック現在のキー状態を受け取り、必要な入力コードを game.handle_input へ送る。
+    左右を同時に押したときは後から押した方を優先する。"""
+
+    def __init__(self, das: int = DAS_MS, arr: int = ARR_MS, soft_drop: int = SOFT_DROP_MS):
+        self.das = das
+        self.arr = arr
+        self.soft_drop = soft_drop
+        self.direction = 0      # -1: 左, 1: 右, 0: なし
+        self.charge = 0         # 現在の方向を押し続けている時間 (ms)
+        self.drop_timer = 0
+        self._left = self._right = self._down = False
+
+    def reset(self):
+        self.direction = 0
+        self.charge = self.drop_timer = 0
+        self._left = self._right = self._down = False
+
+    def tick(self, game: Game, left: bool, right: bool, down: bool, dt: int = TICK_MS):
+        pressed_left = left and not self._left
+        pressed_right = right and not self._right
+        pressed_down = down and not self._down
+        self._left, self._right, self._down = left, right, down
+
+        # 方向の決定: 新しく押された方 > 押し続けている方
+        if pressed_left or pressed_right:
+            direction = -1 if pressed_left else 1
+        elif self.direction == -1 and left or self.direction == 1 and right:
+            direction = self.direction
+        else:
+            direction = -1 if left else 1 if right else 0
+
+        # 消去アニメーション中は入力できないが、DAS の溜めは維持する
+        busy = game.game_over or game.clearing_rows
+        code = INPUT_LEFT if direction < 0 else INPUT_RIGHT
+        if direction != self.direction:
+            self.direction = direction
+            self.charge = 0
+            if direction and not busy:
+                game.handle_input(code)
+        elif direction:
+            self.charge += dt
+            if busy:
+                self.charge = min(self.charge, self.das)
+            elif self.charge >= self.das:
+                if self.arr == 0:
+                    while game.handle_input(code):
+                        pass
+                    self.charge = self.das
+                else:
+                    while self.charge >= self.das:
+                        game.handle_input(code)
+                        self.charge -= self.arr
+
+        if not down or busy:
+            self.drop_timer = 0
+        elif pressed_down:
+            game.handle_input(INPUT_SOFT_DROP)
+        else:
+            self.drop_timer += dt
+            while self.drop_timer >= self.soft_drop:
+                game.handle_input(INPUT_SOFT_DROP)
+                self.drop_timer -= self.soft_drop
@@ -0,0 +1,314 @@
+"""
+テトリス — フレームの書き出し (ウィンドウなし)
+==============================================
+リプレイやボットの対局を Renderer でオフスクリーンの Surface に描き、
+ゲーム内時間で fps ごとに 1 フレームを連番 PNG か生の RGB ストリームとして書き出す。
+実時間を待たないので、ハイライト動画の素材を大量のセッションから高速に作れる。
+
+画面の読み出しは pygame.surfarray のビュー (コピーなし) から事前確保したバッファへ
+チャンネルを並べ替えてコピーするだけで、PNG の圧縮やパイプへの書き込みはワーカースレッドが
+行う (zlib と書き込みは GIL を離すので描画と並行に進む)。バッファが全部使用中なら空くまで
+描画側が待つ。前のフレームから画面が変わっていなければ読み出しも圧縮もせず、
+同じデータをもう一度書くだけにする。
+
+使い方:
+  python tetris_export.py replay a.trp b.trp -o clips/            : clips/a/frame_000000.png ...
+  python tetris_export.py replay logs/*.trp -o clips/ --format raw -j 8
+  python tetris_export.py replay a.trp --pipe "ffmpeg -y -f rawvideo -pix_fmt rgb24 -s {size} -r {fps} -i - {name}.mp4"
+  python tetris_export.py replay a.trp -o - --format raw | ffplay -f rawvideo -pixel_format rgb24 -video_size 520x690 -
+  python tetris_export.py bot --seed 3 -n 200 -o clips/
+"""
+
+import argparse
+import os
+import queue
+import shlex
+import struct
+import subprocess
+import sys
+import threading
+import time
+import zlib
+from multiprocessing import Pool
+
+import numpy as np
+
+# pygame の起動メッセージが標準出力の生フレームに混ざらないようにする
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+import pygame
+
+from tetris import SCREEN_W, SCREEN_H, Renderer
+from tetris_engine import TICK_MS, Game
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+# ──────────────────────────────────────
+#  PNG
+# ──────────────────────────────────────
+def _png_chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+
+def encode_png(rows: np.ndarray, width: int, height: int, level: int = 1) -> bytes:
+    """rows は各行の先頭にフィルタ種別 0 のバイトを置いた (height, 1 + width * 3) の RGB。"""
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (PNG_SIGNATURE + _png_chunk(b"IHDR", header)
+            + _png_chunk(b"IDAT", zlib.compress(rows, level)) + _png_chunk(b"IEND", b""))
+
+
+# ──────────────────────────────────────
+#  書き出し先
+# ──────────────────────────────────────
+class FrameSink:
+    """画面を事前確保したバッファへ読み出し、ワーカースレッドで書き出す。
+    padding は各行の先頭に空けるバイト数 (PNG のフィルタ種別用)。"""
+
+    def __init__(self, size: tuple[int, int], threads: int = 1, buffers: int = 8,
+                 padding: int = 0):
+        self.width, self.height = size
+        self.frames = 0
+        self._padding = padding
+        self._pending: list | None = None     # [番号, バッファ, 枚数] まだ書き出しに回していない
+        self._free: queue.Queue = queue.Queue()
+        for _ in range(max(buffers, threads + 1)):
+            self._free.put(np.zeros((self.height, padding + self.width * 3), np.uint8))
+        self._jobs: queue.Queue = queue.Queue()
+        self._error: BaseException | None = None
+        self._threads = [
+            threading.Thread(target=self._work, name=f"export-{i}", daemon=True)
+            for i in range(threads)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, screen: pygame.Surface):
+        """screen (32 ビット) の現在の内容を 1 フレームとして書き出しに回す。"""
+        if self._error is not None:
+            raise self._error
+        buf = self._free.get()          # 全部使用中ならエンコードが追いつくまで待つ
+        rgb = buf[:, self._padding:].reshape(self.height, self.width, 3)
+        # pixels2d は (幅, 高さ) の 32 ビット画素のビュー。転置すると行優先に並ぶので、
+        # バイト単位で見て R, G, B のチャンネルを取り出す (pixels3d の転置より数倍速い)
+        pixels = pygame.surfarray.pixels2d(screen)
+        channels = pixels.T.view(np.uint8).reshape(self.height, self.width, 4)
+        for i, shift in enumerate(screen.get_shifts()[:3]):
+            byte = shift // 8 if sys.byteorder == "little" else 3 - shift // 8
+            np.copyto(rgb[:, :, i], channels[:, :, byte])
+        del pixels, channels                           # Surface のロックを外す
+        self._flush_pending()
+        self._pending = [self.frames, buf, 1]
+        self.frames += 1
+
+    def repeat(self):
+        """直前に submit した画面をもう 1 フレーム書く。"""
+        self._pending[2] += 1
+        self.frames += 1
+
+    def _flush_pending(self):
+        if self._pending is not None:
+            self._jobs.put(tuple(self._pending))
+            self._pending = None
+
+    def _work(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            index, buf, count = job
+            try:
+                if self._error is None:
+                    self.write(index, buf, count)
+            except BaseException as e:
+                self._error = e
+            self._free.put(buf)
+
+    def write(self, index: int, buf: np.ndarray, count: int):
+        """フレーム index から count 枚ぶん、同じ画面 buf を書く。"""
+        raise NotImplementedError
+
+    def close(self):
+        """残りのフレームを書き終えるまで待つ。"""
+        self._flush_pending()
+        for _ in self._threads:
+            self._jobs.put(None)
+        for thread in self._threads:
+            thread.join()
+        if self._error is not None:
+            raise self._error
+
+
+class PngSequence(FrameSink):
+    """directory/frame_000000.png ... の連番 PNG。フレームごとに独立なので複数スレッドで圧縮する。"""
+
+    def __init__(self, directory: str, size: tuple[int, int], threads: int = 4,
+                 level: int = 1):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.level = level
+        super().__init__(size, threads, buffers=threads * 2, padding=1)
+
+    def write(self, index: int, buf: np.ndarray, count: int):
+        data = encode_png(buf, self.width, self.height, self.level)
+        for i in range(index, index + count):
+            with open(os.path.join(self.directory, f"frame_{i:06d}.png"), "wb") as f:
+                f.write(data)
+
+
+class RawStream(FrameSink):
+    """rgb24 の生フレームをファイル / パイプへ順に書く。順序を保つため書き込みは 1 スレッド。"""
+
+    def __init__(self, file, size: tuple[int, int], process: subprocess.Popen | None = None):
+        self.file = file
+        self.process = process
+        super().__init__(size, threads=1, buffers=8)
+
+    def write(self, index: int, buf: np.ndarray, count: int):
+        for _ in range(count):
+            self.file.write(buf)
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            if self.file is not sys.stdout.buffer:
+                self.file.close()
+            if self.process is not None and self.process.wait() != 0:
+                raise RuntimeError(f"エンコーダが終了コード {self.process.returncode} で終了しました")
+
+
+# ──────────────────────────────────────
+#  描画ループ
+# ──────────────────────────────────────
+def bot_steps(game: Game, bot, pieces: int, piece_ms: int):
+    """ボットに 1 手打たせるたびに piece_ms ぶん TICK_MS 刻みで時間を進め、dt を返す。"""
+    placed = 0
+    while placed < pieces and not game.game_over:
+        if not game.clearing_rows:
+            if not bot.play(game):
+                return
+            placed += 1
+        for _ in range(max(1, piece_ms // TICK_MS)):
+            game.update(TICK_MS)
+            yield TICK_MS
+            if game.game_over:
+                break
+    for _ in range(max(1, 1000 // TICK_MS)):       # 最後の盤面を 1 秒ほど映す
+        yield TICK_MS
+
+
+def render_steps(game: Game, steps, sink: FrameSink, fps: int) -> int:
+    """steps (経過時間 dt のイテレータ) を進めながら、ゲーム内時間で fps ごとに書き出す。"""
+    pygame.font.init()
+    screen = pygame.Surface((SCREEN_W, SCREEN_H), 0, 32)
+    renderer = Renderer(screen)
+    frame_ms = 1000 / fps
+    renderer.draw(game)
+    sink.submit(screen)
+    elapsed = 0.0
+    next_frame = frame_ms
+    for dt in steps:
+        elapsed += dt
+        if elapsed < next_frame:
+            continue
+        # ティック境界で描くので補間はいらない。変化が無ければ前の画面を繰り返す
+        changed = bool(renderer.draw(game))
+        while elapsed >= next_frame:
+            if changed:
+                sink.submit(screen)
+                changed = False
+            else:
+                sink.repeat()
+            next_frame += frame_ms
+    return sink.frames
+
+
+def open_sink(args: argparse.Namespace, name: str) -> FrameSink:
+    size = (SCREEN_W, SCREEN_H)
+    if args.pipe:
+        command = args.pipe.format(size=f"{SCREEN_W}x{SCREEN_H}", fps=args.fps, name=name)
+        process = subprocess.Popen(shlex.split(command), stdin=subprocess.PIPE)
+        return RawStream(process.stdin, size, process)
+    if args.format == "raw":
+        if args.output == "-":
+            return RawStream(sys.stdout.buffer, size)
+        os.makedirs(args.output, exist_ok=True)
+        return RawStream(open(os.path.join(args.output, name + ".rgb"), "wb"), size)
+    return PngSequence(os.path.join(args.output, name), size, args.threads, args.level)
+
+
+def export_replay(task: tuple) -> tuple[str, int, float]:
+    """(リプレイのパス, 引数) を書き出し、(パス, フレーム数, 秒) を返す。"""
+    from tetris_replay import replay_steps
+    path, args = task
+    start = time.perf_counter()
+    game, steps = replay_steps(path)
+    sink = open_sink(args, os.path.splitext(os.path.basename(path))[0])
+    try:
+        frames = render_steps(game, steps, sink, args.fps)
+    finally:
+        sink.close()
+    return path, frames, time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="テトリス フレームの書き出し")
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("-o", "--output", default="frames",
+                        help="出力先ディレクトリ (--format raw なら - で標準出力)")
+    common.add_argument("--format", choices=("png", "raw"), default="png")
+    common.add_argument("--pipe", default=None,
+                        help="生フレームを標準入力に流すコマンド ({size} {fps} {name} を置換)")
+    common.add_argument("--fps", type=int, default=60)
+    common.add_argument("--threads", type=int, default=4, help="PNG を圧縮するスレッド数")
+    common.add_argument("--level", type=int, default=1, help="PNG の圧縮レベル (0〜9)")
+
+    sub = parser.add_subparsers(dest="command", required=True)
+    rp = sub.add_parser("replay", parents=[common], help="リプレイを書き出す")
+    rp.add_argument("files", nargs="+")
+    rp.add_argument("-j", "--jobs", type=int, default=1, help="並列プロセス数")
+
+    bp = sub.add_parser("bot", parents=[common], help="ボットの対局を書き出す")
+    bp.add_argument("--seed", type=int, default=0)
+    bp.add_argument("-n", "--pieces", type=int, default=100)
+    bp.add_argument("--piece-ms", type=int, default=200, help="1 手あたりのゲーム内時間")
+    bp.add_argument("--budget", type=float, default=0,
+                    help="1 手あたりの思考時間 (ms, 0 で無制限)")
+    args = parser.parse_args()
+
+    if args.output == "-" and args.command == "replay" and len(args.files) > 1:
+        parser.error("標準出力に書けるのは 1 ファイルだけです")
+    log = sys.stderr
+
+    if args.command == "bot":
+        from tetris_bot import Bot
+        start = time.perf_counter()
+        game = Game(args.seed)
+        sink = open_sink(args, f"bot_{args.seed}")
+        try:
+            # 時間制限があると手がマシンの速さに左右されるので、既定では無制限
+            bot = Bot(time_budget_ms=args.budget or None)
+            frames = render_steps(game, bot_steps(game, bot, args.pieces, args.piece_ms),
+                                  sink, args.fps)
+        finally:
+            sink.close()
+        seconds = time.perf_counter() - start
+        print(f"seed={args.seed}  {frames} フレーム  {seconds:.2f} 秒 "
+              f"({frames / seconds:.0f} fps)", file=log)
+        return
+
+    tasks = [(path, args) for path in args.files]
+    if args.jobs > 1:
+        with Pool(args.jobs) as pool:
+            _report(pool.imap(export_replay, tasks), log)
+    else:
+        _report(map(export_replay, tasks), log)
+
+
+def _report(results, log):
+    for path, frames, seconds in results:
+        print(f"{path}  {frames} フレーム  {seconds:.2f} 秒 ({frames / seconds:.0f} fps)", file=log)
+
+
+if __name__ == "__main__":
+    main()
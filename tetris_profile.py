@@ -0,0 +1,182 @@
+"""
+テトリス — フレームプロファイラ
+================================
+main(profile=パス) で有効になる計測レイヤ。
+1 フレームを tick (待ち) / events / update / draw / flip に分け、
+draw は Renderer の _draw_* ごとにさらに分けて計測する。
+計測値は事前確保したリングバッファ (array) に入るので、記録のコストはほぼ一定。
+
+  F3 : 画面上部にフレーム時間のグラフと p50 / p99 を表示 (切り替え)
+  終了時に拡張子に応じて JSON または CSV へ書き出す。
+"""
+
+import csv
+import json
+import time
+from array import array
+
+import pygame
+
+from tetris import SCREEN_W, TOP_MARGIN, TEXT_COLOR, TEXT_DIM
+
+# 計測区間 (この順にリングバッファの列になる)
+SECTIONS = (
+    "tick", "events", "update", "draw",
+    "_draw_board_bg", "_draw_grid", "_draw_ghost", "_draw_current",
+    "_draw_clearing", "_flush_cells", "_draw_side_panel", "_draw_game_over",
+    "overlay", "flip", "frame",
+)
+RENDER_SECTIONS = SECTIONS[4:12]
+
+GRAPH_COLOR = (90, 200, 120)
+GRAPH_SLOW = (255, 90, 90)
+GRAPH_BUDGET_MS = 1000 / 60
+
+
+def percentile(values: list[float], q: float) -> float:
+    """values の q 分位 (q は 0〜1)。空なら 0。"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class FrameProfiler:
+    def __init__(self, capacity: int = 3600):
+        self.capacity = capacity
+        self.frames = 0                     # 記録したフレームの総数
+        self.overlay = False
+        self._col = {name: i for i, name in enumerate(SECTIONS)}
+        self._width = len(SECTIONS)
+        self._ring = array("d", bytes(8 * capacity * self._width))
+        self._acc = [0.0] * self._width     # 現在のフレームの累積値 (秒)
+        self._overlay_rect = pygame.Rect(10, 2, SCREEN_W - 20, TOP_MARGIN - 6)
+        self._overlay_drawn = False
+        self._summary: pygame.Surface | None = None
+
+    # ── 計測 ──
+    def instrument(self, renderer):
+        """renderer の _draw_* をインスタンス単位で計測付きの関数に差し替える。"""
+        perf = time.perf_counter
+        acc = self._acc
+        for name in RENDER_SECTIONS:
+            method = getattr(renderer, name)
+            col = self._col[name]
+
+            def timed(*args, _method=method, _col=col, **kwargs):
+                start = perf()
+                try:
+                    return _method(*args, **kwargs)
+                finally:
+                    acc[_col] += perf() - start
+
+            setattr(renderer, name, timed)
+
+    def add(self, section: str, seconds: float):
+        self._acc[self._col[section]] += seconds
+
+    def record_frame(self, t_start: float, t_tick: float, t_events: float,
+                     t_update: float, t_draw: float, t_flip: float):
+        """main() の各区間の境目の時刻から 1 フレーム分を確定してリングへ書く。"""
+        acc = self._acc
+        col = self._col
+        acc[col["tick"]] = t_tick - t_start
+        acc[col["events"]] = t_events - t_tick
+        acc[col["update"]] = t_update - t_events
+        acc[col["draw"]] = t_draw - t_update
+        acc[col["flip"]] = t_flip - t_draw - acc[col["overlay"]]
+        acc[col["frame"]] = t_flip - t_start
+
+        base = (self.frames % self.capacity) * self._width
+        self._ring[base:base + self._width] = array("d", acc)
+        self.frames += 1
+        for i in range(self._width):
+            acc[i] = 0.0
+
+    # ── 集計 ──
+    def column(self, section: str, last: int | None = None) -> list[float]:
+        """リングに残っているフレーム (last 指定時は直近 last 個) の section 列。
+        古い順、単位は秒。"""
+        n = min(self.frames, self.capacity)
+        if last is not None:
+            n = min(n, last)
+        start = self.frames - n
+        col = self._col[section]
+        w = self._width
+        return [self._ring[((start + i) % self.capacity) * w + col] for i in range(n)]
+
+    def summary(self) -> dict[str, dict[str, float]]:
+        """区間ごとの平均・p50・p99・最大 (ミリ秒)"""
+        result = {}
+        for name in SECTIONS:
+            values = self.column(name)
+            if not values:
+                continue
+            result[name] = {
+                "mean_ms": sum(values) / len(values) * 1000,
+                "p50_ms": percentile(values, 0.50) * 1000,
+                "p99_ms": percentile(values, 0.99) * 1000,
+                "max_ms": max(values) * 1000,
+            }
+        return result
+
+    def export(self, path: str):
+        """拡張子が .csv ならフレームごとの表、それ以外は集計 + フレーム列の JSON。"""
+        columns = {name: self.column(name) for name in SECTIONS}
+        n = len(columns["frame"])
+        if path.endswith(".csv"):
+            with open(path, "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow([f"{name}_ms" for name in SECTIONS])
+                for i in range(n):
+                    writer.writerow([f"{columns[name][i] * 1000:.4f}" for name in SECTIONS])
+        else:
+            with open(path, "w") as f:
+                json.dump({
+                    "frames": self.frames,
+                    "kept": n,
+                    "summary": self.summary(),
+                    "sections_ms": {
+                        name: [round(v * 1000, 4) for v in values]
+                        for name, values in columns.items()
+                    },
+                }, f)
+
+    # ── オーバーレイ ──
+    def toggle_overlay(self):
+        self.overlay = not self.overlay
+
+    def draw_overlay(self, renderer) -> list[pygame.Rect]:
+        """画面上部の余白にフレーム時間グラフと p50 / p99 を描く。"""
+        start = time.perf_counter()
+        rect = self._overlay_rect
+        if not self.overlay:
+            if not self._overlay_drawn:
+                return []
+            self._overlay_drawn = False
+            renderer.clear_area(rect)
+            return [rect]
+
+        screen = renderer.screen
+        renderer.clear_area(rect)
+        frames = self.column("frame", last=rect.width // 2)
+        scale = rect.height / (GRAPH_BUDGET_MS * 2)
+        for i, seconds in enumerate(frames):
+            ms = seconds * 1000
+            h = min(rect.height, max(1, int(ms * scale)))
+            color = GRAPH_SLOW if ms > GRAPH_BUDGET_MS * 1.05 else GRAPH_COLOR
+            x = rect.x + i * 2
+            pygame.draw.line(screen, color, (x, rect.bottom - 1), (x, rect.bottom - h))
+        budget_y = rect.bottom - int(GRAPH_BUDGET_MS * scale)
+        pygame.draw.line(screen, TEXT_DIM, (rect.x, budget_y), (rect.right - 1, budget_y))
+
+        # 文字列は 15 フレームごとに描き直す
+        if self.frames % 15 == 0 or self._summary is None:
+            label = (f"p50 {percentile(frames, 0.5) * 1000:.1f}ms  "
+                     f"p99 {percentile(frames, 0.99) * 1000:.1f}ms")
+            self._summary = renderer.font_small.render(label, True, TEXT_COLOR)
+        screen.blit(self._summary, (rect.right - self._summary.get_width(), rect.y))
+
+        self._overlay_drawn = True
+        self.add("overlay", time.perf_counter() - start)
+        return [rect]
@@ -0,0 +1,258 @@
+"""
+テトリス — リプレイの記録と再生
+================================
+Game の seed・入力コード・update(dt) をコンパクトなバイナリ形式で
+プレイ中に逐次ファイルへ書き出し、描画なしで再シミュレーションして
+最終スコアと盤面を検証する。
+
+使い方:
+  python tetris.py ...                         : main(record=パス) で記録
+  python tetris_replay.py replay a.trp b.trp   : 再生して検証 (描画なし)
+  python tetris_replay.py replay -j 8 logs/*.trp
+
+  結果は OK / MISMATCH (記録と違う) / INCOMPLETE (終了レコードが無い) /
+  CORRUPT (ファイルが壊れていて読めない)。OK 以外が 1 つでもあれば終了コード 1。
+
+ファイル形式 (リトルエンディアン):
+  ヘッダ   : b"TRPL" | version u8 | COLS u8 | ROWS u8 | seed u64
+  入力     : 0x10 | code           (1 バイト)
+  経過時間 : 0x01 dt(u8) / 0x02 dt(u16) / 0x03 dt(u32)
+  終了     : 0xFF | score u32 | lines u32 | 盤面の CRC32 u32
+"""
+
+import argparse
+import struct
+import sys
+import time
+import zlib
+from multiprocessing import Pool
+from typing import Iterator, NamedTuple
+
+from tetris_engine import COLS, ROWS, Game
+
+MAGIC = b"TRPL"
+VERSION = 1
+HEADER = struct.Struct("<4sBBBQ")
+END = struct.Struct("<III")
+U8 = struct.Struct("<B")
+U16 = struct.Struct("<H")
+U32 = struct.Struct("<I")
+
+TAG_INPUT = 0x10
+TAG_TICK8 = 0x01
+TAG_TICK16 = 0x02
+TAG_TICK32 = 0x03
+TAG_END = 0xFF
+
+FLUSH_SIZE = 4096       # この大きさごとにファイルへ書き出す
+
+
+def board_crc(game: Game) -> int:
+    """盤面 (行ビットマスク) の CRC32"""
+    return zlib.crc32(struct.pack(f"<{ROWS}H", *game.board))
+
+
+# ──────────────────────────────────────
+#  記録
+# ──────────────────────────────────────
+class ReplayWriter:
+    """Game.recorder として入力と経過時間を受け取り、逐次ファイルへ書き出す。"""
+
+    def __init__(self, path: str, game: Game):
+        self.file = open(path, "wb")
+        self.buf = bytearray(HEADER.pack(MAGIC, VERSION, COLS, ROWS, game.seed))
+        game.recorder = self
+
+    def record_input(self, code: int):
+        self.buf.append(TAG_INPUT | code)
+        if len(self.buf) >= FLUSH_SIZE:
+            self.flush()
+
+    def record_tick(self, dt: int):
+        buf = self.buf
+        if dt < 0x100:
+            buf.append(TAG_TICK8)
+            buf.append(dt)
+        elif dt < 0x10000:
+            buf.append(TAG_TICK16)
+            buf += U16.pack(dt)
+        else:
+            buf.append(TAG_TICK32)
+            buf += U32.pack(dt)
+        if len(buf) >= FLUSH_SIZE:
+            self.flush()
+
+    def flush(self):
+        self.file.write(self.buf)
+        self.buf.clear()
+
+    def close(self, game: Game):
+        """最終スコアと盤面を書いてファイルを閉じる。"""
+        self.buf.append(TAG_END)
+        self.buf += END.pack(game.score, game.lines, board_crc(game))
+        self.flush()
+        self.file.close()
+        game.recorder = None
+
+
+# ──────────────────────────────────────
+#  再生
+# ──────────────────────────────────────
+class ReplayResult(NamedTuple):
+    path: str
+    ok: bool | None         # None = 終了レコードが無い (記録が途中で切れた)
+    score: int
+    lines: int
+    expected_score: int | None
+    expected_lines: int | None
+    board_ok: bool | None
+    inputs: int
+    ticks: int
+    seconds: float
+    error: str | None = None    # ファイルが壊れていて再生できなかった理由
+
+
+def _load(path: str) -> tuple[bytes, int]:
+    """ファイルを読んでヘッダを確かめ、(データ, seed) を返す。"""
+    with open(path, "rb") as f:
+        data = f.read()
+    magic, version, cols, rows, seed = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"リプレイ形式が違います: {path}")
+    if (cols, rows) != (COLS, ROWS):
+        raise ValueError(f"盤面サイズが違います: {cols}x{rows}")
+    return data, seed
+
+
+def _records(data: bytes) -> Iterator[tuple[str, object]]:
+    """ヘッダより後のレコードを順に ("input", code) / ("tick", dt) /
+    ("end", (score, lines, crc)) として返す。途中で切れていれば struct.error。"""
+    i = HEADER.size
+    n = len(data)
+    while i < n:
+        tag = data[i]
+        i += 1
+        if tag & 0xF0 == TAG_INPUT:
+            yield "input", tag & 0x0F
+        elif tag == TAG_TICK8:
+            yield "tick", U8.unpack_from(data, i)[0]
+            i += 1
+        elif tag == TAG_TICK16:
+            yield "tick", U16.unpack_from(data, i)[0]
+            i += 2
+        elif tag == TAG_TICK32:
+            yield "tick", U32.unpack_from(data, i)[0]
+            i += 4
+        elif tag == TAG_END:
+            yield "end", END.unpack_from(data, i)
+            return
+        else:
+            raise ValueError(f"不正なレコード 0x{tag:02x} (オフセット {i - 1})")
+
+
+def replay_steps(path: str) -> tuple[Game, Iterator[int]]:
+    """(Game, 経過時間のイテレータ)。イテレータを進めるごとに記録どおり入力と
+    update(dt) を 1 回ぶん適用して dt を返す (描画しながら再生する用)。"""
+    data, seed = _load(path)
+    game = Game(seed)
+
+    def steps():
+        for kind, value in _records(data):
+            if kind == "input":
+                game.handle_input(value)
+            elif kind == "tick":
+                game.update(value)
+                yield value
+
+    return game, steps()
+
+
+def replay(path: str) -> ReplayResult:
+    """リプレイを描画なしで再シミュレーションし、記録された結果と照合する。"""
+    start = time.perf_counter()
+    data, seed = _load(path)
+
+    game = Game(seed)
+    handle_input = game.handle_input
+    update = game.update
+    expected = None
+    inputs = ticks = 0
+    for kind, value in _records(data):
+        if kind == "input":
+            handle_input(value)
+            inputs += 1
+        elif kind == "tick":
+            update(value)
+            ticks += 1
+        else:
+            expected = value
+
+    ok = board_ok = None
+    exp_score = exp_lines = None
+    if expected is not None:
+        exp_score, exp_lines, crc = expected
+        board_ok = crc == board_crc(game)
+        ok = board_ok and exp_score == game.score and exp_lines == game.lines
+
+    return ReplayResult(
+        path, ok, game.score, game.lines, exp_score, exp_lines, board_ok,
+        inputs, ticks, time.perf_counter() - start,
+    )
+
+
+def audit(path: str) -> ReplayResult:
+    """replay() と同じだが、壊れたファイルは例外にせず error 付きの結果にする
+    (Pool で流しているときに 1 ファイルで全体が止まらないように)。"""
+    start = time.perf_counter()
+    try:
+        return replay(path)
+    except (struct.error, ValueError, OSError) as exc:
+        reason = "ファイルが途中で切れています" if isinstance(exc, struct.error) else str(exc)
+        return ReplayResult(path, False, 0, 0, None, None, None, 0, 0,
+                            time.perf_counter() - start, reason)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="テトリス リプレイ")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rp = sub.add_parser("replay", help="リプレイを再生して最終スコアと盤面を検証する")
+    rp.add_argument("files", nargs="+")
+    rp.add_argument("-j", "--jobs", type=int, default=1, help="並列プロセス数")
+    args = parser.parse_args()
+
+    failed = 0
+    if args.jobs > 1:
+        with Pool(args.jobs) as pool:
+            results = pool.imap(audit, args.files, chunksize=8)
+            failed = _report(results)
+    else:
+        failed = _report(map(audit, args.files))
+    sys.exit(1 if failed else 0)
+
+
+def _report(results) -> int:
+    failed = 0
+    for r in results:
+        if r.error is not None:
+            status = "CORRUPT"
+        elif r.ok is None:
+            status = "INCOMPLETE"
+        elif r.ok:
+            status = "OK"
+        else:
+            status = "MISMATCH"
+        if not r.ok:
+            failed += 1
+        if r.error is not None:
+            print(f"{status:10} {r.path}  {r.error}")
+            continue
+        print(f"{status:10} {r.path}  score={r.score} lines={r.lines} "
+              f"inputs={r.inputs} ticks={r.ticks} ({r.seconds * 1000:.1f} ms)")
+        if r.ok is False:
+            print(f"           期待値: score={r.expected_score} "
+                  f"lines={r.expected_lines} board={'OK' if r.board_ok else 'NG'}")
+    return failed
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,484 @@
+"""
+テトリス — 対戦サーバ
+====================
+1 つの asyncio イベントループで多数の Game を同時に動かすヘッドレスの対戦サーバ。
+接続した順に 2 人ずつ対戦を組み、ライン消去に応じておじゃまラインを送り合う。
+全試合の update はループ 1 周ごとにまとめて進め、各クライアントには
+前回送った状態からの差分 (変わった行・ピース・スコアなど) だけを送る。
+
+使い方:
+  python tetris_server.py serve --port 7878          : サーバを起動
+  python tetris_server.py loopback -m 200 -s 10      : 200 試合分のクライアントを
+                                                       同じプロセスから繋いで負荷試験
+
+プロトコル (リトルエンディアン):
+  クライアント → サーバ : 入力 1 バイト 0x10 | code (リプレイと同じ INPUT_* コード)
+  サーバ → クライアント : フレーム = 長さ u16 | レコード...
+    0x01 START   : slot u8
+    0x02 ROWS    : who u8 (0 = 自分, 1 = 相手) | n u8 | (row u8, mask u16) × n
+    0x03 PIECE   : kind u8 | x i8 | y i8 | rotation u8
+    0x04 STATS   : score u32 | lines u16 | level u8 (lines と level は上限で止める)
+    0x05 QUEUE   : next u8 | hold u8 (0xFF = なし)
+    0x06 GARBAGE : 受けている予告ライン数 u8
+    0x07 END     : won u8 | 最終盤面の CRC32 u32
+"""
+
+import argparse
+import asyncio
+import random
+import struct
+import time
+import zlib
+from collections import deque
+
+from tetris_engine import COLS, ROWS, SHAPES, INPUT_HARD_DROP, Game
+from tetris_replay import TAG_INPUT, board_crc
+
+KINDS = tuple(SHAPES)
+KIND_INDEX = {name: i for i, name in enumerate(KINDS)}
+NO_KIND = 0xFF
+
+MSG_START = 0x01
+MSG_ROWS = 0x02
+MSG_PIECE = 0x03
+MSG_STATS = 0x04
+MSG_QUEUE = 0x05
+MSG_GARBAGE = 0x06
+MSG_END = 0x07
+
+FRAME = struct.Struct("<H")
+ROW = struct.Struct("<BH")
+PIECE = struct.Struct("<BbbB")
+STATS = struct.Struct("<IHB")
+END = struct.Struct("<BI")
+
+SERVER_TICK_MS = 16         # サーバの 1 ティック (全試合をまとめて進める間隔)
+MAX_CATCHUP = 8             # 遅れたときに 1 周で追いつくティック数の上限
+INBOX_LIMIT = 64            # 1 クライアントが溜められる未処理の入力
+SEND_BUFFER_LIMIT = 1 << 16 # 送信バッファがこれを超えたクライアントには差分を送らない
+GARBAGE_CAP = 8             # 1 回の固定でせり上がる最大行数
+
+# 消去ライン数 → 送るおじゃまライン数
+ATTACK = {0: 0, 1: 0, 2: 1, 3: 2, 4: 4}
+
+
+def attack_lines(lines: int, tspin: str) -> int:
+    if tspin == "full":
+        return lines * 2
+    return ATTACK[lines]
+
+
+# ──────────────────────────────────────
+#  サーバ
+# ──────────────────────────────────────
+class Player:
+    """1 接続ぶんの状態。sent_* は最後にクライアントへ送った内容。"""
+
+    def __init__(self, writer: asyncio.StreamWriter, seed: int):
+        self.writer = writer
+        self.game = Game(seed)
+        self.match: "Match | None" = None
+        self.slot = 0
+        self.inbox: deque[int] = deque()
+        self.pending: deque[list[int]] = deque()  # [行数, 穴の列] の予告おじゃま
+        self.connected = True
+        self.bytes_sent = 0
+        self.sent_board = [0] * ROWS
+        self.sent_opponent = [0] * ROWS
+        self.sent_piece = None
+        self.sent_stats = None
+        self.sent_queue = None
+        self.sent_garbage = 0
+
+    @property
+    def pending_lines(self) -> int:
+        return sum(count for count, _ in self.pending)
+
+    def send(self, payload: bytes | bytearray):
+        if not self.connected or not payload:
+            return
+        self.writer.write(FRAME.pack(len(payload)) + payload)
+        self.bytes_sent += FRAME.size + len(payload)
+
+    def delta(self, opponent: "Player") -> bytearray:
+        """前回送った状態との差分をレコード列にする。"""
+        game = self.game
+        out = bytearray()
+        _rows_delta(out, 0, game.board, self.sent_board)
+        _rows_delta(out, 1, opponent.game.board, self.sent_opponent)
+
+        piece = game.current
+        state = (KIND_INDEX[piece.name], piece.x, piece.y, piece.rotation)
+        if state != self.sent_piece:
+            self.sent_piece = state
+            out.append(MSG_PIECE)
+            out += PIECE.pack(*state)
+
+        stats = (game.score, game.lines, game.level)
+        if stats != self.sent_stats:
+            self.sent_stats = stats
+            out.append(MSG_STATS)
+            out += STATS.pack(game.score & 0xFFFFFFFF, min(game.lines, 0xFFFF),
+                              min(game.level, 0xFF))
+
+        hold = game.hold_piece
+        queue = (KIND_INDEX[game.next_piece.name], NO_KIND if hold is None else KIND_INDEX[hold.name])
+        if queue != self.sent_queue:
+            self.sent_queue = queue
+            out.append(MSG_QUEUE)
+            out += bytes(queue)
+
+        garbage = min(self.pending_lines, 0xFF)
+        if garbage != self.sent_garbage:
+            self.sent_garbage = garbage
+            out.append(MSG_GARBAGE)
+            out.append(garbage)
+        return out
+
+
+def _rows_delta(out: bytearray, who: int, board: list[int], sent: list[int]):
+    changed = [r for r in range(ROWS) if board[r] != sent[r]]
+    if not changed:
+        return
+    out.append(MSG_ROWS)
+    out.append(who)
+    out.append(len(changed))
+    for r in changed:
+        sent[r] = board[r]
+        out += ROW.pack(r, board[r])
+
+
+class Match:
+    def __init__(self, a: Player, b: Player, seed: int):
+        self.players = (a, b)
+        self.rng = random.Random(seed)      # おじゃまラインの穴の位置
+        self.over = False
+        for slot, player in enumerate(self.players):
+            player.match = self
+            player.slot = slot
+
+    def opponent(self, player: Player) -> Player:
+        return self.players[1 - player.slot]
+
+    def step(self, ticks: int, dt: int):
+        """溜まった入力を処理してから ticks 回 update する。"""
+        for player in self.players:
+            game = player.game
+            inbox = player.inbox
+            while inbox and not game.game_over:
+                self._advance(player, game.handle_input, inbox.popleft())
+            inbox.clear()
+        for _ in range(ticks):
+            for player in self.players:
+                if not player.game.game_over:
+                    self._advance(player, player.game.update, dt)
+
+    def _advance(self, player: Player, action, arg: int):
+        game = player.game
+        pieces = game.pieces
+        action(arg)
+        if game.pieces != pieces:
+            self._on_lock(player)
+
+    def _on_lock(self, player: Player):
+        """固定直後: 消去があれば攻撃 (予告を相殺してから相手へ)、なければ予告をせり上げる。"""
+        game = player.game
+        if game.clearing_rows:
+            attack = attack_lines(len(game.clearing_rows), game.last_tspin)
+            pending = player.pending
+            while attack and pending:
+                cancel = min(attack, pending[0][0])
+                attack -= cancel
+                pending[0][0] -= cancel
+                if not pending[0][0]:
+                    pending.popleft()
+            if attack:
+                self.opponent(player).pending.append([attack, self.rng.randrange(COLS)])
+            return
+
+        budget = GARBAGE_CAP
+        pending = player.pending
+        while pending and budget and not game.game_over:
+            count = min(pending[0][0], budget)
+            game.add_garbage(count, pending[0][1])
+            budget -= count
+            pending[0][0] -= count
+            if not pending[0][0]:
+                pending.popleft()
+
+    def loser(self) -> Player | None:
+        for player in self.players:
+            if player.game.game_over or not player.connected:
+                return player
+        return None
+
+
+class VersusServer:
+    def __init__(self, tick_ms: int = SERVER_TICK_MS, seed: int | None = None):
+        self.tick_ms = tick_ms
+        self.rng = random.Random(seed)
+        self.matches: list[Match] = []
+        self.waiting: Player | None = None
+        self.finished = 0
+        self.ticks = 0
+        self.tick_times: deque[float] = deque(maxlen=10000)   # 1 周の処理時間 (秒)
+        self._server: asyncio.AbstractServer | None = None
+        self._loop_task: asyncio.Task | None = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> int:
+        """待ち受けとティックループを開始し、実際のポート番号を返す。"""
+        self._server = await asyncio.start_server(self._handle_client, host, port)
+        self._loop_task = asyncio.create_task(self._tick_loop())
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._loop_task is not None:
+            self._loop_task.cancel()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        player = Player(writer, self.rng.randrange(1 << 63))
+        self._join(player)
+        inbox = player.inbox
+        try:
+            while True:
+                data = await reader.read(1024)
+                if not data:
+                    break
+                for byte in data:
+                    if byte & 0xF0 == TAG_INPUT and len(inbox) < INBOX_LIMIT:
+                        inbox.append(byte & 0x0F)
+        except ConnectionError:
+            pass
+        finally:
+            player.connected = False
+            if self.waiting is player:
+                self.waiting = None
+            writer.close()
+
+    def _join(self, player: Player):
+        other = self.waiting
+        if other is None or not other.connected:
+            self.waiting = player
+            return
+        self.waiting = None
+        self.matches.append(Match(other, player, self.rng.randrange(1 << 63)))
+        for p in (other, player):
+            p.send(bytes((MSG_START, p.slot)))
+
+    async def _tick_loop(self):
+        loop = asyncio.get_running_loop()
+        last = loop.time()
+        acc = 0.0
+        while True:
+            await asyncio.sleep(self.tick_ms / 1000)
+            now = loop.time()
+            acc += (now - last) * 1000
+            last = now
+            ticks = int(acc // self.tick_ms)
+            if ticks > MAX_CATCHUP:
+                ticks = MAX_CATCHUP
+                acc = 0.0
+            else:
+                acc -= ticks * self.tick_ms
+            if ticks:
+                start = time.perf_counter()
+                self.step(ticks)
+                self.tick_times.append(time.perf_counter() - start)
+
+    def step(self, ticks: int):
+        """全試合を ticks 回ぶん進め、各クライアントへ差分を送る。"""
+        self.ticks += ticks
+        ended = []
+        for match in self.matches:
+            match.step(ticks, self.tick_ms)
+            for player in match.players:
+                if player.writer.transport.get_write_buffer_size() < SEND_BUFFER_LIMIT:
+                    player.send(player.delta(match.opponent(player)))
+            if match.loser() is not None:
+                ended.append(match)
+        for match in ended:
+            self._finish(match)
+
+    def _finish(self, match: Match):
+        match.over = True
+        loser = match.loser()
+        for player in match.players:
+            player.send(player.delta(match.opponent(player)))
+            player.send(bytes((MSG_END,)) + END.pack(player is not loser, board_crc(player.game)))
+            player.connected = False
+            player.writer.close()
+        self.matches.remove(match)
+        self.finished += 1
+
+
+# ──────────────────────────────────────
+#  クライアント
+# ──────────────────────────────────────
+class VersusClient:
+    """サーバから届く差分を自分と相手の盤面に反映していくクライアント。"""
+
+    def __init__(self):
+        self.board = [0] * ROWS
+        self.opponent = [0] * ROWS
+        self.slot = None
+        self.piece = None
+        self.stats = (0, 0, 1)
+        self.queue = None
+        self.garbage = 0
+        self.won = None             # 試合が終わると True / False
+        self.crc_ok = None          # 最終盤面がサーバと一致したか
+        self.frames = 0
+        self.bytes_received = 0
+        self.reader: asyncio.StreamReader | None = None
+        self.writer: asyncio.StreamWriter | None = None
+
+    async def connect(self, host: str, port: int):
+        self.reader, self.writer = await asyncio.open_connection(host, port)
+
+    def send(self, code: int):
+        self.writer.write(bytes((TAG_INPUT | code,)))
+
+    async def run(self):
+        """試合が終わるか切断されるまでフレームを受け取り続ける。"""
+        reader = self.reader
+        try:
+            while self.won is None:
+                size = FRAME.unpack(await reader.readexactly(FRAME.size))[0]
+                self.apply(await reader.readexactly(size))
+                self.bytes_received += FRAME.size + size
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.writer.close()
+
+    def apply(self, data: bytes):
+        self.frames += 1
+        i = 0
+        n = len(data)
+        while i < n:
+            tag = data[i]
+            i += 1
+            if tag == MSG_ROWS:
+                board = self.board if data[i] == 0 else self.opponent
+                count = data[i + 1]
+                i += 2
+                for _ in range(count):
+                    r, mask = ROW.unpack_from(data, i)
+                    board[r] = mask
+                    i += ROW.size
+            elif tag == MSG_PIECE:
+                kind, x, y, rot = PIECE.unpack_from(data, i)
+                self.piece = (KINDS[kind], x, y, rot)
+                i += PIECE.size
+            elif tag == MSG_STATS:
+                self.stats = STATS.unpack_from(data, i)
+                i += STATS.size
+            elif tag == MSG_QUEUE:
+                self.queue = (KINDS[data[i]], None if data[i + 1] == NO_KIND else KINDS[data[i + 1]])
+                i += 2
+            elif tag == MSG_GARBAGE:
+                self.garbage = data[i]
+                i += 1
+            elif tag == MSG_START:
+                self.slot = data[i]
+                i += 1
+            elif tag == MSG_END:
+                won, crc = END.unpack_from(data, i)
+                i += END.size
+                self.won = bool(won)
+                self.crc_ok = crc == zlib.crc32(struct.pack(f"<{ROWS}H", *self.board))
+            else:
+                raise ValueError(f"不正なレコード 0x{tag:02x}")
+
+
+# ──────────────────────────────────────
+#  ループバック負荷試験
+# ──────────────────────────────────────
+# ランダムに押すキー (ハードドロップは別枠で一定間隔)
+RANDOM_INPUTS = (0, 0, 1, 1, 2, 3, 3, 4, 6)
+
+
+async def _random_player(client: VersusClient, rng: random.Random, interval: float):
+    await asyncio.sleep(rng.random() * interval)
+    n = 0
+    while client.won is None and not client.writer.is_closing():
+        n += 1
+        client.send(INPUT_HARD_DROP if n % 6 == 0 else rng.choice(RANDOM_INPUTS))
+        await asyncio.sleep(interval)
+
+
+async def loopback(matches: int, seconds: float, seed: int = 0,
+                   interval: float = 0.05, tick_ms: int = SERVER_TICK_MS) -> dict:
+    """matches 試合ぶんのクライアントを同じプロセスから接続し、seconds 秒動かす。"""
+    server = VersusServer(tick_ms, seed)
+    port = await server.start()
+    rng = random.Random(seed)
+    clients = [VersusClient() for _ in range(matches * 2)]
+    for client in clients:
+        await client.connect("127.0.0.1", port)
+    readers = [asyncio.create_task(c.run()) for c in clients]
+    players = [asyncio.create_task(_random_player(c, random.Random(rng.random()), interval))
+               for c in clients]
+
+    start = time.perf_counter()
+    await asyncio.wait(readers, timeout=seconds)
+    elapsed = time.perf_counter() - start
+    for task in readers + players:
+        task.cancel()
+    await asyncio.gather(*readers, *players, return_exceptions=True)
+    await server.stop()
+
+    ended = [c for c in clients if c.won is not None]
+    times = sorted(t * 1000 for t in server.tick_times)
+    p99 = times[min(len(times) - 1, int(len(times) * 0.99))] if times else 0.0
+    return {
+        "clients": len(clients),
+        "seconds": round(elapsed, 2),
+        "matches_finished": server.finished,
+        "crc_ok": sum(1 for c in ended if c.crc_ok),
+        "crc_mismatch": sum(1 for c in ended if not c.crc_ok),
+        "ticks": server.ticks,
+        "step_mean_ms": round(sum(times) / len(times), 3) if times else 0.0,
+        "step_p99_ms": round(p99, 3),
+        "frames_per_client": round(sum(c.frames for c in clients) / len(clients), 1),
+        "bytes_per_client_per_sec": round(
+            sum(c.bytes_received for c in clients) / len(clients) / elapsed, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="テトリス 対戦サーバ")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sp = sub.add_parser("serve", help="対戦サーバを起動する")
+    sp.add_argument("--host", default="127.0.0.1")
+    sp.add_argument("--port", type=int, default=7878)
+    sp.add_argument("--tick", type=int, default=SERVER_TICK_MS, help="ティック間隔 (ms)")
+    lp = sub.add_parser("loopback", help="ローカルのクライアントを繋いで負荷試験")
+    lp.add_argument("-m", "--matches", type=int, default=100)
+    lp.add_argument("-s", "--seconds", type=float, default=10.0)
+    lp.add_argument("--seed", type=int, default=0)
+    lp.add_argument("--interval", type=float, default=0.05, help="クライアントの入力間隔 (秒)")
+    lp.add_argument("--tick", type=int, default=SERVER_TICK_MS, help="ティック間隔 (ms)")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        asyncio.run(_serve(args.host, args.port, args.tick))
+    else:
+        result = asyncio.run(loopback(args.matches, args.seconds, args.seed,
+                                      args.interval, args.tick))
+        for key, value in result.items():
+            print(f"{key:26} {value}")
+
+
+async def _serve(host: str, port: int, tick_ms: int):
+    server = VersusServer(tick_ms)
+    port = await server.start(host, port)
+    print(f"listening on {host}:{port}")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,743 @@
+"""
+テトリス — パーフェクトクリア / 開幕の組み方ソルバー
+====================================================
+Game の盤面・現在のピース・ネクスト・バッグの残り・ホールドから、
+N ピース以内でパーフェクトクリア (盤面を空にする) する置き方の列、
+または決まった形 (開幕テンプレート) を組む置き方の列を探す。練習モードのヒント用。
+
+探索は深さ優先で、次のもので枝を刈る:
+  - 置換表: (下から h 行をパックした盤面, キュー位置, ホールド, ホールド可否) の
+    行き詰まりを覚えておき、置き方の順序が違うだけの同じ局面を二度調べない。
+    ホールドが空の局面は「今のピースをホールドに入れた局面」と同じ選択肢になるので、
+    そちらの形にそろえて 1 つの項目にする
+  - 対象の行より上にはみ出す置き方は除く (開幕テンプレートなら形の外に出るものも除く)
+  - 埋めるべき空きマスの連結成分がどれも 4 の倍数で、ちょうど 4 マスの成分は
+    その形のピースがまだ使えること
+    (ライン消去をまたいで成分がつながる解は取りこぼすことがあるが、ほとんど影響しない)
+  - 列の偶奇: 空きマスを偶数列と奇数列で数えた差を、使えるピースで埋め合わせられること。
+    J・L は必ず差を 2 つけ、T は縦置きなら 2、I は縦置きなら 4 つける
+    (列はライン消去で変わらないので、これは取りこぼしのない枝刈り)
+  - 残りの空きマスを埋めるのに必要なピース数が、使えるピース数以下であること
+
+置き方は本物の SRS キック (rotate_state) で求める: 出現位置での回転と横移動から
+ハードドロップした着地点を起点に、そこから先の移動・回転・落下で届く位置
+(差し込み・スピン) も幅優先で調べる。探索中は届く位置の集合をビット演算でまとめて
+求め (landing_positions)、入力列は見つかった解の手にだけ付ける (landing_placements)。
+ホールドは Game.hold と同じく 1 ピースに 1 回で、空のホールドに入れたときは
+次のピースが出てくる。
+
+使い方:
+  python tetris_solver.py pc --seed 3               : 開始局面から 4 ライン PC を探す
+  python tetris_solver.py pc --seed 3 --peek        : バッグの先 (乱数のコピー) も使う
+  python tetris_solver.py opener tsd --seed 5       : 名前つきの形を組む
+  python tetris_solver.py bench --seeds 100 --peek  : 解けた割合と所要時間
+"""
+
+import argparse
+import random
+import sys
+import time
+from typing import NamedTuple
+
+from tetris_engine import (
+    COLS, ROWS, FULL_ROW, SHAPES, PIECE_STATES,
+    INPUT_HARD_DROP, INPUT_HOLD,
+    Game, PieceState, Placement,
+)
+
+SPAWN_X = COLS // 2 - 2
+SPAWN_Y = -1
+
+class Opener(NamedTuple):
+    """開幕テンプレート: 上から下への行 ("X" が埋めるマス、盤面の一番下に合わせる) と、
+    組むのに使わずに残しておくピース (ホールドに置いておく)"""
+    rows: tuple[str, ...]
+    keep: str = ""
+
+
+OPENERS: dict[str, Opener] = {
+    # 中央の T-Spin Double の溝。T をホールドに残して組み、最後に T を右上から
+    # 回し入れると 2 行消える (7 種 1 巡 + ホールドで組める並びが 6 割ほど)
+    "tsd": Opener((
+        "X..XX.....",
+        "XX.XX....X",
+        "XXXX...XXX",
+        "XXXXX.XXXX",
+    ), keep="T"),
+}
+
+# 連結成分を広げるときに、隣の行へ回り込まないようにするマスク (pack と同じ並び)
+_NOT_LEFT = sum((FULL_ROW & ~1) << (r * COLS) for r in range(ROWS))    # 0 列目以外
+_NOT_RIGHT = sum((FULL_ROW >> 1) << (r * COLS) for r in range(ROWS))   # 最後の列以外
+_EVEN_COLS = sum(sum(1 << c for c in range(0, COLS, 2)) << (r * COLS) for r in range(ROWS))
+_ODD_COLS = _EVEN_COLS << 1
+
+
+class Step(NamedTuple):
+    """解の 1 手: どのピースを (ホールドしてから) どこに置くか"""
+    name: str
+    hold: bool
+    placement: Placement
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+# ──────────────────────────────────────
+#  キューと盤面
+# ──────────────────────────────────────
+def game_queue(game: Game, count: int = 0, peek: bool = False) -> list[str]:
+    """現在のピース・ネクスト・バッグの残りを出てくる順に返す。
+    peek なら乱数のコピーで先のバッグも count 個まで求める (ゲームの乱数は進めない)。"""
+    queue = [game.current.name, game.next_piece.name, *reversed(game.bag)]
+    if peek and len(queue) < count:
+        rng = random.Random()
+        rng.setstate(game.rng.getstate())
+        while len(queue) < count:
+            bag = list(SHAPES.keys())
+            rng.shuffle(bag)            # Game._refill_bag と同じ順に乱数を使う
+            queue.extend(reversed(bag))
+    return queue[:count] if count else queue
+
+
+def pack(board: list[int], h: int) -> int:
+    """下から h 行を 1 つの整数にする (上の行ほど上位ビット)。"""
+    key = 0
+    for row in board[ROWS - h:]:
+        key = key << COLS | row
+    return key
+
+
+def stack_height(board: list[int]) -> int:
+    for r, row in enumerate(board):
+        if row:
+            return ROWS - r
+    return 0
+
+
+def pc_heights(board: list[int], max_lines: int = 4) -> list[tuple[int, int]]:
+    """パーフェクトクリアできうる高さと、そのとき置くピース数の組 (低い順)。
+    空きマスが 4 の倍数になる高さだけを返す。"""
+    cells = sum(row.bit_count() for row in board)
+    return [(h, (h * COLS - cells) // 4)
+            for h in range(max(stack_height(board), 1), max_lines + 1)
+            if (h * COLS - cells) % 4 == 0]
+
+
+def regions_ok(empty: int, pieces: dict[str, int] | None = None) -> bool:
+    """空きマス (pack と同じ並び) の連結成分がすべて 4 の倍数か。
+    pieces (名前 → 使える数) を渡すと、ちょうど 4 マスの成分を埋めるピースが足りるかも見る。"""
+    needed: dict[str, int] = {}
+    while empty:
+        region = empty & -empty
+        while True:
+            grown = (region | (region << 1) & _NOT_LEFT | (region >> 1) & _NOT_RIGHT
+                     | region << COLS | region >> COLS) & empty
+            if grown == region:
+                break
+            region = grown
+        size = region.bit_count()
+        if size % 4:
+            return False
+        if size == 4 and pieces is not None:
+            name = _REGION_PIECES[_normalize(region)]
+            needed[name] = needed.get(name, 0) + 1
+            if needed[name] > pieces.get(name, 0):
+                return False
+        empty ^= region
+    return True
+
+
+def columns_ok(empty: int, pool: list[str], count: int) -> bool:
+    """空きマスの偶数列と奇数列の差を、pool から count 個 (pool が多ければ 1 つを除いて)
+    置いて埋め合わせられるか。J・L は必ず 2、T は 0 か 2、I は 0 か 4 の差をつける。"""
+    diff = abs((empty & _EVEN_COLS).bit_count() - (empty & _ODD_COLS).bit_count())
+    jl = pool.count("J") + pool.count("L")
+    t = pool.count("T")
+    i = pool.count("I")
+    for drop in set(pool) if len(pool) > count else ("",):
+        a = jl - (drop in ("J", "L"))
+        b = t - (drop == "T")
+        c = i - (drop == "I")
+        if diff <= 2 * (a + b) + 4 * c and (b or (diff - 2 * a) % 4 == 0):
+            return True
+    return False
+
+
+def _lock(board: list[int], state, x: int, y: int) -> tuple[list[int], int]:
+    """ピースを固定してライン消去したボードと消去行数"""
+    new = list(board)
+    for dy, mask in state.masks:
+        new[y + dy] |= mask << x if x >= 0 else mask >> -x
+    kept = [row for row in new if row != FULL_ROW]
+    lines = ROWS - len(kept)
+    if lines:
+        kept[:0] = [0] * lines
+    return kept, lines
+
+
+# ──────────────────────────────────────
+#  置き方の列挙
+# ──────────────────────────────────────
+_X_OFFSET = 4           # ピースの x は -_X_OFFSET 以上 (形の左に空きがある回転)
+
+
+def _piece_bases() -> dict[PieceState, tuple[int, ...]]:
+    """PieceState → x (+ _X_OFFSET) ごとの、ピースの最下行を 0 行目にした盤面整数のマスク。
+    壁からはみ出す x は 0。"""
+    bases = {}
+    for states in PIECE_STATES.values():
+        for state in states:
+            row = []
+            for x in range(-_X_OFFSET, COLS):
+                if x + state.min_dx < 0 or x + state.max_dx >= COLS:
+                    row.append(0)
+                    continue
+                base = 0
+                for dy, mask in state.masks:
+                    base |= (mask << x if x >= 0 else mask >> -x) << (state.max_dy - dy) * COLS
+                row.append(base)
+            bases[state] = tuple(row)
+    return bases
+
+
+_BASES = _piece_bases()
+
+
+def _normalize(cells: int) -> int:
+    """pack と同じ並びのマスの集まりを、一番下の行と一番左の列が 0 になるようにずらす。"""
+    cells >>= ((cells & -cells).bit_length() - 1) // COLS * COLS
+    columns = 0
+    rest = cells
+    while rest:
+        columns |= rest & FULL_ROW
+        rest >>= COLS
+    return cells >> (columns & -columns).bit_length() - 1
+
+
+# 4 マスの形 (_normalize 済み) → それを埋められるピース
+_REGION_PIECES = {_normalize(next(base for base in _BASES[state] if base)): name
+                  for name, states in PIECE_STATES.items() for state in states}
+
+
+def landing_placements(board: list[int], name: str) -> list[Placement]:
+    """name のピースを出現位置から置ける着地状態を列挙する (入力列つき)。
+
+    出現位置で回転・横移動して真下に落とした位置を起点に、左右移動・回転・
+    ソフトドロップで届く状態を幅優先で調べる。盤面の上の方が空いている前提
+    (パーフェクトクリアや開幕を組む局面) で、盤面全体を 1 つの整数にして
+    当たり判定を AND 1 回で行うので search_placements よりずっと速い。
+    回転は rotate_state と同じキックの表を同じ順に試す。"""
+    field = pack(board, ROWS)           # 最下行が下位ビット
+    bases = _BASES
+    last = ROWS - 1
+
+    def fits(state: PieceState, x: int, y: int) -> bool:
+        shift = last - y - state.max_dy
+        return shift >= 0 and -_X_OFFSET <= x < COLS \
+            and bool(bases[state][x + _X_OFFSET]) \
+            and not (field >> shift * COLS) & bases[state][x + _X_OFFSET]
+
+    def rotate(state: PieceState, x: int, y: int, direction: int):
+        entry = state.kicks.get(direction)
+        if entry is None:
+            return None         # O ピース
+        target, offsets = entry
+        for dx, dy in offsets:
+            if fits(target, x + dx, y + dy):
+                return target, x + dx, y + dy
+        return None
+
+    states = PIECE_STATES[name]
+    heights = [0] * COLS
+    covered = 0
+    for r, row in enumerate(board):
+        new = row & ~covered
+        while new:
+            low = new & -new
+            heights[low.bit_length() - 1] = ROWS - r
+            new ^= low
+        covered |= row
+
+    # 出現位置での回転 (上が空いているので回転しても位置はほぼ変わらない)
+    spawn = states[0]
+    starts = [(spawn, SPAWN_X, SPAWN_Y, ())]
+    for turns in ((1,), (1, 1), (-1,)):
+        result = (spawn, SPAWN_X, SPAWN_Y)
+        for direction in turns:
+            result = rotate(*result, direction)
+            if result is None:
+                break
+        else:
+            starts.append((*result, tuple("cw" if d == 1 else "ccw" for d in turns)))
+
+    # (x, y, 回転) → (親, 操作)。起点の入力列は prefixes に持つ
+    parents: dict[tuple[int, int, int], tuple | None] = {}
+    prefixes: dict[tuple[int, int, int], tuple[str, ...]] = {}
+    queue = []
+    for state, x0, y, prefix in starts:
+        for step, action in ((0, ""), (-1, "left"), (1, "right")):
+            x = x0 + step
+            shifts = (action,) if action else ()
+            while fits(state, x, y):
+                drop = min(ROWS - heights[x + dx] - 1 - (y + max_dy)
+                           for dx, max_dy in state.bottoms)
+                if drop < 0:
+                    break               # 出現位置の高さまで積み上がっている
+                key = (x, y + drop, state.rotation)
+                if key not in parents:
+                    parents[key] = None
+                    prefixes[key] = prefix + shifts + (("drop",) if drop else ())
+                    queue.append((state, x, y + drop, key))
+                if not action:
+                    break
+                x += step
+                shifts += (action,)
+
+    # 着地点からの差し込み・スピン
+    resting = []
+    for state, x, y, key in queue:
+        if fits(state, x, y + 1):
+            drop = 2
+            while fits(state, x, y + drop):
+                drop += 1
+            moves = ((state, x, y + drop - 1, "drop"),)
+        else:
+            resting.append(key)
+            moves = []
+            for action, dx in (("left", -1), ("right", 1)):
+                if fits(state, x + dx, y):
+                    moves.append((state, x + dx, y, action))
+            for action, direction in (("cw", 1), ("ccw", -1)):
+                result = rotate(state, x, y, direction)
+                if result is not None:
+                    moves.append((*result, action))
+        for nstate, nx, ny, action in moves:
+            nkey = (nx, ny, nstate.rotation)
+            if nkey not in parents:
+                parents[nkey] = (key, action)
+                queue.append((nstate, nx, ny, nkey))
+
+    found = []
+    for key in resting:
+        path = []
+        node = key
+        while parents[node] is not None:
+            node, action = parents[node]
+            path.append(action)
+        path.reverse()
+        x, y, rotation = key
+        found.append(Placement(x, y, rotation, "", prefixes[node] + tuple(path)))
+    return found
+
+
+# 着地状態だけを求める版 (探索用)。(x, y) ごとに 1 ビットの整数で「ピースが入る位置」の
+# 集合を回転ごとに作り、移動・回転・落下を集合のシフトでまとめて進める。
+# 1 行は _W ビットで、左の _X_OFFSET ビットは壁の外 (常に塞がっている) なので、
+# 横へのシフトで隣の行へ回り込んでもピースが入る位置にはならない。
+_W = COLS + _X_OFFSET
+_Y_MIN = -8                 # 盤面より上は _Y_MIN 行まで (空き)
+_SKY = sum(FULL_ROW << _X_OFFSET << r * _W for r in range(-_Y_MIN))
+# PieceState → セルの位置 (ビット単位) と、回転方向 → (回転先, キックの (dx, dy, ビット単位))
+_CELL_SHIFTS = {state: tuple(dy * _W + dx for dx, dy in state.cells)
+                for states in PIECE_STATES.values() for state in states}
+_KICK_SHIFTS = {state: {direction: (target, tuple((dx, dy, dy * _W + dx) for dx, dy in offsets))
+                        for direction, (target, offsets) in state.kicks.items()}
+                for states in PIECE_STATES.values() for state in states}
+
+
+def _bit(x: int, y: int) -> int:
+    return 1 << (y - _Y_MIN) * _W + x + _X_OFFSET
+
+
+def _fall(bits: int, free: int) -> int:
+    """bits の位置から free の中を真下へ落ちながら通る位置すべて (Kogge-Stone の塗りつぶし)"""
+    step = _W
+    while step < (ROWS - _Y_MIN) * _W:
+        bits |= free & bits << step
+        free &= free << step
+        step <<= 1
+    return bits
+
+
+def landing_positions(board: list[int], name: str) -> list[tuple[int, int, int]]:
+    """landing_placements と同じ着地状態の (x, y, 回転) を、入力列を作らずに求める。
+    動き方 (出現位置での回転と横移動・真下への落下・着地してからの左右移動と回転、
+    浮いたら真下へ落ちる) も同じなので、結果の集合は landing_placements と一致する。"""
+    free = _SKY
+    for r, row in enumerate(board):
+        free |= (~row & FULL_ROW) << _X_OFFSET << (r - _Y_MIN) * _W
+    states = PIECE_STATES[name]
+    fit = []                # 回転 → ピースが入る位置
+    for state in states:
+        bits = -1
+        for shift in _CELL_SHIFTS[state]:
+            bits &= free >> shift
+        fit.append(bits)
+    rest = [bits & ~(bits >> _W) for bits in fit]      # 1 つ下には入らない位置
+
+    # 出現位置での回転と横移動。横に動けるところまで並べてから落とす
+    spawn = states[0]
+    starts = [(spawn, SPAWN_X, SPAWN_Y)]
+    for turns in ((1,), (1, 1), (-1,)):
+        state, x, y = spawn, SPAWN_X, SPAWN_Y
+        for direction in turns:
+            entry = _KICK_SHIFTS[state].get(direction)
+            if entry is None:
+                break           # O ピース
+            target, kicks = entry
+            for dx, dy, _ in kicks:
+                if -_X_OFFSET <= x + dx < COLS and fit[target.rotation] & _bit(x + dx, y + dy):
+                    state, x, y = target, x + dx, y + dy
+                    break
+            else:
+                break
+        else:
+            starts.append((state, x, y))
+    frontier = [0] * 4
+    for state, x0, y in starts:
+        bits = fit[state.rotation]
+        found = 0
+        for step in (-1, 1):
+            x = x0 if step < 0 else x0 + 1
+            while -_X_OFFSET <= x < COLS and bits & _bit(x, y):
+                found |= _bit(x, y)
+                x += step
+        frontier[state.rotation] |= _fall(found, bits) & rest[state.rotation]
+
+    # 着地点からの左右移動と回転。浮いた位置は真下へ落とす
+    reached = list(frontier)
+    while any(frontier):
+        moved = [0] * 4
+        for rotation, bits in enumerate(frontier):
+            if not bits:
+                continue
+            moved[rotation] |= (bits >> 1 | bits << 1) & fit[rotation]
+            for target, kicks in _KICK_SHIFTS[states[rotation]].values():
+                target_fit = fit[target.rotation]
+                pending = bits          # まだどのキックでも回れていない位置
+                for _, _, shift in kicks:
+                    if shift >= 0:
+                        moved[target.rotation] |= pending << shift & target_fit
+                        pending &= ~(target_fit >> shift)
+                    else:
+                        moved[target.rotation] |= pending >> -shift & target_fit
+                        pending &= ~(target_fit << -shift)
+                    if not pending:
+                        break
+        for rotation, bits in enumerate(moved):
+            bits = bits & rest[rotation] | _fall(bits & ~rest[rotation], fit[rotation]) & rest[rotation]
+            frontier[rotation] = bits & ~reached[rotation]
+            reached[rotation] |= bits
+
+    positions = []
+    for rotation, bits in enumerate(reached):
+        while bits:
+            low = bits & -bits
+            index = low.bit_length() - 1
+            positions.append((index % _W - _X_OFFSET, index // _W + _Y_MIN, rotation))
+            bits ^= low
+    return positions
+
+
+# ──────────────────────────────────────
+#  探索
+# ──────────────────────────────────────
+class Solver:
+    """1 回の問い合わせぶんの探索。置換表と置き方のキャッシュを持つ。"""
+
+    def __init__(self, queue: list[str], hold: str | None, can_hold: bool = True,
+                 time_limit: float | None = 1.0):
+        self.queue = queue
+        self.hold = hold
+        self.can_hold = can_hold
+        self.time_limit = time_limit
+        self.nodes = 0
+        self._deadline = None
+        self._dead: set[tuple] = set()
+        self._moves: dict[tuple, list] = {}
+        self._target = 0        # 開幕テンプレート (pack 済み)。0 ならパーフェクトクリア
+        self._keep = ""         # 置かずに残すピース
+
+    def perfect_clear(self, board: list[int], max_lines: int = 4) -> list[Step] | None:
+        """max_lines 行以内のパーフェクトクリアを探す。低い高さから順に試す。"""
+        available = len(self.queue) + (self.hold is not None)
+        self._target = 0
+        self._keep = ""
+        for h, count in pc_heights(board, max_lines):
+            if count > available:
+                continue
+            result = self._run(board, h)
+            if result:
+                return result
+        return None
+
+    def build(self, board: list[int], rows: tuple[str, ...],
+              keep: str = "") -> list[Step] | None:
+        """rows の形 (盤面の一番下に合わせる) を keep のピースを使わずに組む置き方を探す。"""
+        h = len(rows)
+        target = 0
+        for text in rows:
+            mask = sum(1 << c for c, ch in enumerate(text) if ch == "X")
+            if mask == FULL_ROW:
+                raise ValueError("形に埋まった行があると消えてしまいます")
+            target = target << COLS | mask
+        if stack_height(board) > h or pack(board, h) & ~target:
+            return None         # 既に形の外にブロックがある
+        self._target = target
+        self._keep = keep
+        return self._run(board, h)
+
+    def _run(self, board: list[int], h: int) -> list[Step] | None:
+        if self.time_limit is not None:
+            self._deadline = time.perf_counter() + self.time_limit
+        held, i = self.hold, 0
+        if held is None and self.queue:
+            held, i = self.queue[0], 1      # ホールドが空の局面はそろえて扱う (_search)
+        try:
+            steps = self._search(board, h, i, held, self.can_hold, self.hold is None)
+        except SearchTimeout:
+            return None
+        return None if steps is None else _with_paths(board, steps)
+
+    def _search(self, board: list[int], h: int, i: int, held: str | None,
+                can_hold: bool, empty_hold: bool) -> list[Step] | None:
+        """empty_hold なら実際のホールドは空で、held は今のピース (queue[i - 1])。
+        このとき選べるのは「held を置く」か「held をホールドして queue[i] を置く」で、
+        ホールドに held が入っていて今のピースが queue[i] の局面と同じになる。"""
+        key = pack(board, h)
+        target = self._target
+        if target:
+            if key == target:
+                return []
+            empty = target & ~key
+        else:
+            if h == 0:
+                return []
+            empty = ((1 << h * COLS) - 1) & ~key
+
+        state = (key, h, i, held, can_hold)
+        if state in self._dead:
+            return None
+        self.nodes += 1
+        if self._deadline is not None and not self.nodes & 63 \
+                and time.perf_counter() > self._deadline:
+            raise SearchTimeout
+        queue = self.queue
+        count = empty.bit_count() // 4
+        pool = self._pool(i, held, count)
+        if len(pool) < count or not columns_ok(empty, pool, count) \
+                or not regions_ok(empty, {name: pool.count(name) for name in set(pool)}):
+            self._dead.add(state)
+            return None
+
+        # (置くピース, 次のキュー位置, 置いた後のホールド, ホールドしたか, ホールドが空か)
+        options = []
+        following = queue[i] if i < len(queue) else None
+        if empty_hold:
+            options.append((held, min(i + 1, len(queue)), following, False, True))
+            if following is not None:
+                options.append((following, i + 1, held, True, False))
+        elif following is not None:
+            options.append((following, i + 1, held, False, False))
+            if can_hold and held is not None and held != following:
+                options.append((held, i + 1, following, True, False))
+
+        for name, ni, nheld, used_hold, nempty in options:
+            if name is None or name in self._keep:
+                continue
+            for new, nh, (x, y, rotation) in self._placements(board, key, h, name):
+                rest = self._search(new, nh, ni, nheld, True, nempty)
+                if rest is not None:
+                    return [Step(name, used_hold, Placement(x, y, rotation, "", ())), *rest]
+        self._dead.add(state)
+        return None
+
+    def _pool(self, i: int, held: str | None, count: int) -> list[str]:
+        """count 個置くまでに使える可能性のあるピース: ホールドとキューを合わせた先頭
+        count + 1 個 (ホールドで飛ばせるのは 1 つだけなので、その先には届かない)。"""
+        pieces = self.queue[i:]
+        if held is not None:
+            pieces = [held, *pieces]
+        if self._keep:
+            pieces = [name for name in pieces if name not in self._keep]
+        return pieces[:count + 1]
+
+    def _placements(self, board: list[int], key: int, h: int, name: str) -> list:
+        """(置いた後のボード, 対象の行数, (x, y, 回転)) の列。盤面ごとにキャッシュする。"""
+        cache_key = (key, h, name)
+        moves = self._moves.get(cache_key)
+        if moves is not None:
+            return moves
+        top = ROWS - h
+        target = self._target
+        states = PIECE_STATES[name]
+        moves = []
+        seen = set()
+        for x, y, rotation in landing_positions(board, name):
+            state = states[rotation]
+            if y + state.min_dy < top:
+                continue                    # 対象の行より上にはみ出す
+            new, lines = _lock(board, state, x, y)
+            nh = h - lines
+            nkey = pack(new, nh)
+            if target and nkey & ~target:
+                continue                    # 形の外
+            if nkey in seen:
+                continue
+            seen.add(nkey)
+            # 上から塞がれた空きマス (差し込みでしか埋まらない) の数
+            shadow = 0
+            for r in range(1, nh):
+                shadow |= nkey >> r * COLS
+            holes = (shadow & ~nkey).bit_count()
+            moves.append((holes, -y - state.max_dy, new, nh, (x, y, rotation)))
+        # 空きマスを塞がない置き方、その中では低いところを埋める置き方を先に試す
+        moves.sort(key=lambda m: m[:2])
+        moves = [m[2:] for m in moves]
+        self._moves[cache_key] = moves
+        return moves
+
+
+def _with_paths(board: list[int], steps: list[Step]) -> list[Step]:
+    """探索は着地状態だけで進めるので、見つかった解の手にだけ入力列を付ける。"""
+    result = []
+    for step in steps:
+        x, y, rotation = step.placement[:3]
+        placement = next(p for p in landing_placements(board, step.name)
+                         if (p.x, p.y, p.rotation) == (x, y, rotation))
+        result.append(step._replace(placement=placement))
+        board = _lock(board, PIECE_STATES[step.name][rotation], x, y)[0]
+    return result
+
+
+# ──────────────────────────────────────
+#  Game からの問い合わせ
+# ──────────────────────────────────────
+def solve_perfect_clear(game: Game, max_lines: int = 4, pieces: int = 11,
+                        peek: bool = False, time_limit: float | None = 1.0
+                        ) -> list[Step] | None:
+    """game の局面から pieces 個以内で max_lines 行以内のパーフェクトクリアを探す。"""
+    held = game.hold_piece.name if game.hold_piece is not None else None
+    queue = game_queue(game, pieces, peek)
+    solver = Solver(queue[:pieces], held, not game.hold_used, time_limit)
+    return solver.perfect_clear(game.board, max_lines)
+
+
+def solve_opener(game: Game, opener: str | Opener, pieces: int = 11,
+                 peek: bool = False, time_limit: float | None = 1.0
+                 ) -> list[Step] | None:
+    """名前 (OPENERS) か Opener で指定した形を組む置き方を探す。"""
+    if isinstance(opener, str):
+        opener = OPENERS[opener]
+    held = game.hold_piece.name if game.hold_piece is not None else None
+    queue = game_queue(game, pieces, peek)
+    solver = Solver(queue[:pieces], held, not game.hold_used, time_limit)
+    return solver.build(game.board, opener.rows, opener.keep)
+
+
+def play_solution(game: Game, steps: list[Step]) -> bool:
+    """解を Game に実行する (ライン消去の演出は即座に終える)。途中で食い違えば False。"""
+    for step in steps:
+        if game.clearing_rows:
+            game.update(game.clear_timer)
+        if game.game_over:
+            return False
+        if step.hold:
+            game.handle_input(INPUT_HOLD)
+        if game.current.name != step.name or not game.run_path(step.placement.path):
+            return False
+        piece = game.current
+        if (piece.x, piece.rotation) != (step.placement.x, step.placement.rotation):
+            return False
+        game.handle_input(INPUT_HARD_DROP)
+    if game.clearing_rows:
+        game.update(game.clear_timer)
+    return True
+
+
+def _format(steps: list[Step]) -> str:
+    return "\n".join(
+        f"{n + 1:2}. {'hold → ' if s.hold else ''}{s.name} "
+        f"x={s.placement.x} y={s.placement.y} rot={s.placement.rotation}  "
+        f"{' '.join(s.placement.path) or '(そのまま)'}"
+        for n, s in enumerate(steps)
+    )
+
+
+def _check_queue(game: Game, args: argparse.Namespace) -> None:
+    """使えるピースが PC に足りなければ止め、一番高い PC にだけ足りなければ知らせる。"""
+    available = len(game_queue(game, args.pieces, args.peek)) + (game.hold_piece is not None)
+    heights = pc_heights(game.board, args.lines)
+    hint = "" if args.peek else " (--peek で先のバッグも使えます)"
+    if not heights:
+        sys.exit(f"{args.lines} ライン以内の PC はありません (空きマスが 4 の倍数になりません)")
+    if heights[0][1] > available:
+        sys.exit(f"使えるピースが {available} 個しかなく、PC には {heights[0][1]} 個要ります{hint}")
+    h, count = heights[-1]
+    if count > available:
+        print(f"注意: 使えるピースが {available} 個なので、{h} ライン PC ({count} 個) は探せません{hint}",
+              file=sys.stderr)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="テトリス PC / 開幕ソルバー")
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("-n", "--pieces", type=int, default=11, help="使えるピース数の上限")
+    common.add_argument("--lines", type=int, default=4, help="PC の高さの上限")
+    common.add_argument("--peek", action="store_true",
+                        help="バッグの先のピースも使う (乱数のコピーで求める)")
+    common.add_argument("--time-limit", type=float, default=1.0, help="1 回の探索の上限 (秒)")
+
+    sub = parser.add_subparsers(dest="command", required=True)
+    pp = sub.add_parser("pc", parents=[common], help="パーフェクトクリアを探す")
+    pp.add_argument("--seed", type=int, default=0)
+    op = sub.add_parser("opener", parents=[common], help="名前つきの形を組む")
+    op.add_argument("name", choices=sorted(OPENERS))
+    op.add_argument("--seed", type=int, default=0)
+    bp = sub.add_parser("bench", parents=[common], help="開始局面からの PC を多数のシードで解く")
+    bp.add_argument("--seeds", type=int, default=50)
+    args = parser.parse_args()
+
+    if args.command in ("pc", "bench"):
+        _check_queue(Game(args.seed if args.command == "pc" else 0), args)
+    if args.command == "bench":
+        solved = 0
+        times = []
+        for seed in range(args.seeds):
+            game = Game(seed)
+            start = time.perf_counter()
+            steps = solve_perfect_clear(game, args.lines, args.pieces, args.peek,
+                                        args.time_limit)
+            times.append(time.perf_counter() - start)
+            if steps is not None:
+                if not play_solution(game, steps) or any(game.board):
+                    print(f"seed {seed}: 解を実行したが盤面が空にならない", file=sys.stderr)
+                    sys.exit(1)
+                solved += 1
+        times.sort()
+        print(f"solved {solved}/{args.seeds}  "
+              f"median {times[len(times) // 2] * 1000:.0f} ms  max {times[-1] * 1000:.0f} ms")
+        return
+
+    game = Game(args.seed)
+    print("キュー:", " ".join(game_queue(game, args.pieces, args.peek)))
+    start = time.perf_counter()
+    if args.command == "pc":
+        steps = solve_perfect_clear(game, args.lines, args.pieces, args.peek, args.time_limit)
+    else:
+        steps = solve_opener(game, args.name, args.pieces, args.peek, args.time_limit)
+    elapsed = time.perf_counter() - start
+    if steps is None:
+        print(f"見つかりませんでした ({elapsed * 1000:.0f} ms)")
+        sys.exit(1)
+    print(_format(steps))
+    ok = play_solution(game, steps)
+    print(f"{len(steps)} 手 ({elapsed * 1000:.0f} ms)  検証: {'OK' if ok else 'NG'}")
+    for row in game.board[ROWS - 6:]:
+        print("".join("X" if row >> c & 1 else "." for c in range(COLS)))
+
+
+if __name__ == "__main__":
+    main()
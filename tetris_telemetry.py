@@ -0,0 +1,193 @@
+"""
+テトリス — プレイ計測 (テレメトリ)
+==================================
+Game.telemetry に TelemetryWriter を付けると、ピースの出現・固定・ライン消去・
+ホールド・レベルアップ・ゲームオーバーをイベントとして受け取り、
+時刻と盤面の指標 (最大高さ・高さの合計・穴の数) と一緒に記録する。
+
+イベントは事前確保したリングバッファ (固定長のリスト) にタプルを置くだけで、
+ファイルへの書き出しはバックグラウンドのスレッドが行うのでゲームループは待たない。
+拡張子が .ndjson / .jsonl なら 1 行 1 イベントの JSON、それ以外はバイナリで書く。
+
+使い方:
+  python tetris.py --telemetry play.tlog
+  python tetris_telemetry.py dump play.tlog        : バイナリを NDJSON で表示
+
+バイナリ形式 (リトルエンディアン):
+  ヘッダ   : b"TTEL" | version u8
+  イベント : RECORD (下の FIELDS の順、32 バイト固定)
+"""
+
+import argparse
+import json
+import struct
+import sys
+import threading
+import time
+
+from tetris_engine import (
+    SHAPES, SHAPE_INDEX, Game,
+    EVENT_SPAWN, EVENT_LOCK, EVENT_CLEAR, EVENT_HOLD, EVENT_LEVEL, EVENT_GAME_OVER,
+)
+
+MAGIC = b"TTEL"
+VERSION = 2              # 2: level を u8 → u16 に広げた
+
+EVENT_NAMES = ("spawn", "lock", "clear", "hold", "level", "game_over")
+
+# イベントごとの引数 a, b, c の意味 (JSON でのキー名)
+EVENT_ARGS = {
+    EVENT_SPAWN: (),
+    EVENT_LOCK: ("x", "y", "rotation"),
+    EVENT_CLEAR: ("count",),
+    EVENT_HOLD: ("held",),
+    EVENT_LEVEL: (),
+    EVENT_GAME_OVER: (),
+}
+
+KINDS = tuple(SHAPES)
+TSPIN_CODES = {"": 0, "mini": 1, "full": 2}
+TSPIN_NAMES = ("", "mini", "full")
+
+# リングバッファ 1 スロット (タプル) の並び
+FIELDS = ("t_ns", "event", "piece", "tspin", "a", "b", "c", "level",
+          "pieces", "score", "lines", "max_height", "holes", "total_height")
+RECORD = struct.Struct("<qBBBbbbHIIIBBH")
+
+
+def board_metrics(game: Game) -> tuple[int, int, int]:
+    """(最大の高さ, 高さの合計, 穴の数)。穴 = 各列の地表より下の空きマス。"""
+    heights = game.column_heights
+    total = sum(heights)
+    filled = sum(row.bit_count() for row in game.board if row)
+    return max(heights), total, total - filled
+
+
+class TelemetryWriter:
+    """Game.telemetry として emit() を受け取り、別スレッドでファイルに書き出す。
+    書き出しが追いつかずリングが一周した分は捨てて dropped に数える。
+    書き出しスレッドで起きた例外は error に入れて書き出しをやめ、close() で送出する。"""
+
+    def __init__(self, path: str, game: Game, capacity: int = 4096,
+                 flush_interval: float = 0.5):
+        self.path = path
+        self.binary = not path.endswith((".ndjson", ".jsonl"))
+        self.file = open(path, "wb" if self.binary else "w")
+        if self.binary:
+            self.file.write(MAGIC + bytes((VERSION,)))
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self.error: BaseException | None = None
+        self._ring: list[tuple | None] = [None] * capacity
+        self._head = 0          # 書き込んだイベントの総数 (ゲームループ側だけが進める)
+        self._tail = 0          # 書き出したイベントの総数 (書き出しスレッドだけが進める)
+        self._t0 = time.perf_counter_ns()
+        self._wake = threading.Event()
+        self._stop = False
+        self._thread = threading.Thread(target=self._run, name="telemetry", daemon=True)
+        self._thread.start()
+        game.telemetry = self
+        self.emit(game, EVENT_SPAWN)      # 記録開始時点のピース
+
+    # ── ゲームループ側 ──
+    def emit(self, game: Game, event: int, a: int = 0, b: int = 0, c: int = 0,
+             tspin: str = ""):
+        max_height, total, holes = board_metrics(game)
+        head = self._head
+        self._ring[head % self.capacity] = (
+            time.perf_counter_ns() - self._t0, event, SHAPE_INDEX[game.current.name],
+            TSPIN_CODES[tspin], a, b, c, game.level,
+            game.pieces, game.score, game.lines, max_height, holes, total,
+        )
+        self._head = head + 1
+        if self._head - self._tail >= self.capacity // 2:
+            self._wake.set()
+
+    # ── 書き出しスレッド ──
+    def _run(self):
+        try:
+            while not self._stop:
+                self._wake.wait(self.flush_interval)
+                self._wake.clear()
+                self._drain()
+            self._drain()
+        except Exception as exc:
+            self.error = exc
+            print(f"テレメトリの書き出しを止めました: {exc!r}", file=sys.stderr)
+
+    def _drain(self):
+        head = self._head
+        tail = self._tail
+        if head - tail > self.capacity:
+            self.dropped += head - tail - self.capacity
+            tail = head - self.capacity
+        if tail == head:
+            return
+        ring = self._ring
+        out = bytearray() if self.binary else []
+        for i in range(tail, head):
+            values = ring[i % self.capacity]
+            if self.binary:
+                out += RECORD.pack(*values)
+            else:
+                out.append(json.dumps(to_dict(values), separators=(",", ":")))
+        if self.binary:
+            self.file.write(out)
+        else:
+            self.file.write("\n".join(out) + "\n")
+        self.file.flush()
+        self._tail = head
+
+    def close(self, game: Game | None = None):
+        """残りを書き出してスレッドとファイルを閉じる。書き出しに失敗していればその例外を送出する。"""
+        self._stop = True
+        self._wake.set()
+        self._thread.join()
+        self.file.close()
+        if game is not None and game.telemetry is self:
+            game.telemetry = None
+        if self.error is not None:
+            raise RuntimeError(f"テレメトリの書き出しに失敗しました: {self.error}") from self.error
+
+
+def to_dict(values) -> dict:
+    """リングバッファ / バイナリの 1 レコード → JSON 用の dict"""
+    record = dict(zip(FIELDS, values))
+    event = record.pop("event")
+    a, b, c = record.pop("a"), record.pop("b"), record.pop("c")
+    result = {"t": round(record.pop("t_ns") / 1e9, 6), "event": EVENT_NAMES[event]}
+    result["piece"] = KINDS[record.pop("piece")]
+    tspin = record.pop("tspin")
+    for key, value in zip(EVENT_ARGS[event], (a, b, c)):
+        result[key] = KINDS[value] if key == "held" else value
+    if event in (EVENT_LOCK, EVENT_CLEAR):
+        result["tspin"] = TSPIN_NAMES[tspin]
+    result.update(record)
+    return result
+
+
+def read_log(path: str):
+    """バイナリログのイベントを dict で順に返す。"""
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:4] != MAGIC or data[4] != VERSION:
+        raise ValueError(f"テレメトリの形式が違います: {path}")
+    for values in RECORD.iter_unpack(data[5:5 + (len(data) - 5) // RECORD.size * RECORD.size]):
+        yield to_dict(values)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="テトリス テレメトリ")
+    sub = parser.add_subparsers(dest="command", required=True)
+    dp = sub.add_parser("dump", help="バイナリログを NDJSON で表示する")
+    dp.add_argument("file")
+    args = parser.parse_args()
+
+    out = sys.stdout
+    for record in read_log(args.file):
+        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    main()
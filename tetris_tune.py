@@ -0,0 +1,352 @@
+"""
+テトリス — ボットの対戦評価と重みの調整
+======================================
+シード固定のヘッドレス対局をプロセスプールで並列に回し、
+評価関数の重み (tetris_bot.DEFAULT_WEIGHTS) の組を比べたり、進化的に調整したりする。
+同じ世代・同じ比較の中ではすべての重みを同じシードの組で対局させるので、
+ピース順の運による差が結果に混ざらない。
+
+使い方:
+  python tetris_tune.py compare default best.json --games 200 -j 8
+  python tetris_tune.py compare a.json b.json --results runs.jsonl   : 中断しても続きから
+  python tetris_tune.py evolve --generations 40 -j 8 --checkpoint tune.json
+  python tetris_tune.py evolve --resume tune.json --generations 80    : 続きから
+
+evolve は対角共分散の進化戦略 (CMA-ES を簡略化したもの): 平均と次元ごとの
+ステップ幅から候補を作り、上位の候補の重み付き平均へ平均を動かし、
+上位の候補のばらつきでステップ幅を更新する。
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+from multiprocessing import Pool
+from typing import NamedTuple
+
+from tetris_bot import DEFAULT_WEIGHTS, Bot
+from tetris_engine import Game
+
+WEIGHT_KEYS = tuple(DEFAULT_WEIGHTS)
+
+
+# ──────────────────────────────────────
+#  1 局の対局 (ワーカープロセスで実行)
+# ──────────────────────────────────────
+class GameResult(NamedTuple):
+    key: str                # どの重みの対局か
+    seed: int
+    score: int
+    lines: int
+    pieces: int             # 置いたピース数 (= 生存時間)
+    tspins: int             # T-Spin (mini を含む) で固定した回数
+    topped_out: bool
+    seconds: float
+
+
+def play_game(task: tuple) -> GameResult:
+    """(key, 重み, シード, 最大ピース数, Bot の引数) の対局を 1 つ行う。"""
+    key, weights, seed, pieces, options = task
+    bot = Bot(weights, **options)
+    game = Game(seed)
+    placed = tspins = 0
+    start = time.perf_counter()
+    while placed < pieces and not game.game_over:
+        if game.clearing_rows:
+            game.update(game.clear_timer)   # 消去アニメーションを即座に終える
+            continue
+        if not bot.play(game):
+            break
+        placed += 1
+        if game.last_tspin:
+            tspins += 1
+    return GameResult(
+        key, seed, game.score, game.lines, placed, tspins,
+        game.game_over or placed < pieces, round(time.perf_counter() - start, 3),
+    )
+
+
+def run_games(tasks: list[tuple], jobs: int, on_result=None) -> list[GameResult]:
+    """tasks をプロセスプールで実行する (jobs <= 1 なら直列)。"""
+    results = []
+    if jobs > 1:
+        with Pool(jobs) as pool:
+            for result in pool.imap_unordered(play_game, tasks, chunksize=1):
+                results.append(result)
+                if on_result is not None:
+                    on_result(result)
+    else:
+        for task in tasks:
+            result = play_game(task)
+            results.append(result)
+            if on_result is not None:
+                on_result(result)
+    return results
+
+
+def summarize(results: list[GameResult]) -> dict[str, float]:
+    """同じ重みの対局結果の平均など"""
+    n = len(results)
+    if not n:
+        return {"games": 0}
+    scores = sorted(r.score for r in results)
+    return {
+        "games": n,
+        "score_mean": round(sum(scores) / n, 1),
+        "score_median": scores[n // 2],
+        "lines_mean": round(sum(r.lines for r in results) / n, 2),
+        "tspins_mean": round(sum(r.tspins for r in results) / n, 2),
+        "pieces_mean": round(sum(r.pieces for r in results) / n, 1),
+        "topout_rate": round(sum(r.topped_out for r in results) / n, 3),
+        "seconds": round(sum(r.seconds for r in results), 2),
+    }
+
+
+def bot_options(args: argparse.Namespace) -> dict:
+    # 時間制限があると結果がマシンの速さに左右されるので、調整では既定で無制限
+    return {
+        "beam_width": args.beam,
+        "depth": args.depth,
+        "spins": args.spins,
+        "time_budget_ms": args.budget or None,
+    }
+
+
+# ──────────────────────────────────────
+#  重みの比較
+# ──────────────────────────────────────
+def load_weights(spec: str) -> dict[str, float]:
+    """"default" または JSON ファイル (重みの dict か、evolve のチェックポイント)"""
+    if spec == "default":
+        return dict(DEFAULT_WEIGHTS)
+    with open(spec) as f:
+        data = json.load(f)
+    if "best" in data:
+        data = data["best"]["weights"]
+    return {k: float(v) for k, v in data.items() if k in DEFAULT_WEIGHTS}
+
+
+def compare(args: argparse.Namespace):
+    entries = {spec: load_weights(spec) for spec in args.weights}
+    seeds = [args.seed + i for i in range(args.games)]
+    options = bot_options(args)
+
+    # 結果ファイルがあれば、済んでいる (重み, シード) は飛ばす
+    done: dict[str, list[GameResult]] = {spec: [] for spec in entries}
+    if args.results and os.path.exists(args.results):
+        with open(args.results) as f:
+            for line in f:
+                if line.strip():
+                    result = GameResult(**json.loads(line))
+                    if result.key in done and result.seed in seeds:
+                        done[result.key].append(result)
+    finished = {(r.key, r.seed) for results in done.values() for r in results}
+    tasks = [
+        (spec, weights, seed, args.pieces, options)
+        for spec, weights in entries.items()
+        for seed in seeds
+        if (spec, seed) not in finished
+    ]
+    print(f"{len(tasks)} 局を実行 (済み {len(finished)} 局)", file=sys.stderr)
+
+    out = open(args.results, "a") if args.results else None
+
+    def record(result: GameResult):
+        done[result.key].append(result)
+        if out is not None:
+            out.write(json.dumps(result._asdict()) + "\n")
+            out.flush()
+
+    try:
+        run_games(tasks, args.jobs, record)
+    finally:
+        if out is not None:
+            out.close()
+
+    rows = sorted(
+        ((spec, summarize(results)) for spec, results in done.items()),
+        key=lambda item: item[1].get(f"{args.fitness}_mean", 0), reverse=True,
+    )
+    for spec, summary in rows:
+        print(f"{spec:24} " + "  ".join(f"{k}={v}" for k, v in summary.items()))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(dict(rows), f, indent=2)
+
+
+# ──────────────────────────────────────
+#  進化戦略による調整
+# ──────────────────────────────────────
+class EvolutionState:
+    """evolve の途中経過。チェックポイントとして JSON に保存して再開できる。"""
+
+    def __init__(self, mean: list[float], sigma: list[float], seed: int):
+        self.generation = 0
+        self.mean = mean
+        self.sigma = sigma
+        self.rng = random.Random(seed)
+        self.best: dict | None = None           # {"weights", "fitness", "generation"}
+        self.history: list[dict] = []
+
+    def to_json(self) -> dict:
+        version, internal, gauss = self.rng.getstate()
+        return {
+            "generation": self.generation,
+            "mean": dict(zip(WEIGHT_KEYS, self.mean)),
+            "sigma": dict(zip(WEIGHT_KEYS, self.sigma)),
+            "rng": [version, list(internal), gauss],
+            "best": self.best,
+            "history": self.history,
+        }
+
+    @classmethod
+    def from_json(cls, data: dict) -> "EvolutionState":
+        state = cls([data["mean"][k] for k in WEIGHT_KEYS],
+                    [data["sigma"][k] for k in WEIGHT_KEYS], 0)
+        version, internal, gauss = data["rng"]
+        state.rng.setstate((version, tuple(internal), gauss))
+        state.generation = data["generation"]
+        state.best = data["best"]
+        state.history = data["history"]
+        return state
+
+    def save(self, path: str):
+        """書きかけのファイルが残らないよう、一時ファイルに書いてから置き換える。"""
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.to_json(), f, indent=2)
+        os.replace(tmp, path)
+
+
+def recombination_weights(mu: int) -> list[float]:
+    """上位 mu 個の対数的な重み (合計 1)"""
+    raw = [math.log(mu + 0.5) - math.log(i + 1) for i in range(mu)]
+    total = sum(raw)
+    return [w / total for w in raw]
+
+
+def evolve(args: argparse.Namespace):
+    if args.resume:
+        with open(args.resume) as f:
+            state = EvolutionState.from_json(json.load(f))
+        checkpoint = args.checkpoint or args.resume
+        print(f"世代 {state.generation} から再開", file=sys.stderr)
+    else:
+        mean = [DEFAULT_WEIGHTS[k] for k in WEIGHT_KEYS]
+        sigma = [max(abs(w) * args.step, 0.01) for w in mean]
+        state = EvolutionState(mean, sigma, args.seed)
+        checkpoint = args.checkpoint
+
+    options = bot_options(args)
+    lam = args.population
+    mu = max(1, lam // 2)
+    rw = recombination_weights(mu)
+    smoothing = args.smoothing
+
+    while state.generation < args.generations:
+        rng = state.rng
+        # 候補: 平均そのもの + 正規分布でずらしたもの
+        candidates = [list(state.mean)]
+        while len(candidates) < lam:
+            candidates.append([m + s * rng.gauss(0, 1) for m, s in zip(state.mean, state.sigma)])
+        seeds = [rng.randrange(1 << 31) for _ in range(args.games)]
+
+        tasks = [
+            (str(i), dict(zip(WEIGHT_KEYS, x)), seed, args.pieces, options)
+            for i, x in enumerate(candidates)
+            for seed in seeds
+        ]
+        start = time.perf_counter()
+        results = run_games(tasks, args.jobs)
+        by_key: dict[str, list[GameResult]] = {}
+        for result in results:
+            by_key.setdefault(result.key, []).append(result)
+        summaries = [summarize(by_key[str(i)]) for i in range(len(candidates))]
+        fitness = [s[f"{args.fitness}_mean"] for s in summaries]
+
+        order = sorted(range(len(candidates)), key=lambda i: fitness[i], reverse=True)
+        elite = order[:mu]
+        old_mean = state.mean
+        state.mean = [
+            sum(w * candidates[i][d] for w, i in zip(rw, elite))
+            for d in range(len(WEIGHT_KEYS))
+        ]
+        # ステップ幅: 上位候補の (旧平均からの) ばらつきへ少しずつ寄せる
+        state.sigma = [
+            max(1e-3, (1 - smoothing) * s + smoothing * math.sqrt(
+                sum(w * (candidates[i][d] - old_mean[d]) ** 2 for w, i in zip(rw, elite))
+            ))
+            for d, s in enumerate(state.sigma)
+        ]
+
+        top = order[0]
+        state.generation += 1
+        if state.best is None or fitness[top] > state.best["fitness"]:
+            state.best = {
+                "weights": dict(zip(WEIGHT_KEYS, candidates[top])),
+                "fitness": fitness[top],
+                "generation": state.generation,
+                "summary": summaries[top],
+            }
+        state.history.append({
+            "generation": state.generation,
+            "best": fitness[top],
+            "mean_candidate": fitness[0],
+            "seconds": round(time.perf_counter() - start, 2),
+        })
+        print(f"世代 {state.generation:3}  最良 {fitness[top]:10.1f}  "
+              f"平均の重み {fitness[0]:10.1f}  ({time.perf_counter() - start:.1f} 秒)",
+              file=sys.stderr)
+        if checkpoint:
+            state.save(checkpoint)
+
+    if state.best is not None:
+        print(json.dumps(state.best["weights"], indent=2))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="テトリス ボットの対戦評価と重みの調整")
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1,
+                        help="並列プロセス数")
+    common.add_argument("-n", "--pieces", type=int, default=500,
+                        help="1 局の最大ピース数")
+    common.add_argument("--games", type=int, default=20, help="重み 1 組あたりの局数")
+    common.add_argument("--seed", type=int, default=0)
+    common.add_argument("--fitness", choices=("score", "lines", "pieces"), default="score",
+                        help="比較に使う指標 (平均)")
+    common.add_argument("--beam", type=int, default=6)
+    common.add_argument("--depth", type=int, default=1)
+    common.add_argument("--spins", action="store_true", help="1 手目でスピンも探す")
+    common.add_argument("--budget", type=float, default=0,
+                        help="1 手あたりの思考時間 (ms, 0 で無制限)")
+
+    sub = parser.add_subparsers(dest="command", required=True)
+    cp = sub.add_parser("compare", parents=[common], help="重みの組を同じシードで比べる")
+    cp.add_argument("weights", nargs="+", help='"default" または重みの JSON ファイル')
+    cp.add_argument("--results", default=None,
+                    help="1 局ごとの結果を追記する JSONL (あれば済んだ局を飛ばす)")
+    cp.add_argument("-o", "--output", default=None, help="集計結果の JSON の保存先")
+
+    ep = sub.add_parser("evolve", parents=[common], help="進化戦略で重みを調整する")
+    ep.add_argument("--generations", type=int, default=30)
+    ep.add_argument("--population", type=int, default=12, help="1 世代の候補数")
+    ep.add_argument("--step", type=float, default=0.3,
+                    help="初期ステップ幅 (既定の重みの大きさに対する割合)")
+    ep.add_argument("--smoothing", type=float, default=0.3,
+                    help="ステップ幅を上位候補のばらつきへ寄せる割合")
+    ep.add_argument("--checkpoint", default=None, help="世代ごとに状態を保存する JSON")
+    ep.add_argument("--resume", default=None, help="保存した状態から再開する")
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        compare(args)
+    else:
+        evolve(args)
+
+
+if __name__ == "__main__":
+    main()